@@ -0,0 +1,218 @@
+"""
+Cache in-memory dei dati di progetto (DataFrame delle recensioni + oggetti derivati).
+- Budget massimo in byte con eviction LRU (l'entry appena caricata non viene mai scartata).
+- Rivalidazione su (path, mtime, size) del file invece di un TTL cieco: se il file
+  non è cambiato non si ricarica; il controllo (una stat) avviene al massimo ogni
+  `revalidate_sec` secondi per progetto.
+- Caricamenti concorrenti dello stesso progetto deduplicati: il file si legge una volta sola.
+- Oggetti derivati (store, indici, statistiche) legati all'entry: spariscono con lei.
+- Valori e derivati che crescono dopo la costruzione (colonne serializzate e indice di
+  testo di ReviewStore, varianti di ProjectDocument) espongono `on_resize`: la cache vi
+  collega una callback che rimisura quella parte dell'entry e applica di nuovo il budget.
+- Contatori hit/miss/reload/eviction esposti da stats().
+"""
+from __future__ import annotations
+
+import functools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def _sizeof(value: Any) -> int:
+    # pandas non si importa qui: se non è ancora caricato, value non può essere un DataFrame
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    # array numpy e oggetti derivati che espongono una stima (es. ReviewStore.nbytes)
+    return int(getattr(value, "nbytes", 0) or 0)
+
+
+def _signature(path: Path) -> Tuple[str, int, int]:
+    st = path.stat()
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    signature: Tuple[str, int, int]
+    value_nbytes: int
+    checked_at: float
+    derived: Dict[str, Any] = field(default_factory=dict)
+    derived_nbytes: Dict[str, int] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def nbytes(self) -> int:
+        return self.value_nbytes + sum(self.derived_nbytes.values())
+
+
+class ProjectCache:
+    def __init__(
+        self,
+        resolve: Callable[[str], Path],
+        load: Callable[[Path], Any],
+        max_bytes: int,
+        revalidate_sec: float = 2.0,
+        sizeof: Callable[[Any], int] = _sizeof,
+    ):
+        """
+        resolve(key) → path del file da caricare (può sollevare, es. HTTPException 404);
+        load(path) → valore da tenere in cache.
+        """
+        self._resolve = resolve
+        self._load = load
+        self._sizeof = sizeof
+        self.max_bytes = max_bytes
+        self.revalidate_sec = revalidate_sec
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._counters = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0, "revalidations": 0, "load_errors": 0}
+
+    # ---------------- accesso ----------------
+    def _fresh_entry(self, key: str) -> Optional[_Entry]:
+        """Entry valida (LRU aggiornata) o None se assente/cambiata su disco."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now - entry.checked_at >= self.revalidate_sec:
+            self._count("revalidations")
+            try:
+                sig = _signature(self._resolve(key))
+            except Exception:
+                sig = None
+            if sig != entry.signature:
+                return None
+            entry.checked_at = now
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                return None
+            self._entries.move_to_end(key)
+        return entry
+
+    def _entry(self, key: str) -> _Entry:
+        entry = self._fresh_entry(key)
+        if entry is not None:
+            self._count("hits")
+            return entry
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            # un'altra richiesta potrebbe averlo appena caricato
+            entry = self._fresh_entry(key)
+            if entry is not None:
+                self._count("hits")
+                return entry
+            with self._lock:
+                stale = key in self._entries
+            self._count("reloads" if stale else "misses")
+            try:
+                path = self._resolve(key)
+                sig = _signature(path)
+                value = self._load(path)
+            except Exception:
+                self._count("load_errors")
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            entry = _Entry(value=value, signature=sig, value_nbytes=self._sizeof(value), checked_at=time.monotonic())
+            self._watch(key, entry, None, value)
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._evict(keep=key)
+        return entry
+
+    def get(self, key: str) -> Any:
+        return self._entry(key).value
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Valore già in cache e valido, o None senza caricare (per servire dal loop)."""
+        entry = self._fresh_entry(key)
+        if entry is None:
+            return None
+        self._count("hits")
+        return entry.value
+
+    def version(self, key: str) -> Tuple[str, int, int]:
+        """(path, mtime, size) del file corrente del progetto, senza caricarlo."""
+        return _signature(self._resolve(key))
+
+    def derived(self, key: str, name: str, factory: Callable[[Any], Any]) -> Any:
+        """Oggetto derivato dal valore in cache, costruito una volta per versione del file."""
+        entry = self._entry(key)
+        obj = entry.derived.get(name)
+        if obj is None:
+            with entry.lock:
+                obj = entry.derived.get(name)
+                if obj is None:
+                    obj = factory(entry.value)
+                    entry.derived[name] = obj
+                    self._watch(key, entry, name, obj)
+                    self._resized(key, entry, name)
+        return obj
+
+    def _watch(self, key: str, entry: _Entry, name: Optional[str], obj: Any) -> None:
+        if hasattr(obj, "on_resize"):
+            obj.on_resize = functools.partial(self._resized, key, entry, name)
+
+    def _resized(self, key: str, entry: _Entry, name: Optional[str]) -> None:
+        """Rimisura il valore (name=None) o un derivato dell'entry e rientra nel budget."""
+        nbytes = self._sizeof(entry.value if name is None else entry.derived[name])
+        with self._lock:
+            if name is None:
+                entry.value_nbytes = nbytes
+            else:
+                entry.derived_nbytes[name] = nbytes
+            if self._entries.get(key) is entry:
+                self._evict(keep=key)
+
+    # ---------------- gestione ----------------
+    def _evict(self, keep: str) -> None:
+        total = sum(e.nbytes for e in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            total -= self._entries.pop(oldest).nbytes
+            self._counters["evictions"] += 1
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"] + self._counters["reloads"]
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "bytes": sum(e.nbytes for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "projects": {
+                    k: {"bytes": e.nbytes, "file": Path(e.signature[0]).name, "derived": sorted(e.derived)}
+                    for k, e in self._entries.items()
+                },
+            }
+
+
+def max_bytes_from_env(default_mb: int = 512) -> int:
+    return int(float(os.getenv("PROJECT_CACHE_MAX_MB", str(default_mb))) * 1024 * 1024)
@@ -0,0 +1,39 @@
+"""
+Offload del lavoro bloccante (pandas/numpy, parsing file) fuori dall'event loop.
+- Pool di thread limitato da un CapacityLimiter dedicato (non quello di default di
+  Starlette, condiviso con le route sync): API_WORKER_THREADS (default 4).
+- API_WORKER_THREADS=0 esegue inline sul loop (comportamento precedente, utile per confronti).
+NumPy e pandas rilasciano il GIL nelle operazioni vettoriali, quindi i thread bastano
+a non bloccare le altre richieste del worker.
+"""
+from __future__ import annotations
+
+import functools
+import os
+from typing import Any, Callable, Optional, TypeVar
+
+import anyio
+import anyio.to_thread
+
+T = TypeVar("T")
+
+_LIMITER: Optional[anyio.CapacityLimiter] = None
+
+
+def worker_threads() -> int:
+    return max(0, int(os.getenv("API_WORKER_THREADS", "4")))
+
+
+def _limiter() -> anyio.CapacityLimiter:
+    # creato pigramente: il CapacityLimiter va istanziato dentro un event loop
+    global _LIMITER
+    if _LIMITER is None:
+        _LIMITER = anyio.CapacityLimiter(max(1, worker_threads()))
+    return _LIMITER
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Esegue fn(*args, **kwargs) nel pool limitato e ne attende il risultato."""
+    if worker_threads() == 0:
+        return fn(*args, **kwargs)
+    return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=_limiter())
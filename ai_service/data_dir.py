@@ -0,0 +1,20 @@
+"""
+Percorso dati dell'API (recensioni e documenti di progetto).
+Priorità:
+1) Variabile d'ambiente INSIGHTS_DATA_DIR (se impostata)
+2) Cartella pacchettizzata nel bundle: ai_service/_data
+Modulo senza dipendenze pesanti: lo usano sia i router con pandas sia quelli senza.
+"""
+import os
+from pathlib import Path
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent / "_data"  # ai_service/_data
+
+
+def resolve_data_dir() -> Path:
+    env_dir = os.environ.get("INSIGHTS_DATA_DIR")
+    if env_dir:
+        p = Path(env_dir)
+        if p.exists():
+            return p
+    return DEFAULT_DATA_DIR
@@ -0,0 +1,76 @@
+"""
+Export in streaming delle recensioni filtrate (/reviews/export).
+Le righe escono a blocchi dall'ordinamento pre-calcolato dello store e vengono
+serializzate blocco per blocco, quindi la memoria non cresce con la dimensione
+dell'export (a parte gli indici delle righe, 8 byte ciascuno):
+- NDJSON: una recensione per riga (orjson), stessi campi di /reviews;
+- Arrow IPC stream: un record batch per blocco (richiede pyarrow);
+- gzip opzionale, compresso al volo.
+"""
+from __future__ import annotations
+
+import io
+import zlib
+from typing import Iterable, Iterator
+
+import numpy as np
+import orjson
+
+from .store import REVIEW_FIELDS, ReviewStore
+
+# pyarrow è opzionale: senza, è disponibile solo l'export NDJSON
+try:
+    import pyarrow as pa
+except Exception:
+    pa = None
+
+EXPORT_CHUNK_ROWS = 5000
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+_NUMERIC_FIELDS = {"sentiment", "rating"}
+
+
+def ndjson_chunks(store: ReviewStore, chunks: Iterable[np.ndarray], project_id: str) -> Iterator[bytes]:
+    for idx in chunks:
+        records = store.records(idx, project_id)
+        yield b"".join(orjson.dumps(r, option=orjson.OPT_APPEND_NEWLINE) for r in records)
+
+
+def arrow_schema():
+    return pa.schema([
+        (f, pa.float64() if f in _NUMERIC_FIELDS else pa.string()) for f in REVIEW_FIELDS
+    ])
+
+
+def arrow_chunks(store: ReviewStore, chunks: Iterable[np.ndarray], project_id: str) -> Iterator[bytes]:
+    schema = arrow_schema()
+    buf = io.BytesIO()
+    writer = pa.ipc.new_stream(buf, schema)
+
+    def drain() -> bytes:
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        return data
+
+    for idx in chunks:
+        cols = store.columns(idx, project_id)
+        batch = pa.record_batch([pa.array(cols[f], type=schema.field(f).type) for f in REVIEW_FIELDS], schema=schema)
+        writer.write_batch(batch)
+        yield drain()
+    # stream vuoto valido anche senza righe (schema + end-of-stream)
+    writer.close()
+    yield drain()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 5) -> Iterator[bytes]:
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 → container gzip
+    for chunk in chunks:
+        data = z.compress(chunk)
+        if data:
+            yield data
+    yield z.flush()
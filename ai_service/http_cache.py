@@ -0,0 +1,257 @@
+"""
+Middleware HTTP (ASGI puri, niente BaseHTTPMiddleware) per cache e compressione delle risposte.
+- ConditionalGetMiddleware: per le route con una CachePolicy (registrata dal router con
+  register_policy) imposta Cache-Control e, se la policy ha una versione dei dati,
+  un ETag forte = hash(versione dei dati + path + query normalizzata). Con If-None-Match
+  uguale risponde 304 senza eseguire l'handler: niente filtri, serializzazione o pool.
+- CompressionMiddleware: gzip o brotli (se installato) secondo Accept-Encoding, sopra
+  API_COMPRESS_MIN_BYTES; anche le risposte in streaming, un blocco alla volta.
+  Non tocca le risposte già codificate (Content-Encoding: documenti di /projects,
+  export gzip), né gli stream SSE, né i tipi non comprimibili.
+- Un ETag forte di una risposta compressa prende il suffisso della codifica ("…-gzip");
+  etag_matches() confronta i tag ignorando suffisso e prefisso W/ (i CDN spesso
+  indeboliscono i tag quando comprimono).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .startup import route_path
+
+# brotli è opzionale: senza, si comprime solo in gzip
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("API_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("API_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("API_BROTLI_QUALITY", "4"))  # compressione al volo: qualità media
+# edge cache dei CDN per le risposte di dati (s-maxage); i browser rivalidano sempre con l'ETag
+CDN_MAX_AGE = int(os.getenv("API_CDN_MAX_AGE", "60"))
+CDN_STALE_WHILE_REVALIDATE = int(os.getenv("API_CDN_SWR", "300"))
+# cambia a ogni deploy: una nuova versione del codice non riusa gli ETag della precedente
+ETAG_SALT = os.getenv("API_ETAG_SALT") or os.getenv("VERCEL_GIT_COMMIT_SHA", "")
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+_COMPRESSIBLE = re.compile(r"^(text/(?!event-stream)|application/(json|x-ndjson|javascript|xml)|[^;]*\+json)")
+_ENCODING_SUFFIX = re.compile(r'-(?:gzip|br)"$')
+
+
+def data_cache_control() -> str:
+    return f"public, max-age=0, s-maxage={CDN_MAX_AGE}, stale-while-revalidate={CDN_STALE_WHILE_REVALIDATE}"
+
+
+# ---------------- ETag ----------------
+def _normalize_tag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return _ENCODING_SUFFIX.sub('"', tag)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match contiene etag? (confronto debole, ignorando il suffisso di codifica)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = _normalize_tag(etag)
+    return any(_normalize_tag(t) == target for t in if_none_match.split(","))
+
+
+def _encoded_tag(etag: str, encoding: str) -> str:
+    if etag.startswith("W/") or not etag.endswith('"'):
+        return etag  # un tag debole vale già per tutte le codifiche
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def negotiate(accept_encoding: str, available: Iterable[str]) -> str:
+    """Codifica preferita tra quelle accettate dal client: br, poi gzip, poi identity."""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    for enc in ("br", "gzip"):
+        q = accepted.get(enc, accepted.get("*", 0.0))
+        if enc in available and q > 0:
+            return enc
+    return "identity"
+
+
+# ---------------- policy per route ----------------
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    cache_control: valore di Cache-Control per le risposte GET della route;
+    version(query) → versione dei dati serviti (None = nessun ETag, es. progetto inesistente).
+    """
+    cache_control: str
+    version: Optional[Callable[[Dict[str, str]], Optional[str]]] = None
+
+
+_POLICIES: List[Tuple[Pattern[str], CachePolicy]] = []
+
+
+def register_policy(path_pattern: str, policy: CachePolicy) -> None:
+    """Registra (dal modulo del router) la policy per i path che corrispondono interamente al pattern."""
+    _POLICIES.append((re.compile(path_pattern), policy))
+
+
+def policy_for(path: str) -> Optional[CachePolicy]:
+    for pattern, policy in _POLICIES:
+        if pattern.fullmatch(path):
+            return policy
+    return None
+
+
+class ConditionalGetMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        path = route_path(scope)
+        policy = policy_for(path)
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        etag = None
+        if policy.version is not None:
+            query = sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+            try:
+                version = policy.version(dict(query))
+            except Exception:
+                version = None  # es. 404: decide l'handler
+            if version is not None:
+                key = repr((ETAG_SALT, version, path, query)).encode()
+                etag = f'"{hashlib.sha256(key).hexdigest()[:32]}"'
+                if etag_matches(Headers(scope=scope).get("if-none-match"), etag):
+                    headers = [(b"etag", etag.encode()), (b"cache-control", policy.cache_control.encode()),
+                               (b"vary", b"Accept-Encoding")]
+                    await send({"type": "http.response.start", "status": 304, "headers": headers})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start" and 200 <= message["status"] < 300:
+                headers = MutableHeaders(scope=message)
+                if "cache-control" not in headers:
+                    headers["Cache-Control"] = policy.cache_control
+                if etag is not None and "etag" not in headers:
+                    headers["ETag"] = etag
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+# ---------------- compressione ----------------
+class _Encoder:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 = formato gzip
+
+    def chunk(self, data: bytes) -> bytes:
+        """Comprime e svuota: il client riceve subito ogni blocco dello stream."""
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.finish()
+        return self._c.compress(data) + self._c.flush()
+
+
+def _add_vary(headers: MutableHeaders) -> None:
+    vary = headers.get("vary", "")
+    if "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding", ""), ENCODINGS)
+        if_none_match = request_headers.get("if-none-match")
+        start: Optional[Dict[str, Any]] = None
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message  # header inviati al primo blocco del body, quando si sa la dimensione
+                return
+            if message["type"] != "http.response.body":
+                passthrough = True
+                if start is not None:
+                    await send(start)
+                return await send(message)
+
+            if encoder is None:
+                headers = MutableHeaders(scope=start)
+                status = start["status"]
+                if status == 304:
+                    # si rimanda il tag nella forma in cui il client l'ha in cache (con o senza suffisso)
+                    etag = headers.get("etag")
+                    if etag and if_none_match:
+                        for tag in if_none_match.split(","):
+                            if _normalize_tag(tag) == _normalize_tag(etag):
+                                headers["ETag"] = tag.strip()
+                                break
+                if (status < 200 or status in (204, 304) or "content-encoding" in headers
+                        or not _COMPRESSIBLE.match(headers.get("content-type", ""))):
+                    passthrough = True
+                    await send(start)
+                    return await send(message)
+                _add_vary(headers)
+                body, more = message.get("body", b""), message.get("more_body", False)
+                if encoding == "identity" or (not more and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(start)
+                    return await send(message)
+                encoder = _Encoder(encoding)
+                headers["Content-Encoding"] = encoding
+                if "etag" in headers:
+                    headers["ETag"] = _encoded_tag(headers["etag"], encoding)
+                if not more:
+                    data = encoder.finish(body)
+                    headers["Content-Length"] = str(len(data))
+                    await send(start)
+                    return await send({"type": "http.response.body", "body": data})
+                del headers["Content-Length"]
+                await send(start)
+                return await send({"type": "http.response.body", "body": encoder.chunk(body), "more_body": True})
+
+            body, more = message.get("body", b""), message.get("more_body", False)
+            data = encoder.chunk(body) if more else encoder.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,743 @@
+"""
+Backend KV per i job (record, indice, coda, lock).
+- RestKV: Vercel KV / Upstash via REST, con un httpx.AsyncClient persistente (pool di
+  connessioni keep-alive: niente handshake TCP+TLS per comando). Ogni comando Redis è
+  inviato nel body come array JSON (["SET", key, value, "EX", 60]): il valore non passa
+  più dal path, quindi niente URL-encoding del record e nessun limite di lunghezza URL.
+- pipeline(cmds) / multi(cmds): più comandi in una sola richiesta (/pipeline e
+  /multi-exec di Upstash, quest'ultimo atomico); un aggiornamento di un job è un solo
+  round-trip.
+- SyncRestKV: stessa interfaccia in forma sincrona (httpx.Client), per script e thread.
+- Backend locali, senza rete (stessi comandi, eseguiti in-process), solo su richiesta
+  esplicita: SQLiteKV su file in WAL, condiviso tra i processi della macchina (sviluppo,
+  server singolo); MemoryKV, solo per il processo corrente (test). Mai come ripiego
+  automatico: su serverless ogni istanza avrebbe il proprio file e il proprio stato.
+- JOBS_KV_BACKEND=rest|sqlite|memory sceglie il backend (default auto, vedi kv_backend).
+- httpx si importa solo alla creazione di un client REST: i backend locali non lo caricano.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from fastapi import HTTPException
+
+if TYPE_CHECKING:
+    import httpx
+
+KV_TIMEOUT_SEC = 8.0
+KV_MAX_CONNECTIONS = int(os.environ.get("KV_MAX_CONNECTIONS", "20"))
+
+
+def _client_options() -> Dict[str, Any]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=KV_MAX_CONNECTIONS, max_keepalive_connections=10, keepalive_expiry=60.0)
+    return {"timeout": httpx.Timeout(KV_TIMEOUT_SEC), "limits": limits}
+
+Command = Sequence[Any]
+
+
+class JobStore(Protocol):
+    """Interfaccia usata da runner e router: comandi Redis singoli o a gruppi, più scorciatoie."""
+
+    async def command(self, *args: Any) -> Any: ...
+    async def pipeline(self, cmds: Sequence[Command]) -> List[Any]: ...
+    async def multi(self, cmds: Sequence[Command]) -> List[Any]: ...
+    async def get(self, key: str) -> Optional[str]: ...
+    async def mget(self, keys: Sequence[str]) -> List[Optional[str]]: ...
+    async def set(self, key: str, value: str, ex: Optional[int] = None, nx: bool = False) -> bool: ...
+    async def zrevrange(self, key: str, start: int, stop: int) -> List[str]: ...
+    async def lpop(self, key: str) -> Optional[str]: ...
+    async def lmove(self, source: str, destination: str) -> Optional[str]: ...
+
+
+# ---------------- comandi (condivisi tra client async e sync) ----------------
+def set_cmd(key: str, value: str, ex: Optional[int] = None, nx: bool = False) -> List[Any]:
+    cmd: List[Any] = ["SET", key, value]
+    if nx:
+        cmd.append("NX")
+    if ex:
+        cmd += ["EX", int(ex)]
+    return cmd
+
+
+# SET condizionato alla versione del record JSON (compare-and-set) e, solo se riuscito,
+# i comandi di `then` (indici, lock, coda): un passaggio di stato è tutto o niente.
+# I backend locali eseguono lo stesso script in modo nativo (vedi _LocalKV._eval).
+VERSIONED_SET_SCRIPT = """
+local cur = redis.call('GET', KEYS[1])
+local v = 0
+if cur then v = tonumber(cjson.decode(cur)['version']) or 0 end
+if v ~= tonumber(ARGV[2]) then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+for _, cmd in ipairs(cjson.decode(ARGV[4])) do redis.call(unpack(cmd)) end
+return 1
+"""
+
+
+def versioned_set_cmd(key: str, value: str, expected_version: int, ex: int,
+                      then: Sequence[Command] = ()) -> List[Any]:
+    """EVAL che scrive value solo se il record in key ha ancora expected_version (0 = assente); 1 o 0."""
+    return ["EVAL", VERSIONED_SET_SCRIPT, 1, key, value, int(expected_version), int(ex),
+            json.dumps([list(c) for c in then])]
+
+
+# SET condizionato al valore corrente della chiave ('' = assente): per le impronte dei job,
+# così tra richieste identiche in gara una sola sostituisce il valore che ha letto.
+COMPARE_SET_SCRIPT = """
+local cur = redis.call('GET', KEYS[1])
+if (cur or '') ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+def compare_set_cmd(key: str, expected: Optional[str], value: str, ex: int) -> List[Any]:
+    """EVAL che scrive value solo se key vale ancora expected (None = assente); 1 o 0."""
+    return ["EVAL", COMPARE_SET_SCRIPT, 1, key, expected or "", value, int(ex)]
+
+
+def _as_list(res: Any) -> List[str]:
+    # Upstash può restituire come lista o stringa singola, normalizziamo
+    if res is None:
+        return []
+    return [res] if isinstance(res, str) else list(res)
+
+
+class _RestBase:
+    def __init__(self, url: str, token: str):
+        self.url = url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    @staticmethod
+    def _body(cmd: Command) -> List[Any]:
+        return [str(a) if not isinstance(a, (str, int, float)) else a for a in cmd]
+
+    @staticmethod
+    def _result(r: httpx.Response, what: str) -> Any:
+        if r.status_code >= 400:
+            raise HTTPException(status_code=500, detail=f"KV {what} error: {r.text}")
+        return r.json()
+
+    @staticmethod
+    def _results(items: List[Dict[str, Any]], cmds: Sequence[Command]) -> List[Any]:
+        out = []
+        for cmd, item in zip(cmds, items):
+            if "error" in item:
+                raise HTTPException(status_code=500, detail=f"KV {cmd[0]} error: {item['error']}")
+            out.append(item.get("result"))
+        return out
+
+
+class RestKV(_RestBase):
+    def __init__(self, url: str, token: str):
+        super().__init__(url, token)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # un client per event loop: le connessioni del pool appartengono al loop che le ha aperte
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            import httpx
+
+            self._client = httpx.AsyncClient(base_url=self.url, headers=self.headers, **_client_options())
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+
+    async def command(self, *args: Any) -> Any:
+        r = await self._http().post("/", json=self._body(args))
+        body = self._result(r, args[0])
+        if "error" in body:
+            raise HTTPException(status_code=500, detail=f"KV {args[0]} error: {body['error']}")
+        return body.get("result")
+
+    async def pipeline(self, cmds: Sequence[Command]) -> List[Any]:
+        """Più comandi in una richiesta (non atomica); risultati nello stesso ordine."""
+        if not cmds:
+            return []
+        r = await self._http().post("/pipeline", json=[self._body(c) for c in cmds])
+        return self._results(self._result(r, "pipeline"), cmds)
+
+    async def multi(self, cmds: Sequence[Command]) -> List[Any]:
+        """Come pipeline, ma eseguiti come transazione MULTI/EXEC."""
+        if not cmds:
+            return []
+        r = await self._http().post("/multi-exec", json=[self._body(c) for c in cmds])
+        return self._results(self._result(r, "multi-exec"), cmds)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.command("GET", key)
+
+    async def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+        return list(await self.command("MGET", *keys)) if keys else []
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None, nx: bool = False) -> bool:
+        return await self.command(*set_cmd(key, value, ex, nx)) == "OK"
+
+    async def delete(self, key: str) -> None:
+        await self.command("DEL", key)
+
+    async def expire(self, key: str, seconds: int) -> None:
+        await self.command("EXPIRE", key, seconds)
+
+    async def zadd(self, key: str, score: float, member: str) -> None:
+        await self.command("ZADD", key, score, member)
+
+    async def zrevrange(self, key: str, start: int, stop: int) -> List[str]:
+        return _as_list(await self.command("ZREVRANGE", key, start, stop))
+
+    async def rpush(self, key: str, value: str) -> None:
+        await self.command("RPUSH", key, value)
+
+    async def lpop(self, key: str) -> Optional[str]:
+        return await self.command("LPOP", key)
+
+    async def lmove(self, source: str, destination: str) -> Optional[str]:
+        """Primo elemento di source spostato in coda a destination (LMOVE LEFT RIGHT)."""
+        return await self.command("LMOVE", source, destination, "LEFT", "RIGHT")
+
+
+class SyncRestKV(_RestBase):
+    """RestKV sincrono: un httpx.Client condiviso (thread-safe) con pool keep-alive."""
+
+    def __init__(self, url: str, token: str):
+        super().__init__(url, token)
+        import httpx
+
+        self._client = httpx.Client(base_url=self.url, headers=self.headers, **_client_options())
+
+    def close(self) -> None:
+        self._client.close()
+
+    def command(self, *args: Any) -> Any:
+        body = self._result(self._client.post("/", json=self._body(args)), args[0])
+        if "error" in body:
+            raise HTTPException(status_code=500, detail=f"KV {args[0]} error: {body['error']}")
+        return body.get("result")
+
+    def pipeline(self, cmds: Sequence[Command]) -> List[Any]:
+        if not cmds:
+            return []
+        r = self._client.post("/pipeline", json=[self._body(c) for c in cmds])
+        return self._results(self._result(r, "pipeline"), cmds)
+
+    def multi(self, cmds: Sequence[Command]) -> List[Any]:
+        if not cmds:
+            return []
+        r = self._client.post("/multi-exec", json=[self._body(c) for c in cmds])
+        return self._results(self._result(r, "multi-exec"), cmds)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.command("GET", key)
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+        return list(self.command("MGET", *keys)) if keys else []
+
+    def set(self, key: str, value: str, ex: Optional[int] = None, nx: bool = False) -> bool:
+        return self.command(*set_cmd(key, value, ex, nx)) == "OK"
+
+    def delete(self, key: str) -> None:
+        self.command("DEL", key)
+
+    def expire(self, key: str, seconds: int) -> None:
+        self.command("EXPIRE", key, seconds)
+
+    def zadd(self, key: str, score: float, member: str) -> None:
+        self.command("ZADD", key, score, member)
+
+    def zrevrange(self, key: str, start: int, stop: int) -> List[str]:
+        return _as_list(self.command("ZREVRANGE", key, start, stop))
+
+    def rpush(self, key: str, value: str) -> None:
+        self.command("RPUSH", key, value)
+
+    def lpop(self, key: str) -> Optional[str]:
+        return self.command("LPOP", key)
+
+    def lmove(self, source: str, destination: str) -> Optional[str]:
+        return self.command("LMOVE", source, destination, "LEFT", "RIGHT")
+
+
+class _LocalKV:
+    """
+    Base dei backend locali: sottoclassi implementano _exec(cmd) (comando Redis →
+    risultato come Upstash) e _atomic() (contesto che rende atomico un gruppo di comandi).
+    I metodi async passano da _call: MemoryKV esegue direttamente (microsecondi),
+    SQLiteKV su un thread dedicato, così l'I/O su disco non blocca l'event loop.
+    """
+
+    def _exec(self, cmd: Command) -> Any:
+        raise NotImplementedError
+
+    def _atomic(self):
+        raise NotImplementedError
+
+    async def _call(self, fn, *args: Any) -> Any:
+        return fn(*args)
+
+    def _eval(self, args: List[Any]) -> Any:
+        # solo gli script di versioned_set_cmd e compare_set_cmd, nella transazione del gruppo
+        if args[0] == COMPARE_SET_SCRIPT and int(args[1]) == 1:
+            key, expected, value, ex = args[2:6]
+            if (self._exec(("GET", key)) or "") != expected:
+                return 0
+            self._exec(("SET", key, value, "EX", ex))
+            return 1
+        if args[0] != VERSIONED_SET_SCRIPT or int(args[1]) != 1:
+            raise HTTPException(status_code=500, detail=f"KV EVAL not supported by {type(self).__name__}")
+        key, value, expected, ex, then = args[2:7]
+        cur = self._exec(("GET", key))
+        version = int(json.loads(cur).get("version") or 0) if cur is not None else 0
+        if version != int(expected):
+            return 0
+        self._exec(("SET", key, value, "EX", ex))
+        for cmd in json.loads(then):
+            self._exec(cmd)
+        return 1
+
+    def execute(self, cmd: Command) -> Any:
+        """Esegue un comando in forma Redis, restituendo lo stesso risultato di Upstash."""
+        with self._atomic():
+            return self._exec(cmd)
+
+    def execute_many(self, cmds: Sequence[Command]) -> List[Any]:
+        with self._atomic():
+            return [self._exec(c) for c in cmds]
+
+    async def command(self, *args: Any) -> Any:
+        return await self._call(self.execute, args)
+
+    async def pipeline(self, cmds: Sequence[Command]) -> List[Any]:
+        return await self._call(self.execute_many, cmds)
+
+    async def multi(self, cmds: Sequence[Command]) -> List[Any]:
+        return await self._call(self.execute_many, cmds)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.command("GET", key)
+
+    async def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+        return await self.command("MGET", *keys) if keys else []
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None, nx: bool = False) -> bool:
+        return await self.command(*set_cmd(key, value, ex, nx)) == "OK"
+
+    async def delete(self, key: str) -> None:
+        await self.command("DEL", key)
+
+    async def expire(self, key: str, seconds: int) -> None:
+        await self.command("EXPIRE", key, seconds)
+
+    async def zadd(self, key: str, score: float, member: str) -> None:
+        await self.command("ZADD", key, score, member)
+
+    async def zrevrange(self, key: str, start: int, stop: int) -> List[str]:
+        return await self.command("ZREVRANGE", key, start, stop)
+
+    async def rpush(self, key: str, value: str) -> None:
+        await self.command("RPUSH", key, value)
+
+    async def lpop(self, key: str) -> Optional[str]:
+        return await self.command("LPOP", key)
+
+    async def lmove(self, source: str, destination: str) -> Optional[str]:
+        return await self.command("LMOVE", source, destination, "LEFT", "RIGHT")
+
+
+def _set_options(args: List[Any]) -> Tuple[bool, Optional[float]]:
+    opts = [str(a).upper() for a in args[2:]]
+    ex = float(args[2 + opts.index("EX") + 1]) if "EX" in opts else None
+    return "NX" in opts, ex
+
+
+class MemoryKV(_LocalKV):
+    """Stesse operazioni di RestKV su strutture in memoria, nel solo processo corrente."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.RLock()  # per l'uso da thread (SyncLocalKV)
+
+    def _atomic(self):
+        return self._lock
+
+    def _live(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and time.monotonic() >= expires:
+            del self._data[key]
+            return None
+        return value
+
+    def _exec(self, cmd: Command) -> Any:
+        name, args = str(cmd[0]).upper(), list(cmd[1:])
+        if name == "EVAL":
+            return self._eval(args)
+        if name == "GET":
+            value = self._live(args[0])
+            return value if isinstance(value, str) else None
+        if name == "SET":
+            nx, ex = _set_options(args)
+            if nx and self._live(args[0]) is not None:
+                return None
+            self._data[args[0]] = (args[1], time.monotonic() + ex if ex else None)
+            return "OK"
+        if name == "MGET":
+            return [v if isinstance(v, str) else None for v in map(self._live, args)]
+        if name == "DEL":
+            return sum(self._data.pop(k, None) is not None for k in args)
+        if name == "EXPIRE":
+            value = self._live(args[0])
+            if value is None:
+                return 0
+            self._data[args[0]] = (value, time.monotonic() + float(args[1]))
+            return 1
+        if name == "ZADD":
+            zset = self._live(args[0])
+            if zset is None:
+                zset = {}
+                self._data[args[0]] = (zset, None)
+            added = int(args[2] not in zset)
+            zset[args[2]] = float(args[1])
+            return added
+        if name == "ZREM":
+            zset = self._live(args[0]) or {}
+            return sum(zset.pop(m, None) is not None for m in args[1:])
+        if name == "ZREMRANGEBYSCORE":
+            zset = self._live(args[0]) or {}
+            lo, hi = (float(x) for x in args[1:3])
+            drop = [m for m, sc in zset.items() if lo <= sc <= hi]
+            for m in drop:
+                del zset[m]
+            return len(drop)
+        if name == "ZREVRANGE":
+            zset = self._live(args[0]) or {}
+            start, stop = int(args[1]), int(args[2])
+            ordered = sorted(zset, key=lambda m: (zset[m], m), reverse=True)
+            return ordered[start:None if stop == -1 else stop + 1]
+        if name == "RPUSH":
+            items: Optional[Deque[str]] = self._live(args[0])
+            if items is None:
+                items = deque()
+                self._data[args[0]] = (items, None)
+            items.extend(args[1:])
+            return len(items)
+        if name == "LPOP":
+            items = self._live(args[0])
+            return items.popleft() if items else None
+        if name == "LMOVE":
+            items = self._live(args[0])
+            if not items:
+                return None
+            value = items.popleft() if str(args[2]).upper() == "LEFT" else items.pop()
+            self._exec(("RPUSH" if str(args[3]).upper() == "RIGHT" else "LPUSH", args[1], value))
+            return value
+        if name == "LPUSH":
+            items = self._live(args[0])
+            if items is None:
+                items = deque()
+                self._data[args[0]] = (items, None)
+            items.extendleft(args[1:])
+            return len(items)
+        if name == "LRANGE":
+            items = list(self._live(args[0]) or ())
+            start, stop = int(args[1]), int(args[2])
+            return items[start:None if stop == -1 else stop + 1]
+        if name == "LREM":
+            items = self._live(args[0])
+            if not items:
+                return 0
+            count, value = int(args[1]), str(args[2])
+            kept, removed = list(items), 0
+            order = range(len(kept) - 1, -1, -1) if count < 0 else range(len(kept))
+            for i in order:
+                if kept[i] == value and (count == 0 or removed < abs(count)):
+                    kept[i] = None
+                    removed += 1
+            items.clear()
+            items.extend(v for v in kept if v is not None)
+            return removed
+        raise HTTPException(status_code=500, detail=f"KV {name} not supported by MemoryKV")
+
+
+class SQLiteKV(_LocalKV):
+    """
+    Backend su file SQLite (WAL) con lo stesso modello dati di Redis: stringhe con
+    scadenza, sorted set (ordinati per score, poi membro, come ZREVRANGE) e liste FIFO.
+    Condivisibile tra più processi sulla stessa macchina; ogni pipeline è una transazione,
+    quindi un aggiornamento di stato è un solo commit (WAL + synchronous=NORMAL: niente
+    fsync per commit). Le scadenze usano l'orologio di sistema e i record scaduti vengono
+    eliminati in blocco a intervalli (SQLITE_PURGE_SEC).
+    """
+
+    SQLITE_PURGE_SEC = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # una connessione condivisa, serializzata dal lock (anche per la vista sincrona)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=10.0)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._next_purge = 0.0
+        # un thread per i comandi async: le scritture sono comunque serializzate dal lock
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-kv")
+        c = self._conn
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        c.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL);
+            CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires) WHERE expires IS NOT NULL;
+            CREATE TABLE IF NOT EXISTS zset (key TEXT NOT NULL, member TEXT NOT NULL, score REAL NOT NULL,
+                                             PRIMARY KEY (key, member)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS zset_score ON zset (key, score, member);
+            CREATE TABLE IF NOT EXISTS list (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, value TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS list_key ON list (key, seq);
+        """)
+
+    async def _call(self, fn, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _atomic(self):
+        # transazione più esterna: BEGIN IMMEDIATE prende subito il lock di scrittura,
+        # così i comandi del gruppo vedono uno stato coerente anche tra processi
+        with self._lock:
+            outer = self._depth == 0
+            if outer:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if outer:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if outer:
+                self._purge_expired()
+                self._conn.execute("COMMIT")
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        if now >= self._next_purge:
+            self._conn.execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?", (now,))
+            self._next_purge = now + self.SQLITE_PURGE_SEC
+
+    def _exec(self, cmd: Command) -> Any:
+        name, args = str(cmd[0]).upper(), list(cmd[1:])
+        c, now = self._conn, time.time()
+        live = "(expires IS NULL OR expires > ?)"
+        if name == "EVAL":
+            return self._eval(args)
+        if name == "GET":
+            row = c.execute(f"SELECT value FROM kv WHERE key = ? AND {live}", (args[0], now)).fetchone()
+            return row[0] if row else None
+        if name == "MGET":
+            found: Dict[str, str] = {}
+            for i in range(0, len(args), 500):  # limite di parametri per statement
+                part = args[i:i + 500]
+                marks = ",".join("?" * len(part))
+                found.update(c.execute(f"SELECT key, value FROM kv WHERE key IN ({marks}) AND {live}",
+                                       (*part, now)))
+            return [found.get(k) for k in args]
+        if name == "SET":
+            nx, ex = _set_options(args)
+            expires = now + ex if ex else None
+            if nx:
+                cur = c.execute(
+                    "INSERT INTO kv (key, value, expires) VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE "
+                    "SET value = excluded.value, expires = excluded.expires "
+                    "WHERE kv.expires IS NOT NULL AND kv.expires <= ?",
+                    (args[0], str(args[1]), expires, now))
+                return "OK" if cur.rowcount else None
+            c.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                      (args[0], str(args[1]), expires))
+            return "OK"
+        if name == "DEL":
+            n = 0
+            for k in args:
+                n += c.execute(f"DELETE FROM kv WHERE key = ? AND {live}", (k, now)).rowcount
+                n += int(c.execute("DELETE FROM zset WHERE key = ?", (k,)).rowcount > 0)
+                n += int(c.execute("DELETE FROM list WHERE key = ?", (k,)).rowcount > 0)
+            return n
+        if name == "EXPIRE":
+            # solo le stringhe hanno scadenza (l'unico uso: lock e record dei job)
+            return c.execute(f"UPDATE kv SET expires = ? WHERE key = ? AND {live}",
+                             (now + float(args[1]), args[0], now)).rowcount
+        if name == "ZADD":
+            exists = c.execute("SELECT 1 FROM zset WHERE key = ? AND member = ?", (args[0], str(args[2]))).fetchone()
+            c.execute("INSERT INTO zset (key, member, score) VALUES (?, ?, ?) "
+                      "ON CONFLICT (key, member) DO UPDATE SET score = excluded.score",
+                      (args[0], str(args[2]), float(args[1])))
+            return int(exists is None)
+        if name == "ZREM":
+            marks = ",".join("?" * len(args[1:]))
+            return c.execute(f"DELETE FROM zset WHERE key = ? AND member IN ({marks})", args).rowcount
+        if name == "ZREMRANGEBYSCORE":
+            lo, hi = (float(x) for x in args[1:3])
+            return c.execute("DELETE FROM zset WHERE key = ? AND score BETWEEN ? AND ?", (args[0], lo, hi)).rowcount
+        if name == "ZREVRANGE":
+            start, stop = int(args[1]), int(args[2])
+            limit = -1 if stop == -1 else max(0, stop - start + 1)
+            rows = c.execute("SELECT member FROM zset WHERE key = ? ORDER BY score DESC, member DESC "
+                             "LIMIT ? OFFSET ?", (args[0], limit, start))
+            return [r[0] for r in rows]
+        if name == "RPUSH":
+            c.executemany("INSERT INTO list (key, value) VALUES (?, ?)", [(args[0], str(v)) for v in args[1:]])
+            return c.execute("SELECT COUNT(*) FROM list WHERE key = ?", (args[0],)).fetchone()[0]
+        if name == "LPOP":
+            row = c.execute("DELETE FROM list WHERE seq = (SELECT seq FROM list WHERE key = ? ORDER BY seq LIMIT 1) "
+                            "RETURNING value", (args[0],)).fetchone()
+            return row[0] if row else None
+        if name == "LMOVE":
+            # solo LEFT → RIGHT (l'unico uso: coda → lista dei job in lavorazione)
+            if (str(args[2]).upper(), str(args[3]).upper()) != ("LEFT", "RIGHT"):
+                raise HTTPException(status_code=500, detail="KV LMOVE: only LEFT RIGHT supported by SQLiteKV")
+            value = self._exec(("LPOP", args[0]))
+            if value is not None:
+                self._exec(("RPUSH", args[1], value))
+            return value
+        if name == "LRANGE":
+            start, stop = int(args[1]), int(args[2])
+            values = [r[0] for r in c.execute("SELECT value FROM list WHERE key = ? ORDER BY seq", (args[0],))]
+            return values[start:None if stop == -1 else stop + 1]
+        if name == "LREM":
+            count = int(args[1])
+            order = "DESC" if count < 0 else "ASC"
+            limit = abs(count) if count else -1
+            return c.execute(f"DELETE FROM list WHERE seq IN (SELECT seq FROM list WHERE key = ? AND value = ? "
+                             f"ORDER BY seq {order} LIMIT ?)", (args[0], str(args[2]), limit)).rowcount
+        raise HTTPException(status_code=500, detail=f"KV {name} not supported by SQLiteKV")
+
+
+class SyncLocalKV:
+    """Vista sincrona di un backend locale (stessi dati del backend async)."""
+
+    def __init__(self, kv: _LocalKV):
+        self._kv = kv
+
+    def command(self, *args: Any) -> Any:
+        return self._kv.execute(args)
+
+    def pipeline(self, cmds: Sequence[Command]) -> List[Any]:
+        return self._kv.execute_many(cmds)
+
+    def multi(self, cmds: Sequence[Command]) -> List[Any]:
+        return self._kv.execute_many(cmds)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.command("GET", key)
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+        return list(self.command("MGET", *keys)) if keys else []
+
+    def set(self, key: str, value: str, ex: Optional[int] = None, nx: bool = False) -> bool:
+        return self.command(*set_cmd(key, value, ex, nx)) == "OK"
+
+    def delete(self, key: str) -> None:
+        self.command("DEL", key)
+
+    def expire(self, key: str, seconds: int) -> None:
+        self.command("EXPIRE", key, seconds)
+
+    def zadd(self, key: str, score: float, member: str) -> None:
+        self.command("ZADD", key, score, member)
+
+    def zrevrange(self, key: str, start: int, stop: int) -> List[str]:
+        return self.command("ZREVRANGE", key, start, stop)
+
+    def rpush(self, key: str, value: str) -> None:
+        self.command("RPUSH", key, value)
+
+    def lpop(self, key: str) -> Optional[str]:
+        return self.command("LPOP", key)
+
+    def lmove(self, source: str, destination: str) -> Optional[str]:
+        return self.command("LMOVE", source, destination, "LEFT", "RIGHT")
+
+
+_KV: Any = None
+_SYNC_KV: Any = None
+_KV_LOCK = threading.Lock()
+_KV_WARNED = False
+
+JOBS_SQLITE_PATH = os.environ.get("JOBS_SQLITE_PATH") or os.path.join(tempfile.gettempdir(), "insightsuite-jobs.sqlite3")
+
+
+def _rest_config() -> Optional[Tuple[str, str]]:
+    url = os.environ.get("KV_REST_API_URL") or os.environ.get("UPSTASH_REDIS_REST_URL")
+    token = os.environ.get("KV_REST_API_TOKEN") or os.environ.get("UPSTASH_REDIS_REST_TOKEN")
+    return (url, token) if url and token else None
+
+
+def kv_backend() -> str:
+    """JOBS_KV_BACKEND: rest | sqlite | memory; 'auto' (default) = rest (None se non configurato)."""
+    backend = os.environ.get("JOBS_KV_BACKEND", "auto").lower()
+    return "rest" if backend == "auto" else backend
+
+
+def get_kv() -> Optional[JobStore]:
+    """
+    Backend configurato (singleton), o None se il KV REST non è configurato (e non è
+    stato scelto un backend locale): RestKV da KV_REST_API_URL/KV_REST_API_TOKEN (Vercel KV) o UPSTASH_REDIS_REST_URL/_TOKEN;
+    SQLiteKV su JOBS_SQLITE_PATH; MemoryKV (solo per il processo corrente).
+    """
+    global _KV, _KV_WARNED
+    with _KV_LOCK:
+        if _KV is None:
+            backend = kv_backend()
+            if backend == "memory":
+                _KV = MemoryKV()
+            elif backend == "sqlite":
+                _KV = SQLiteKV(JOBS_SQLITE_PATH)
+            elif _rest_config():
+                _KV = RestKV(*_rest_config())
+            elif not _KV_WARNED:
+                # una volta sola, al primo uso (non all'import dei router)
+                _KV_WARNED = True
+                print("[jobs] WARNING: KV env vars missing (KV_REST_API_URL/KV_REST_API_TOKEN); jobs will raise 500. "
+                      "Set JOBS_KV_BACKEND=sqlite or memory for a local store")
+        return _KV
+
+
+def get_sync_kv():
+    """Come get_kv, in forma sincrona (SyncRestKV, o una vista sullo stesso backend locale)."""
+    global _SYNC_KV
+    if _SYNC_KV is None:
+        kv = get_kv()
+        if isinstance(kv, _LocalKV):
+            _SYNC_KV = SyncLocalKV(kv)
+        elif kv is not None:
+            _SYNC_KV = SyncRestKV(*_rest_config())
+    return _SYNC_KV
+
+
+async def close_kv() -> None:
+    """Chiude le connessioni del pool (shutdown dell'API)."""
+    if isinstance(_KV, RestKV):
+        await _KV.aclose()
@@ -2,13 +2,18 @@
 from __future__ import annotations
 
 import os
+import sys
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
-from .routers import health, reviews, jobs
+from .http_cache import CompressionMiddleware, ConditionalGetMiddleware
+from .kv import close_kv
+from .startup import LazyRouters, include_routers, lazy_routers_enabled, warmup, warmup_projects_from_env
 
 
 def _allowed_origins() -> List[str]:
@@ -18,20 +23,26 @@ def _allowed_origins() -> List[str]:
     return [o.strip() for o in raw.split(",") if o.strip()]
 
 
-app = FastAPI(
-    title="InsightSuite AI Service",
-    description="Backend service for customer feedback analysis",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc",
-    openapi_url="/openapi.json",
-    # La Function è esposta da Vercel sotto /api
-    root_path="/api",
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # runner dei job: riprende subito gli id rimasti in coda (il router jobs non carica pandas)
+    include_routers(app, ["jobs"])
+    from .routers import jobs
+
+    jobs.RUNNER.ensure_started()
+    if os.getenv("API_WARMUP", "0") == "1":
+        # in background: l'avvio non aspetta pandas né il caricamento dei progetti
+        threading.Thread(target=warmup, args=(app, warmup_projects_from_env()), name="warmup", daemon=True).start()
+    yield
+    await jobs.RUNNER.stop()
+    pipeline_job = sys.modules.get(f"{__package__}.pipeline_job")
+    if pipeline_job is not None:
+        pipeline_job.terminate_all()
+    await close_kv()
+
 
-# 🔧 Middleware: rimuove il prefisso /InsightSuite quando l'app è montata nel Portfolio
-@app.middleware("http")
 async def strip_insightsuite_prefix(request: Request, call_next):
+    """Rimuove il prefisso /InsightSuite quando l'app è montata nel Portfolio."""
     # In Starlette/FastAPI, la route corrisponde a request.scope["path"]
     path = request.scope.get("path", "")
     if path.startswith("/InsightSuite/"):
@@ -41,21 +52,6 @@ async def strip_insightsuite_prefix(request: Request, call_next):
     return await call_next(request)
 
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=_allowed_origins(),
-    allow_credentials=False,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Router SENZA prefisso /api (ci pensa root_path="/api")
-app.include_router(health.router, tags=["health"])
-app.include_router(reviews.router, tags=["reviews"])
-app.include_router(jobs.router, tags=["jobs"])
-
-
-@app.get("/", tags=["root"])
 async def root():
     return {
         "message": "InsightSuite AI Service",
@@ -66,6 +62,49 @@ async def root():
     }
 
 
+def create_app(lazy: Optional[bool] = None) -> FastAPI:
+    """
+    App dell'API. Con lazy (default API_LAZY_ROUTERS=1) i router si registrano alla prima
+    richiesta che li usa (vedi startup.py); altrimenti tutti subito.
+    """
+    app = FastAPI(
+        title="InsightSuite AI Service",
+        description="Backend service for customer feedback analysis",
+        version="1.0.0",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        openapi_url="/openapi.json",
+        # La Function è esposta da Vercel sotto /api
+        root_path="/api",
+        lifespan=lifespan,
+    )
+
+    # l'ultimo middleware aggiunto è il più esterno. Dall'interno: ETag/304 e Cache-Control,
+    # compressione (vede l'ETag finale), LazyRouters (le policy dei router sono registrate
+    # prima di ETag e compressione), prefisso /InsightSuite, CORS
+    app.add_middleware(ConditionalGetMiddleware)
+    app.add_middleware(CompressionMiddleware)
+    if lazy_routers_enabled() if lazy is None else lazy:
+        app.add_middleware(LazyRouters, target=app)
+    else:
+        include_routers(app)
+    app.middleware("http")(strip_insightsuite_prefix)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=_allowed_origins(),
+        allow_credentials=False,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Router SENZA prefisso /api (ci pensa root_path="/api")
+    app.add_api_route("/", root, methods=["GET"], tags=["root"])
+    return app
+
+
+app = create_app()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -22,9 +22,10 @@ class Review(BaseModel):
 class ReviewPage(BaseModel):
     """Paginated review response"""
     total: int
-    page: int
+    page: Optional[int] = None  # null in modalità cursore
     pageSize: int
     items: List[Review]
+    nextCursor: Optional[str] = None
 
 class ReviewQuery(BaseModel):
     """Review query parameters"""
@@ -42,6 +43,7 @@ class ReviewQuery(BaseModel):
     order: Literal["asc", "desc"] = "desc"
     page: int = Field(1, ge=1)
     pageSize: int = Field(50, ge=1, le=200)
+    cursor: Optional[str] = None
 
 class Quote(BaseModel):
     """Review quote model"""
@@ -115,7 +117,7 @@ class ProjectData(BaseModel):
 class JobStatus(BaseModel):
     """Job status"""
     id: str
-    status: str = Field(pattern="^(pending|running|completed|failed)$")
+    status: str = Field(pattern="^(pending|queued|running|completed|failed|cancelled)$")
     progress: float = Field(ge=0, le=100)
     message: Optional[str] = None
     created_at: datetime
@@ -123,12 +125,27 @@ class JobStatus(BaseModel):
     completed_at: Optional[datetime] = None
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    version: int = 0
+
+class JobSummary(BaseModel):
+    """Job in a list (GET /jobs?view=summary): no result/params"""
+    id: str
+    status: str = Field(pattern="^(pending|queued|running|completed|failed|cancelled)$")
+    progress: float = Field(ge=0, le=100)
+    message: Optional[str] = None
+    project_id: Optional[str] = None
+    mode: str
+    created_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
 
 class CreateJobRequest(BaseModel):
     """Request to create analysis job"""
     dataset_url: str
     dataset_type: str = Field(pattern="^(airbnb|mobile|ecommerce|custom)$")
     project_name: str
+    project_id: Optional[str] = None
     options: Optional[Dict[str, Any]] = None
 
 class CreateJobResponse(BaseModel):
@@ -136,6 +153,8 @@ class CreateJobResponse(BaseModel):
     job_id: str
     status: str
     message: str
+    deduplicated: bool = False
+    result: Optional[Dict[str, Any]] = None
 
 # Health check models
 
@@ -0,0 +1,336 @@
+"""
+Pipeline completa (pipeline/run_demo.process_dataset) come job dell'API.
+- Ingest: dataset_url http(s) scaricato in un file temporaneo (JOB_DATASET_MAX_MB; solo
+  host pubblici, controllati a ogni redirect), oppure un file sotto pipeline/data;
+  caricato col loader del dataset_type.
+- Gli stadi (sentiment, embeddings, clustering, sommari, personas, salvataggio) girano
+  in un processo figlio (spawn, cwd=pipeline/): il lavoro CPU-bound e i modelli non
+  pesano sul processo dell'API e un job annullato si interrompe terminando il figlio.
+- Il figlio manda lo stato di ogni stadio su una Pipe; il thread del job lo traduce in
+  progresso (percentuale + nome dello stadio) per il record del job.
+- Al massimo PIPELINE_JOB_CONCURRENCY pipeline contemporanee per processo API (default 1);
+  i job oltre il limite restano in attesa (annullabili) con message="waiting for slot".
+"""
+from __future__ import annotations
+
+import ipaddress
+import multiprocessing as mp
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import urljoin, urlparse
+
+import httpx
+
+from .data_dir import resolve_data_dir
+from .runner import JobCancelledError, Progress
+
+PIPELINE_DIR = Path(os.environ.get("PIPELINE_DIR") or Path(__file__).resolve().parents[1] / "pipeline")
+# relativo a PIPELINE_DIR; separato da ./out, che contiene i progetti demo versionati
+PIPELINE_OUT_DIR = os.environ.get("PIPELINE_OUT_DIR", "./out/jobs")
+PIPELINE_JOB_CONCURRENCY = max(1, int(os.environ.get("PIPELINE_JOB_CONCURRENCY", "1")))
+PIPELINE_JOB_TIMEOUT_SEC = float(os.environ.get("PIPELINE_JOB_TIMEOUT_SEC", "0"))  # 0 = nessun limite
+JOB_DATASET_MAX_MB = float(os.environ.get("JOB_DATASET_MAX_MB", "500"))
+# host ammessi per dataset_url (vuoto = qualsiasi host pubblico)
+JOB_DATASET_ALLOWED_HOSTS = {h.strip().lower() for h in os.environ.get("JOB_DATASET_ALLOWED_HOSTS", "").split(",")
+                             if h.strip()}
+_MAX_REDIRECTS = 5
+
+# dataset_type → (loader in pipeline/utils.py, fonte di default)
+LOADERS = {
+    "airbnb": ("load_airbnb_reviews", "InsideAirbnb"),
+    "mobile": ("load_mendeley_mobile", "Google Play"),
+    "ecommerce": ("load_women_ecommerce", "E-commerce"),
+    "custom": ("load_generic_reviews", "Custom"),
+}
+
+# quota di progresso: 0-5 download, 5-10 caricamento, 10-100 stadi
+_INGEST_PCT = 5.0
+_LOAD_PCT = 10.0
+
+_SLOTS = threading.BoundedSemaphore(PIPELINE_JOB_CONCURRENCY)
+_ACTIVE: Set[mp.Process] = set()
+_ACTIVE_LOCK = threading.Lock()
+
+
+def slugify(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "project"
+
+
+# ---------------- ingest ----------------
+def _public_ip(addr: str) -> bool:
+    ip = ipaddress.ip_address(addr.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _check_url(url: str) -> None:
+    """
+    Solo http(s) verso host pubblici (e, se configurata, in JOB_DATASET_ALLOWED_HOSTS):
+    l'endpoint non è autenticato, il job non deve raggiungere la rete interna o i
+    metadata del cloud. Si controllano tutti gli indirizzi risolti dal DNS.
+    """
+    u = urlparse(url)
+    if u.scheme not in ("http", "https") or not u.hostname:
+        raise ValueError(f"unsupported dataset url: {url}")
+    host = u.hostname.lower()
+    if JOB_DATASET_ALLOWED_HOSTS and host not in JOB_DATASET_ALLOWED_HOSTS:
+        raise ValueError(f"dataset host not allowed: {host}")
+    try:
+        infos = socket.getaddrinfo(host, u.port or (443 if u.scheme == "https" else 80), type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"cannot resolve dataset host {host}: {e}")
+    for info in infos:
+        if not _public_ip(info[4][0]):
+            raise ValueError(f"dataset host {host} resolves to a non-public address")
+
+
+def _check_peer(r: httpx.Response) -> None:
+    # l'indirizzo effettivamente connesso: il DNS può cambiare risposta dopo _check_url
+    stream = r.extensions.get("network_stream")
+    addr = stream.get_extra_info("server_addr") if stream is not None else None
+    if addr and not _public_ip(str(addr[0])):
+        raise ValueError("dataset host resolves to a non-public address")
+
+
+def _download(url: str, dest: Path, progress: Progress) -> None:
+    limit = int(JOB_DATASET_MAX_MB * 1024 * 1024)
+    # redirect seguiti a mano, controllando ogni salto; niente proxy da env (il peer sarebbe il proxy)
+    with httpx.Client(follow_redirects=False, trust_env=False, timeout=httpx.Timeout(30.0)) as client:
+        for _ in range(_MAX_REDIRECTS + 1):
+            _check_url(url)
+            with client.stream("GET", url) as r:
+                _check_peer(r)
+                if r.is_redirect:
+                    url = urljoin(url, r.headers["location"])
+                    continue
+                r.raise_for_status()
+                total = int(r.headers.get("content-length") or 0)
+                if total > limit:
+                    raise ValueError(f"dataset too large ({total} bytes, max {JOB_DATASET_MAX_MB:g} MB)")
+                done = 0
+                with open(dest, "wb") as f:
+                    for chunk in r.iter_bytes(1 << 20):
+                        if progress.cancelled.is_set():
+                            raise JobCancelledError()
+                        done += len(chunk)
+                        if done > limit:
+                            raise ValueError(f"dataset too large (max {JOB_DATASET_MAX_MB:g} MB)")
+                        f.write(chunk)
+                        if total:
+                            progress(_INGEST_PCT * done / total, "downloading dataset")
+                return
+    raise ValueError(f"too many redirects (max {_MAX_REDIRECTS})")
+
+
+def _project_documents(project_id: str) -> Tuple[Path, ...]:
+    return (resolve_data_dir() / f"{project_id}.json",
+            PIPELINE_DIR.parent / "public" / "demo" / "projects" / f"{project_id}.json")
+
+
+def resolve_project_id(params: Dict[str, Any]) -> str:
+    """
+    project_id del job (o slug del project_name). Sono rifiutati gli id di progetti già
+    pubblicati (demo airbnb/mobile/ecommerce o generati dalla CLI): un job scrive solo nel
+    proprio namespace (PIPELINE_OUT_DIR) ma cache e checkpoint della pipeline sono per id.
+    """
+    options = params.get("options") or {}
+    project_name = params.get("project_name") or "Project"
+    project_id = params.get("project_id") or options.get("project_id") or slugify(project_name)
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", project_id):
+        raise ValueError(f"invalid project_id: {project_id!r}")
+    if any(p.exists() for p in _project_documents(project_id)):
+        raise ValueError(f"project_id {project_id!r} is reserved by a published project")
+    return project_id
+
+
+def _local_dataset(path: str) -> Path:
+    """Solo file dentro pipeline/data: il job non deve poter leggere file arbitrari."""
+    data_dir = (PIPELINE_DIR / "data").resolve()
+    p = Path(path[len("file://"):] if path.startswith("file://") else path)
+    p = (p if p.is_absolute() else data_dir / p).resolve()
+    if data_dir not in p.parents or not p.is_file():
+        raise ValueError(f"dataset not found under pipeline/data: {path}")
+    return p
+
+
+def fingerprint_input(params: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """
+    Parametri normalizzati + versione dei dati per la deduplica dei job, e se il
+    risultato completato si può riusare: per un URL il contenuto remoto può cambiare,
+    quindi si condivide solo il job ancora in corso.
+    """
+    options = {k: v for k, v in (params.get("options") or {}).items() if k != "mode" and v is not None}
+    project_name = params.get("project_name") or "Project"
+    url = params.get("dataset_url") or ""
+    payload: Dict[str, Any] = {
+        "mode": "pipeline",
+        "dataset_type": params.get("dataset_type") or "custom",
+        "project_id": params.get("project_id") or options.pop("project_id", None) or slugify(project_name),
+        "project_name": project_name,
+        "options": options,
+    }
+    if urlparse(url).scheme in ("http", "https"):
+        payload["dataset"] = url
+        return payload, False
+    try:
+        p = _local_dataset(url)
+    except ValueError:
+        payload["dataset"] = url  # il job fallirà: nessun riuso
+        return payload, False
+    st = p.stat()
+    payload["dataset"] = [str(p), st.st_mtime_ns, st.st_size]
+    return payload, True
+
+
+# ---------------- processo figlio ----------------
+def _child(conn, dataset_path: str, loader_name: str, args: Dict[str, Any]) -> None:
+    """Eseguito nel processo figlio: carica il dataset e lancia la pipeline."""
+    try:
+        os.chdir(PIPELINE_DIR)
+        sys.path.insert(0, str(PIPELINE_DIR))
+        import run_demo
+        import utils
+
+        conn.send(("loading", None))
+        df = getattr(utils, loader_name)(dataset_path)
+        conn.send(("loaded", len(df)))
+
+        def on_stage(name: str, status: str, index: int, total: int) -> None:
+            conn.send(("stage", (name, status, index, total)))
+
+        Path(args["output_dir"]).mkdir(parents=True, exist_ok=True)
+        output_path = run_demo.process_dataset(df, on_stage=on_stage, **args)
+        conn.send(("done", output_path))
+    except BaseException as e:
+        traceback.print_exc()
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def terminate_all() -> None:
+    """Termina le pipeline ancora in corso (shutdown dell'API)."""
+    with _ACTIVE_LOCK:
+        procs = list(_ACTIVE)
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+
+
+def _acquire_slot(progress: Progress) -> None:
+    if _SLOTS.acquire(blocking=False):
+        return
+    progress(0.0, "waiting for slot")
+    while not _SLOTS.acquire(timeout=0.5):
+        if progress.cancelled.is_set():
+            raise JobCancelledError()
+
+
+def _run_child(dataset_path: str, loader_name: str, args: Dict[str, Any], progress: Progress,
+               stages: Dict[str, str]) -> str:
+    ctx = mp.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(child_conn, dataset_path, loader_name, args),
+                       name=f"pipeline-{args['project_id']}")
+    proc.start()
+    child_conn.close()
+    with _ACTIVE_LOCK:
+        _ACTIVE.add(proc)
+    deadline = time.monotonic() + PIPELINE_JOB_TIMEOUT_SEC if PIPELINE_JOB_TIMEOUT_SEC > 0 else None
+    finished = False
+    try:
+        while True:
+            if progress.cancelled.is_set():
+                raise JobCancelledError()
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"pipeline timed out after {PIPELINE_JOB_TIMEOUT_SEC:g}s")
+            if not parent_conn.poll(0.5):
+                if not proc.is_alive() and not parent_conn.poll(0):
+                    raise RuntimeError(f"pipeline process exited with code {proc.exitcode}")
+                continue
+            try:
+                kind, payload = parent_conn.recv()
+            except EOFError:
+                raise RuntimeError(f"pipeline process exited with code {proc.exitcode}")
+            if kind == "loading":
+                progress(_INGEST_PCT, "loading dataset")
+            elif kind == "loaded":
+                progress(_LOAD_PCT, f"loaded {payload} reviews")
+            elif kind == "stage":
+                name, status, index, total = payload
+                stages[name] = status
+                done = index + (0 if status == "running" else 1)
+                pct = _LOAD_PCT + (100.0 - _LOAD_PCT) * done / max(1, total)
+                progress(min(pct, 99.0), f"{name} ({index + 1}/{total})" + ("" if status == "running" else f": {status}"))
+            elif kind == "done":
+                finished = True
+                return payload
+            elif kind == "error":
+                raise RuntimeError(payload)
+    finally:
+        # a pipeline conclusa il figlio sta solo uscendo; altrimenti (annullo, errore) va fermato
+        if not finished and proc.is_alive():
+            proc.terminate()
+        proc.join(timeout=10)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+        parent_conn.close()
+        with _ACTIVE_LOCK:
+            _ACTIVE.discard(proc)
+
+
+def run_pipeline(params: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    """Handler del job: ingest, pipeline nel processo figlio, risultato con stato degli stadi."""
+    options = params.get("options") or {}
+    dataset_type = params.get("dataset_type") or "custom"
+    loader_name, default_source = LOADERS[dataset_type]
+    project_name = params.get("project_name") or "Project"
+    project_id = resolve_project_id(params)
+    args = {
+        "project_id": project_id,
+        "project_name": project_name,
+        "source_name": options.get("source_name") or default_source,
+        "output_dir": PIPELINE_OUT_DIR,  # solo da env: l'endpoint non è autenticato
+        "max_reviews": int(options.get("max_reviews") or 10000),
+        "use_lemmatization": bool(options.get("lemmatize", False)),
+        "from_stage": options.get("from_stage"),
+        "publish": False,  # niente copie in public/demo/projects e ai_service/_data
+    }
+
+    t0 = time.perf_counter()
+    _acquire_slot(progress)
+    tmp: Optional[tempfile.TemporaryDirectory] = None
+    try:
+        url = params.get("dataset_url") or ""
+        if urlparse(url).scheme in ("http", "https"):
+            tmp = tempfile.TemporaryDirectory(prefix="pipeline-job-")
+            name = Path(urlparse(url).path).name or "dataset.csv"
+            dataset_path = Path(tmp.name) / name
+            progress(0.0, "downloading dataset")
+            _download(url, dataset_path, progress)
+        else:
+            dataset_path = _local_dataset(url)
+
+        stages: Dict[str, str] = {}
+        output_path = _run_child(str(dataset_path), loader_name, args, progress, stages)
+    finally:
+        _SLOTS.release()
+        if tmp is not None:
+            tmp.cleanup()
+
+    return {
+        "project_id": project_id,
+        "output_path": str((PIPELINE_DIR / output_path).resolve()),
+        "stages": stages,
+        "elapsed_s": round(time.perf_counter() - t0, 3),
+    }
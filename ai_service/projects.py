@@ -0,0 +1,104 @@
+"""
+Documento di progetto (<id>.json scritto da save_project_json) servito da memoria.
+- Al caricamento ogni sezione di primo livello (meta, aggregates, clusters, ...) viene
+  serializzata una volta sola in JSON compatto (orjson).
+- Un sottoinsieme di sezioni (?sections=) si compone concatenando i byte già pronti,
+  senza ri-serializzare; il body, le versioni gzip/brotli e l'ETag forte di ogni
+  combinazione sono calcolati alla prima richiesta e poi riusati.
+- Il documento vive nella ProjectCache: se il file cambia, tutto viene ricostruito; ogni
+  nuova combinazione fa rimisurare l'entry (on_resize).
+- Codifiche e confronto degli ETag come in http_cache (brotli opzionale, suffisso "-gzip"/"-br").
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException
+
+from .http_cache import brotli
+
+GZIP_LEVEL = 9  # compressione una tantum: conviene il livello massimo
+BROTLI_QUALITY = 11
+
+
+def brotli_available() -> bool:
+    return brotli is not None
+
+
+@dataclass(frozen=True)
+class Encoded:
+    """Body di una combinazione di sezioni nelle codifiche disponibili, con i rispettivi ETag."""
+    bodies: Dict[str, bytes]  # "identity" | "gzip" | "br" → body
+    etags: Dict[str, str]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(b) for b in self.bodies.values())
+
+
+def _encode(body: bytes) -> Encoded:
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    # ETag forte per rappresentazione: stesso contenuto, codifiche diverse → tag diversi
+    etags = {enc: f'"{digest}"' if enc == "identity" else f'"{digest}-{enc}"' for enc in bodies}
+    return Encoded(bodies=bodies, etags=etags)
+
+
+class ProjectDocument:
+    def __init__(self, doc: Dict[str, object]):
+        if not isinstance(doc, dict):
+            raise ValueError("project document must be a JSON object")
+        self.sections: Tuple[str, ...] = tuple(doc)
+        self._parts: Dict[str, bytes] = {k: orjson.dumps(v) for k, v in doc.items()}
+        self._variants: Dict[Tuple[str, ...], Encoded] = {}
+        self._lock = threading.Lock()
+        self.on_resize: Optional[Callable[[], None]] = None  # impostato da ProjectCache
+        self.variant(self.sections)  # documento completo pronto subito
+
+    @classmethod
+    def load(cls, path: Path) -> "ProjectDocument":
+        try:
+            return cls(orjson.loads(path.read_bytes()))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error reading project file {path.name}: {e}")
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(p) for p in self._parts.values()) + sum(v.nbytes for v in self._variants.values())
+
+    def select(self, names: Optional[Iterable[str]]) -> Tuple[str, ...]:
+        """Sezioni richieste nell'ordine del documento (400 se una non esiste)."""
+        if names is None:
+            return self.sections
+        wanted = {n for n in names if n}
+        unknown = wanted.difference(self.sections)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"unknown sections: {', '.join(sorted(unknown))}; "
+                                                        f"available: {', '.join(self.sections)}")
+        return tuple(s for s in self.sections if s in wanted)
+
+    def cached_variant(self, sections: Tuple[str, ...]) -> Optional[Encoded]:
+        return self._variants.get(sections)
+
+    def variant(self, sections: Tuple[str, ...]) -> Encoded:
+        enc = self._variants.get(sections)
+        if enc is None:
+            built = False
+            with self._lock:
+                enc = self._variants.get(sections)
+                if enc is None:
+                    body = b"{" + b",".join(orjson.dumps(s) + b":" + self._parts[s] for s in sections) + b"}"
+                    enc = self._variants[sections] = _encode(body)
+                    built = True
+            if built and self.on_resize is not None:
+                self.on_resize()
+        return enc
+
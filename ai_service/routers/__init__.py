@@ -1,4 +1,5 @@
 # ai_service/routers/__init__.py
-from . import health, jobs, reviews
+# Nessun import eager: i router si caricano quando servono (vedi ai_service/startup.py).
+# `from ai_service.routers import jobs` importa comunque il sottomodulo.
 
-__all__ = ["health", "jobs", "reviews"]
\ No newline at end of file
+__all__ = ["health", "jobs", "projects", "reviews"]
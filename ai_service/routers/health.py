@@ -1,12 +1,19 @@
 """
 Health check router
 """
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Query, Request, Response
 from datetime import datetime
-from typing import Dict
+from importlib.util import find_spec
+from typing import Any, Dict, Optional
+
+from ..concurrency import run_blocking
+from ..http_cache import CachePolicy, register_policy
+from ..startup import warmup, warmup_projects_from_env
 
 router = APIRouter()
 
+register_policy(r"/health(/.*)?", CachePolicy("no-store"))
+
 @router.get("/health")
 async def health_check() -> Dict[str, str]:
     """
@@ -57,11 +64,29 @@ def check_dependencies() -> bool:
     """
     Check if all required dependencies are available
     """
-    try:
-        # Check critical imports only
-        import pandas
-        import fastapi
-        import pydantic
-        return True
-    except ImportError:
-        return False
\ No newline at end of file
+    # Check critical imports only (find_spec: la probe non carica pandas)
+    return all(find_spec(name) is not None for name in ("pandas", "fastapi", "pydantic"))
+
+
+@router.get("/health/cache")
+async def cache_stats() -> Dict[str, Any]:
+    """
+    Statistiche della cache dei dati di progetto (hit/miss/eviction, byte occupati)
+    """
+    from .projects import DOCUMENT_CACHE
+    from .reviews import PROJECT_CACHE
+
+    return {**PROJECT_CACHE.stats(), "documents": DOCUMENT_CACHE.stats()}
+
+
+@router.get("/health/warmup")
+async def warmup_hook(
+    request: Request,
+    projects: Optional[str] = Query(None, description="Progetti da precaricare, separati da virgola (default WARMUP_PROJECTS)"),
+) -> Dict[str, Any]:
+    """
+    Carica router, pandas/numpy e i progetti indicati prima della prima richiesta di dati
+    (da chiamare dopo un deploy o da un cron); restituisce i tempi in ms
+    """
+    names = [p.strip() for p in projects.split(",") if p.strip()] if projects is not None else warmup_projects_from_env()
+    return await run_blocking(warmup, request.app, names)
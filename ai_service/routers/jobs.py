@@ -1,55 +1,43 @@
 # ai_service/routers/jobs.py
-from fastapi import APIRouter, HTTPException
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timezone
-import os, json, uuid, time
-import requests
-from urllib.parse import quote
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Optional, List, Dict, Any, Tuple, Union
+from datetime import datetime
+import hashlib, os, json, uuid
 
-from ..models import CreateJobRequest, CreateJobResponse, JobStatus
-from .reviews import load_reviews  # riutilizziamo logica lettura dati
+import orjson
 
+from ..concurrency import run_blocking
+from ..http_cache import CachePolicy, etag_matches, register_policy
+from ..kv import compare_set_cmd, get_kv
+from ..models import CreateJobRequest, CreateJobResponse, JobStatus, JobSummary
+from ..runner import (
+    JOB_DEDUPE_TTL_SECONDS, JOB_STATUSES, JOB_TTL_SECONDS, JOBS_INDEX_KEY, TERMINAL_STATUSES, JobRunner,
+    Progress, fingerprint_key, job_execution, job_key, parse_job, status_key, utcnow_iso,
+)
+
+# pipeline_job (multiprocessing, httpx) e reviews (pandas) si importano al primo job:
+# il router si registra senza caricarli
 router = APIRouter()
 
+# lo stato cambia di continuo: sempre rivalidato (ETag e 304 li gestisce la route)
+register_policy(r"/jobs(/.*)?", CachePolicy("no-cache"))
+
 # ----- Config KV (Vercel KV/Upstash) -------------------------
 # Vercel KV (nuovo) inietta tipicamente:
 #   KV_REST_API_URL, KV_REST_API_TOKEN
 # Upstash Redis (classico) usa:
 #   UPSTASH_REDIS_REST_URL, UPSTASH_REDIS_REST_TOKEN
-KV_URL = os.environ.get("KV_REST_API_URL") or os.environ.get("UPSTASH_REDIS_REST_URL")
-KV_TOKEN = os.environ.get("KV_REST_API_TOKEN") or os.environ.get("UPSTASH_REDIS_REST_TOKEN")
-if not KV_URL or not KV_TOKEN:
-    print("[jobs] WARNING: KV env vars missing; jobs will raise 500")
-
-JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", "86400"))  # 24h
-JOBS_INDEX_KEY = "jobs:index"  # sorted set (score=timestamp)
-
-def _kv_headers():
-    return {"Authorization": f"Bearer {KV_TOKEN}"}
+# Senza queste variabili i job rispondono 500; JOBS_KV_BACKEND=sqlite|memory sceglie uno store locale (vedi kv.py)
 
-def kv_set_json(key: str, obj: Dict[str, Any], ex: Optional[int] = None):
-    if not KV_URL or not KV_TOKEN:
+def _kv():
+    kv = get_kv()
+    if kv is None:
         raise HTTPException(status_code=500, detail="KV not configured")
-    value = json.dumps(obj, ensure_ascii=False)
-    url = f"{KV_URL}/set/{quote(key, safe='')}/{quote(value, safe='')}"
-    if ex:
-        url += f"?EX={ex}"
-    r = requests.post(url, headers=_kv_headers(), timeout=8)
-    if r.status_code >= 400:
-        raise HTTPException(status_code=500, detail=f"KV set error: {r.text}")
-    return r.json()
-
-def kv_get_json(key: str) -> Optional[Dict[str, Any]]:
-    if not KV_URL or not KV_TOKEN:
-        raise HTTPException(status_code=500, detail="KV not configured")
-    url = f"{KV_URL}/get/{quote(key, safe='')}"
-    r = requests.get(url, headers=_kv_headers(), timeout=8)
-    if r.status_code == 404:
-        return None
-    if r.status_code >= 400:
-        raise HTTPException(status_code=500, detail=f"KV get error: {r.text}")
-    data = r.json()
-    val = data.get("result")
+    return kv
+
+async def kv_get_json(key: str) -> Optional[Dict[str, Any]]:
+    val = await _kv().get(key)
     if val is None:
         return None
     try:
@@ -57,41 +45,29 @@ def kv_get_json(key: str) -> Optional[Dict[str, Any]]:
     except Exception:
         return None
 
-def kv_zadd(key: str, score: float, member: str):
-    url = f"{KV_URL}/zadd/{quote(key, safe='')}/{score}/{quote(member, safe='')}"
-    r = requests.post(url, headers=_kv_headers(), timeout=8)
-    if r.status_code >= 400:
-        raise HTTPException(status_code=500, detail=f"KV zadd error: {r.text}")
-    return r.json()
-
-def kv_zrevrange(key: str, start: int, stop: int) -> List[str]:
-    url = f"{KV_URL}/zrevrange/{quote(key, safe='')}/{start}/{stop}"
-    r = requests.get(url, headers=_kv_headers(), timeout=8)
-    if r.status_code >= 400:
-        raise HTTPException(status_code=500, detail=f"KV zrevrange error: {r.text}")
-    data = r.json()
-    res = data.get("result") or []
-    # Upstash può restituire come lista o stringa separata, normalizziamo
-    if isinstance(res, str):
-        return [res]
-    return res
-
-def utcnow_iso():
-    return datetime.now(timezone.utc).isoformat()
-
 # -------------------------------------------------------------
 
-def _analyze(project_id: str) -> Dict[str, Any]:
-    """Analisi 'on-demand' (veloce): calcola 3 stats base."""
+def _analyze(params: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    """Analisi 'on-demand' (veloce): calcola 3 stats base, riportando il progresso."""
+    options = params.get("options") or {}
+    project_id = params.get("project_id") or params.get("projectId") or options.get("project_id")
+    if not project_id:
+        raise ValueError("project_id is required in params")
+    from .reviews import load_reviews  # riutilizziamo logica lettura dati
+
+    progress(10.0, "loading reviews")
     df = load_reviews(project_id)
     total = int(len(df))
+    progress(50.0, "sentiment")
     sentiment_mean = float(df['sentiment'].mean())
+    progress(70.0, "clusters")
     top_clusters = (
-        df['clusterId'].value_counts(dropna=False)
+        df['clusterId'].value_counts()
         .head(5)
         .to_dict()
     )
-    langs = df['lang'].value_counts(dropna=False).to_dict()
+    progress(90.0, "languages")
+    langs = df['lang'].value_counts().to_dict()
     return {
         "project_id": project_id,
         "total_reviews": total,
@@ -100,10 +76,113 @@ def _analyze(project_id: str) -> Dict[str, Any]:
         "languages": langs,
     }
 
+def _job_mode(options: Optional[Dict[str, Any]]) -> str:
+    # la pipeline completa va richiesta esplicitamente: il deploy serverless (vercel.json,
+    # requirements.txt) non include pipeline/ né le sue dipendenze
+    return (options or {}).get("mode") or "summary"
+
+def _handle_job(params: Dict[str, Any], progress: Progress) -> Dict[str, Any]:
+    """options.mode: 'summary' (default) solo _analyze, 'pipeline' esegue la pipeline completa."""
+    if _job_mode(params.get("options")) == "summary":
+        return _analyze(params, progress)
+    from ..pipeline_job import run_pipeline
+
+    return run_pipeline(params, progress)
+
+JOB_EVENTS_KEEPALIVE_SEC = float(os.environ.get("JOB_EVENTS_KEEPALIVE_SEC", "15"))
+JOB_EVENTS_RETRY_MS = 2000  # attesa suggerita al client prima di riconnettersi
+
+# 2 worker: un'analisi veloce non resta in coda dietro una pipeline lunga;
+# su serverless (JOB_EXECUTION=inline) niente worker: il job gira nella richiesta
+RUNNER = JobRunner(get_kv, _handle_job, workers=int(os.environ.get("JOB_WORKERS", "2")),
+                   inline=job_execution() == "inline")
+
+FINGERPRINT_CLAIM_ATTEMPTS = 3
+
+def _fingerprint(params: Dict[str, Any], mode: str) -> Tuple[Optional[str], bool]:
+    """Impronta degli input del job (None = nessuna deduplica) e se il risultato è riusabile."""
+    if JOB_DEDUPE_TTL_SECONDS <= 0:
+        return None, False
+    if mode == "summary":
+        options = params.get("options") or {}
+        project_id = params.get("project_id") or params.get("projectId") or options.get("project_id")
+        from .reviews import PROJECT_CACHE
+
+        try:
+            version = list(PROJECT_CACHE.version(project_id)) if project_id else None
+        except HTTPException:
+            version = None
+        if version is None:
+            return None, False  # progetto inesistente: il job fallirà comunque
+        payload, memoize = {"mode": "summary", "project_id": project_id, "data": version}, True
+    else:
+        from ..pipeline_job import fingerprint_input
+
+        payload, memoize = fingerprint_input(params)
+    digest = hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return digest[:32], memoize
+
+async def _reusable_job(job_id: str, memoize: bool) -> Optional[CreateJobResponse]:
+    job = await kv_get_json(job_key(job_id))
+    if not job:
+        return None
+    if job["status"] in ("queued", "running"):
+        return CreateJobResponse(job_id=job["id"], status=job["status"], message="attached to in-flight job",
+                                 deduplicated=True)
+    if job["status"] == "completed" and memoize:
+        return CreateJobResponse(job_id=job["id"], status="completed", message="cached result",
+                                 deduplicated=True, result=job.get("result"))
+    return None
+
+def _job_status(job: Dict[str, Any]) -> JobStatus:
+    return JobStatus(
+        id=job["id"],
+        status=job["status"],
+        progress=float(job.get("progress") or 0),
+        message=job.get("message"),
+        created_at=datetime.fromisoformat(job["created_at"]),
+        updated_at=datetime.fromisoformat(job["updated_at"]),
+        completed_at=datetime.fromisoformat(job["completed_at"]) if job.get("completed_at") else None,
+        result=job.get("result"),
+        error=job.get("error"),
+        version=int(job.get("version") or 0),
+    )
+
+def _etag(job: Dict[str, Any]) -> str:
+    return f'"{job["id"]}:{int(job.get("version") or 0)}"'
+
 @router.post("/jobs/analyze", response_model=CreateJobResponse)
-async def create_analysis_job(req: CreateJobRequest) -> CreateJobResponse:
-    if not KV_URL or not KV_TOKEN:
-        raise HTTPException(status_code=500, detail="KV not configured")
+async def create_analysis_job(req: CreateJobRequest, force: bool = False) -> CreateJobResponse:
+    """
+    Job con gli stessi input (parametri normalizzati + versione dei dati) di uno in corso
+    o completato da poco non vengono rieseguiti: si restituisce quel job (deduplicated=true),
+    con il risultato se già pronto. force=true esegue comunque.
+    """
+    kv = _kv()
+    mode = _job_mode(req.options)
+    if mode not in ("pipeline", "summary"):
+        raise HTTPException(status_code=400, detail="options.mode must be 'pipeline' or 'summary'")
+    params = req.model_dump()
+    if mode == "pipeline":
+        if RUNNER.inline:
+            raise HTTPException(status_code=400, detail="pipeline jobs need a long-lived worker "
+                                                        "(JOB_EXECUTION=background)")
+        from ..pipeline_job import resolve_project_id
+
+        try:
+            resolve_project_id(params)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    fingerprint, memoize = await run_blocking(_fingerprint, params, mode)
+
+    previous: Optional[str] = None
+    if fingerprint:
+        previous = await kv.get(fingerprint_key(fingerprint))
+        if previous and not force:
+            reused = await _reusable_job(previous, memoize)
+            if reused:
+                return reused
+
     job_id = str(uuid.uuid4())
     now = utcnow_iso()
     job = {
@@ -111,82 +190,171 @@ async def create_analysis_job(req: CreateJobRequest) -> CreateJobResponse:
         "status": "queued",
         "progress": 0.0,
         "message": "queued",
-        "params": req.model_dump(),
+        "params": params,
+        "fingerprint": fingerprint,
+        "memoize": memoize,
         "result": None,
         "error": None,
         "created_at": now,
         "updated_at": now,
         "completed_at": None
     }
-    kv_set_json(f"job:{job_id}", job, ex=JOB_TTL_SECONDS)
-    kv_zadd(JOBS_INDEX_KEY, time.time(), job_id)
+    if fingerprint:
+        # l'impronta vive quanto il record; a fine job il runner la rinnova o la libera.
+        # Compare-and-set sul valore letto: tra richieste identiche in gara vince una sola
+        for _ in range(FINGERPRINT_CLAIM_ATTEMPTS):
+            swap = compare_set_cmd(fingerprint_key(fingerprint), previous, job_id, JOB_TTL_SECONDS)
+            if await kv.command(*swap) == 1:
+                break
+            previous = await kv.get(fingerprint_key(fingerprint))
+            if not force:
+                # scambio perso: ci si aggancia al job che l'ha vinto
+                reused = await _reusable_job(previous, memoize) if previous else None
+                if reused:
+                    return reused
+        else:
+            # contesa persistente: il job gira senza impronta, quella del vincitore resta intatta
+            job["fingerprint"] = None
+    # record + indice + coda; l'esecuzione avviene nel runner, non qui (salvo modalità inline)
+    await RUNNER.enqueue(job)
+    if RUNNER.inline:
+        await RUNNER.run_inline(job_id)
+        done = await kv_get_json(job_key(job_id)) or job
+        return CreateJobResponse(job_id=job_id, status=done["status"], message=done.get("message") or "",
+                                 result=done.get("result"))
     return CreateJobResponse(job_id=job_id, status="queued", message="queued")
 
+def _not_modified(request: Request, etag: str, version: Optional[int], job: Dict[str, Any]) -> bool:
+    if version is not None:
+        return version == int(job.get("version") or 0)
+    return etag_matches(request.headers.get("if-none-match"), etag)
+
 @router.get("/jobs/{job_id}", response_model=JobStatus)
-async def get_job_status(job_id: str) -> JobStatus:
-    job = kv_get_json(f"job:{job_id}")
+async def get_job_status(
+    job_id: str,
+    request: Request,
+    wait: float = Query(0, ge=0, le=60),
+    version: Optional[int] = None,
+):
+    """
+    Solo lettura del record: il lavoro e il progresso li scrive il runner.
+    Con If-None-Match (o ?version=) uguale alla versione corrente risponde 304; con
+    ?wait=N prima attende fino a N secondi un cambiamento (long-poll).
+    """
+    job = await kv_get_json(job_key(job_id))
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
+    etag = _etag(job)
+    if _not_modified(request, etag, version, job):
+        if wait > 0 and job["status"] not in TERMINAL_STATUSES:
+            job = await RUNNER.wait_for_update(job_id, int(job.get("version") or 0), wait)
+            if not job:
+                raise HTTPException(status_code=404, detail="job not found")
+            etag = _etag(job)
+        if _not_modified(request, etag, version, job):
+            return Response(status_code=304, headers={"ETag": etag})
+    return ORJSONResponse(_job_status(job).model_dump(mode="json"), headers={"ETag": etag})
 
-    status = job.get("status")
-    if status in ("queued", "running"):
-        # Esegui l'analisi al primo polling ("just-in-time")
-        try:
-            project_id = (job.get("params") or {}).get("project_id") or (job.get("params") or {}).get("projectId")
-            if not project_id:
-                raise ValueError("project_id is required in params")
-            job["status"] = "running"
-            job["progress"] = 10.0
-            job["message"] = "running"
-            job["updated_at"] = utcnow_iso()
-            kv_set_json(f"job:{job_id}", job, ex=JOB_TTL_SECONDS)
-
-            result = _analyze(project_id)
-            job["status"] = "completed"
-            job["progress"] = 100.0
-            job["message"] = "completed"
-            job["result"] = result
-            job["updated_at"] = utcnow_iso()
-            job["completed_at"] = job["updated_at"]
-            kv_set_json(f"job:{job_id}", job, ex=JOB_TTL_SECONDS)
-        except Exception as e:
-            job["status"] = "failed"
-            job["message"] = "failed"
-            job["error"] = str(e)
-            job["updated_at"] = utcnow_iso()
-            kv_set_json(f"job:{job_id}", job, ex=JOB_TTL_SECONDS)
-
-    # Response model
-    return JobStatus(
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request) -> StreamingResponse:
+    """
+    Server-sent events: un evento `status` (id = versione del record) a ogni cambiamento
+    di stato/progresso; lo stream si chiude dopo uno stato finale. Last-Event-ID salta
+    l'evento iniziale se il client ha già quella versione.
+    """
+    job = await kv_get_json(job_key(job_id))
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    last = request.headers.get("last-event-id", "")
+    seen: Optional[int] = int(last) if last.isdigit() else None
+
+    async def stream():
+        nonlocal job, seen
+        yield f"retry: {int(JOB_EVENTS_RETRY_MS)}\n\n".encode()
+        while True:
+            if job is None:
+                yield b'event: error\ndata: {"detail":"job not found"}\n\n'
+                return
+            current = int(job.get("version") or 0)
+            if current != seen:
+                seen = current
+                data = orjson.dumps(_job_status(job).model_dump(mode="json")).decode()
+                yield f"id: {current}\nevent: status\ndata: {data}\n\n".encode()
+            if job["status"] in TERMINAL_STATUSES or await request.is_disconnected():
+                return
+            job = await RUNNER.wait_for_update(job_id, current, JOB_EVENTS_KEEPALIVE_SEC)
+            if job is not None and int(job.get("version") or 0) == current:
+                yield b": keepalive\n\n"  # tiene aperti proxy e load balancer
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+@router.post("/jobs/{job_id}/run", response_model=JobStatus)
+async def run_job(job_id: str) -> JobStatus:
+    """
+    Solo modalità inline: esegue nella richiesta un job rimasto in coda (es. funzione
+    interrotta prima dell'esecuzione). Per un job non più in coda restituisce il record.
+    """
+    if not RUNNER.inline:
+        raise HTTPException(status_code=409, detail="jobs run in the background worker (JOB_EXECUTION=background)")
+    job = await kv_get_json(job_key(job_id))
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    if job["status"] == "queued":
+        await RUNNER.run_inline(job_id)
+        job = await kv_get_json(job_key(job_id)) or job
+    return _job_status(job)
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobStatus)
+async def cancel_job(job_id: str) -> JobStatus:
+    # in coda → annullato subito; in esecuzione → il runner interrompe il job al prossimo flush
+    _kv()
+    job = await RUNNER.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    return _job_status(job)
+
+def _job_summary(job: Dict[str, Any]) -> JobSummary:
+    """Proiezione compatta per le liste: niente result/params, solo i campi per una tabella."""
+    params = job.get("params") or {}
+    return JobSummary(
         id=job["id"],
         status=job["status"],
         progress=float(job.get("progress") or 0),
         message=job.get("message"),
-        created_at=datetime.fromisoformat(job["created_at"]),
-        updated_at=datetime.fromisoformat(job["updated_at"]),
-        completed_at=datetime.fromisoformat(job["completed_at"]) if job.get("completed_at") else None,
-        result=job.get("result"),
-        error=job.get("error")
+        project_id=params.get("project_id") or (job.get("result") or {}).get("project_id"),
+        mode=_job_mode(params.get("options")),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        completed_at=job.get("completed_at"),
+        error=job.get("error"),
     )
 
-@router.get("/jobs", response_model=List[JobStatus])
-async def list_jobs(limit: int = 10, offset: int = 0) -> List[JobStatus]:
-    # Legge gli ultimi job dall'indice (sorted set)
-    ids = kv_zrevrange(JOBS_INDEX_KEY, offset, offset + limit - 1)
-    out: List[JobStatus] = []
-    for job_id in ids:
-        job = kv_get_json(f"job:{job_id}")
+@router.get("/jobs", response_model=Union[List[JobStatus], List[JobSummary]])
+async def list_jobs(
+    limit: int = Query(10, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    status: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$"),
+) -> ORJSONResponse:
+    """
+    Ultimi job, dal più recente: ZREVRANGE sull'indice (o su quello dello stato) e un
+    MGET dei record, due round-trip in tutto. view=summary omette result e params.
+    """
+    if status is not None and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(JOB_STATUSES)}")
+    kv = _kv()
+    index = status_key(status) if status else JOBS_INDEX_KEY
+    ids = await kv.zrevrange(index, offset, offset + limit - 1)
+    out: List[Dict[str, Any]] = []
+    for raw in await kv.mget([job_key(i) for i in ids]):
+        job = parse_job(raw)
         if not job:
+            continue  # scaduto (TTL) ma ancora nell'indice
+        # l'indice di stato può essere un passo indietro rispetto al record
+        if status and job.get("status") != status:
             continue
-        out.append(JobStatus(
-            id=job["id"],
-            status=job["status"],
-            progress=float(job.get("progress") or 0),
-            message=job.get("message"),
-            created_at=datetime.fromisoformat(job["created_at"]),
-            updated_at=datetime.fromisoformat(job["updated_at"]),
-            completed_at=datetime.fromisoformat(job["completed_at"]) if job.get("completed_at") else None,
-            result=job.get("result"),
-            error=job.get("error")
-        ))
-    return out
+        # stesso formato (date ISO con "Z") in entrambe le viste: passano dal modello
+        item = _job_summary(job) if view == "summary" else _job_status(job)
+        out.append(item.model_dump(mode="json"))
+    return ORJSONResponse(out)
@@ -0,0 +1,65 @@
+"""
+Projects router: documento di progetto (<id>.json) pre-serializzato e pre-compresso.
+Body e ETag per ogni combinazione di sezioni sono in memoria (vedi projects.py):
+una richiesta ripetuta costa un lookup sul loop (nessun thread) e, con If-None-Match,
+un 304 senza body. Solo caricamento e compressione di una combinazione nuova vanno
+nel pool di run_blocking.
+"""
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+
+from ..cache import ProjectCache
+from ..concurrency import run_blocking
+from ..data_dir import resolve_data_dir
+from ..http_cache import etag_matches, negotiate
+from ..projects import ProjectDocument
+
+router = APIRouter()
+
+_PROJECT_ID = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def _resolve_document(project_id: str) -> Path:
+    data_dir = resolve_data_dir()
+    path = data_dir / f"{project_id}.json"
+    if not _PROJECT_ID.fullmatch(project_id) or not path.is_file():
+        raise HTTPException(status_code=404, detail=f"Project '{project_id}' not found in {data_dir}")
+    return path
+
+
+# documenti piccoli (decine di KB): cache separata da quella dei DataFrame delle recensioni
+DOCUMENT_CACHE = ProjectCache(
+    resolve=_resolve_document,
+    load=ProjectDocument.load,
+    max_bytes=int(float(os.getenv("PROJECT_DOC_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    revalidate_sec=float(os.getenv("PROJECT_CACHE_REVALIDATE_SEC", "2")),
+)
+
+
+@router.get("/projects/{project_id}")
+async def get_project(
+    project_id: str,
+    request: Request,
+    sections: Optional[str] = Query(None, description="Sezioni separate da virgola (es. clusters,aggregates)"),
+):
+    """
+    Documento di progetto (meta, aggregates, clusters, personas, timeseries),
+    intero o limitato alle sezioni richieste; gzip/br secondo Accept-Encoding.
+    """
+    doc: ProjectDocument = DOCUMENT_CACHE.peek(project_id) or await run_blocking(DOCUMENT_CACHE.get, project_id)
+    names = doc.select(s.strip() for s in sections.split(",")) if sections is not None else doc.sections
+    variant = doc.cached_variant(names) or await run_blocking(doc.variant, names)
+    encoding = negotiate(request.headers.get("accept-encoding", ""), variant.bodies)
+    etag = variant.etags[encoding]
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache", "Vary": "Accept-Encoding"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=variant.bodies[encoding], media_type="application/json", headers=headers)
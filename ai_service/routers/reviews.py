@@ -3,35 +3,34 @@ Reviews router for paginated review data with filters.
 Funziona su Vercel (Serverless) leggendo i dataset inclusi nel bundle.
 """
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import Optional, Dict, Any, Literal
 from pathlib import Path
+import base64
+import binascii
+import hashlib
 import os
-import time
 
+import orjson
 import pandas as pd
 
-from ..models import Review, ReviewPage
+from ..cache import ProjectCache, max_bytes_from_env
+from ..concurrency import run_blocking
+from ..data_dir import resolve_data_dir
+from ..http_cache import CachePolicy, data_cache_control, register_policy
+from ..export import EXPORT_CHUNK_ROWS, arrow_available, arrow_chunks, gzip_chunks, ndjson_chunks
+from ..models import ReviewPage
+from ..stats import FACET_DIMS, FacetCube, ReviewStats
+from ..store import ReviewStore
 
-# ──────────────────────────────────────────────────────────────────────────────
-# Percorso dati
-# Priorità:
-# 1) Variabile d'ambiente INSIGHTS_DATA_DIR (se impostata)
-# 2) Cartella pacchettizzata nel bundle: ai_service/_data
-# ──────────────────────────────────────────────────────────────────────────────
-DEFAULT_DATA_DIR = Path(__file__).resolve().parents[1] / "_data"  # ai_service/_data
-
-def _resolve_data_dir() -> Path:
-    env_dir = os.environ.get("INSIGHTS_DATA_DIR")
-    if env_dir:
-        p = Path(env_dir)
-        if p.exists():
-            return p
-    return DEFAULT_DATA_DIR
-
-# Cache in-memory per evitare ricarichi ripetuti (TTL 10 min)
-_CACHE: Dict[str, tuple[pd.DataFrame, float]] = {}
-CACHE_TTL_SEC = 600
+# pyarrow è opzionale: senza, si leggono solo i JSONL
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except Exception:
+    pa = None
+    feather = None
 
 router = APIRouter()
 
@@ -59,38 +58,107 @@ def _load_jsonl(path: Path) -> pd.DataFrame:
     return df
 
 
-def load_reviews(project_id: str) -> pd.DataFrame:
+def _load_arrow(path: Path) -> pd.DataFrame:
     """
-    Carica il dataset <project_id>_reviews.jsonl da:
-      - $INSIGHTS_DATA_DIR se esiste
-      - altrimenti ai_service/_data dentro il bundle
-    Usa una cache in-memory con TTL.
+    Legge l'artefatto Arrow IPC (Feather v2) scritto dalla pipeline, in memory-map:
+    le stringhe restano buffer Arrow (string[pyarrow]) e le colonne dictionary-encoded
+    diventano Categorical, senza parsing JSON né cast.
     """
-    now = time.time()
-    if project_id in _CACHE:
-        df, ts = _CACHE[project_id]
-        if now - ts < CACHE_TTL_SEC:
-            return df
+    try:
+        table = feather.read_table(str(path), memory_map=True)
+        df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading data file {path.name}: {e}")
+    if "date" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["date"]):
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    return df
+
+
+def _data_file(data_dir: Path, project_id: str) -> Optional[Path]:
+    """Preferisce <project_id>_reviews.arrow (se pyarrow c'è e non è più vecchio del JSONL)."""
+    jsonl = data_dir / f"{project_id}_reviews.jsonl"
+    arrow = data_dir / f"{project_id}_reviews.arrow"
+    if feather is not None and arrow.exists():
+        if not jsonl.exists() or arrow.stat().st_mtime >= jsonl.stat().st_mtime:
+            return arrow
+    return jsonl if jsonl.exists() else None
 
-    data_dir = _resolve_data_dir()
-    data_file = data_dir / f"{project_id}_reviews.jsonl"
 
-    if not data_file.exists():
+def _resolve_project_file(project_id: str) -> Path:
+    data_dir = resolve_data_dir()
+    data_file = _data_file(data_dir, project_id)
+    if data_file is None:
         # Messaggio 404 chiaro (evita i vecchi path multipli e ambigui)
         raise HTTPException(
             status_code=404,
             detail=f"Reviews data not found for project '{project_id}' in {data_dir}"
         )
+    return data_file
+
+
+def _load_project_file(path: Path) -> pd.DataFrame:
+    return _load_arrow(path) if path.suffix == ".arrow" else _load_jsonl(path)
+
+
+# Cache LRU con budget di memoria e rivalidazione su mtime/size (vedi cache.py)
+PROJECT_CACHE = ProjectCache(
+    resolve=_resolve_project_file,
+    load=_load_project_file,
+    max_bytes=max_bytes_from_env(),
+    revalidate_sec=float(os.getenv("PROJECT_CACHE_REVALIDATE_SEC", "2")),
+)
+
+
+def _data_version(query: Dict[str, str]) -> Optional[str]:
+    """Versione (path, mtime, size) del file del progetto: una stat, senza caricare i dati."""
+    project_id = query.get("projectId")
+    return "|".join(map(str, PROJECT_CACHE.version(project_id))) if project_id else None
+
+
+# pagine, statistiche e facet dipendono solo da file e query: ETag + edge cache dei CDN
+# (l'export in streaming resta fuori: niente cache per download potenzialmente enormi)
+register_policy(r"/reviews(/stats|/facets)?", CachePolicy(data_cache_control(), version=_data_version))
+
+
+def load_reviews(project_id: str) -> pd.DataFrame:
+    """
+    Carica il dataset <project_id>_reviews.arrow (o .jsonl) da:
+      - $INSIGHTS_DATA_DIR se esiste
+      - altrimenti ai_service/_data dentro il bundle
+    Passa dalla cache di progetto: il file viene riletto solo se è cambiato.
+    """
+    return PROJECT_CACHE.get(project_id)
+
+
+def load_store(project_id: str) -> ReviewStore:
+    """ReviewStore del progetto, legato alla versione del file in cache."""
+    return PROJECT_CACHE.derived(project_id, "store", ReviewStore)
+
+
+def load_stats(project_id: str) -> ReviewStats:
+    """Aggregati pre-calcolati del progetto (ricalcolati solo se il file cambia)."""
+    return PROJECT_CACHE.derived(project_id, "stats", ReviewStats)
 
-    df = _load_jsonl(data_file)
-    _CACHE[project_id] = (df, now)
-    return df
+
+def load_facets(project_id: str) -> FacetCube:
+    """Cubo delle faccette del progetto (ricalcolato solo se il file cambia)."""
+    return PROJECT_CACHE.derived(project_id, "facets", FacetCube)
+
+
+def _parse_date(value: Optional[str]) -> Optional[pd.Timestamp]:
+    # date non valide vengono ignorate (come prima)
+    if not value:
+        return None
+    try:
+        return pd.to_datetime(value)
+    except Exception:
+        return None
 
 
 @router.get("/reviews", response_model=ReviewPage)
 async def get_reviews(
     projectId: str = Query(..., description="Project ID (es: airbnb, mobile, ecommerce)"),
-    q: Optional[str] = Query(None, description="Full-text search"),
+    q: Optional[str] = Query(None, description="Full-text search (word prefixes, AND, case/accent-insensitive)"),
     clusterId: Optional[str] = Query(None, description="Filter by cluster ID"),
     lang: Optional[str] = Query(None, description="Filter by language"),
     ratingMin: Optional[int] = Query(None, ge=1, le=5, description="Minimum rating"),
@@ -103,92 +171,298 @@ async def get_reviews(
     order: Literal["asc", "desc"] = Query("desc", description="Sort order"),
     page: int = Query(1, ge=1, description="Page number"),
     pageSize: int = Query(50, ge=1, le=200, description="Page size"),
-) -> ReviewPage:
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous nextCursor (replaces page)"),
+) -> ORJSONResponse:
+    # filtri, ordinamento e serializzazione girano nel pool: il loop resta libero
+    return await run_blocking(
+        _reviews_page, projectId, q, clusterId, lang, ratingMin, ratingMax,
+        sentimentMin, sentimentMax, dateFrom, dateTo, sort, order, page, pageSize, cursor,
+    )
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Cursori (keyset pagination)
+# Il cursore è opaco: base64url di {sort, order, filtri, riga, id, valore di sort}
+# dell'ultima recensione restituita. Si riparte dalla sua posizione nella permutazione
+# pre-ordinata; se il file è cambiato (riga/id/valore non combaciano) il cursore è scaduto.
+# ──────────────────────────────────────────────────────────────────────────────
+def _filters_digest(*filters: Any) -> str:
+    return hashlib.blake2b(orjson.dumps(filters), digest_size=6).hexdigest()
+
+
+def _encode_cursor(payload: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b"=").decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
     try:
-        df = load_reviews(projectId)
+        payload = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(payload, dict) or not {"s", "o", "f", "r", "id"} <= payload.keys():
+            raise ValueError("missing fields")
+        return payload
+    except (ValueError, binascii.Error, orjson.JSONDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _cursor_position(store: ReviewStore, cursor: str, sort: str, order: str, digest: str) -> int:
+    c = _decode_cursor(cursor)
+    if c["s"] != sort or c["o"] != order or c["f"] != digest:
+        raise HTTPException(status_code=400, detail="Cursor does not match the current sort/filters")
+    row = c["r"]
+    if (
+        not isinstance(row, int) or not 0 <= row < store.n
+        or store.row_id(row) != c["id"] or store.sort_value(row, sort) != c.get("k")
+    ):
+        raise HTTPException(status_code=400, detail="Cursor expired (data changed); restart from the first page")
+    return store.position(row, sort, order)
+
+
+def _select_rows(store: ReviewStore, q, clusterId, lang, ratingMin, ratingMax, sentimentMin, sentimentMax, dateFrom, dateTo):
+    # Filtri sugli indici dello store (nessuna copia del DataFrame); None = tutte le righe
+    rows = store.select(
+        clusterId=clusterId,
+        lang=lang,
+        ratingMin=ratingMin,
+        ratingMax=ratingMax,
+        sentimentMin=sentimentMin,
+        sentimentMax=sentimentMax,
+        dateFrom=_parse_date(dateFrom),
+        dateTo=_parse_date(dateTo),
+    )
+    if q and "text" in store.df.columns:
+        rows = store.search(q, rows)
+    return rows
+
+
+def _reviews_page(
+    projectId: str,
+    q: Optional[str],
+    clusterId: Optional[str],
+    lang: Optional[str],
+    ratingMin: Optional[int],
+    ratingMax: Optional[int],
+    sentimentMin: Optional[float],
+    sentimentMax: Optional[float],
+    dateFrom: Optional[str],
+    dateTo: Optional[str],
+    sort: str,
+    order: str,
+    page: int,
+    pageSize: int,
+    cursor: Optional[str] = None,
+) -> ORJSONResponse:
+    try:
+        store = load_store(projectId)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading reviews: {e}")
+    rows = _select_rows(store, q, clusterId, lang, ratingMin, ratingMax, sentimentMin, sentimentMax, dateFrom, dateTo)
 
-    # Filtri
-    if q and "text" in df.columns:
-        df = df[df["text"].str.contains(q, case=False, na=False)]
-    if clusterId and "clusterId" in df.columns:
-        df = df[df["clusterId"] == clusterId]
-    if lang and "lang" in df.columns:
-        df = df[df["lang"] == lang]
-    if ratingMin is not None and "rating" in df.columns:
-        df = df[df["rating"] >= ratingMin]
-    if ratingMax is not None and "rating" in df.columns:
-        df = df[df["rating"] <= ratingMax]
-    if sentimentMin is not None and "sentiment" in df.columns:
-        df = df[df["sentiment"] >= sentimentMin]
-    if sentimentMax is not None and "sentiment" in df.columns:
-        df = df[df["sentiment"] <= sentimentMax]
-    if dateFrom and "date" in df.columns:
-        try:
-            df = df[df["date"] >= pd.to_datetime(dateFrom)]
-        except Exception:
-            pass
-    if dateTo and "date" in df.columns:
+    # Ordinamento + paginazione sulle permutazioni pre-calcolate
+    digest = _filters_digest(q, clusterId, lang, ratingMin, ratingMax, sentimentMin, sentimentMax, dateFrom, dateTo)
+    total = store.n if rows is None else len(rows)
+    if cursor:
+        position = _cursor_position(store, cursor, sort, order, digest)
+        # una riga in più per sapere se esiste una pagina successiva
+        page_idx = store.after(rows, sort, order, position, pageSize + 1)
+        has_more = len(page_idx) > pageSize
+        page_idx = page_idx[:pageSize]
+    else:
+        start = (page - 1) * pageSize
+        total, page_idx = store.page(rows, sort, order, start, pageSize)
+        has_more = start + len(page_idx) < total
+
+    # Cursore verso la pagina successiva (a partire dall'ultima riga restituita)
+    next_cursor = None
+    if has_more and len(page_idx):
+        last = int(page_idx[-1])
+        next_cursor = _encode_cursor({
+            "s": sort, "o": order, "f": digest, "r": last,
+            "id": store.row_id(last), "k": store.sort_value(last, sort),
+        })
+
+    # Serializzazione per colonne + orjson: niente iterrows né ri-validazione pydantic
+    items = store.records(page_idx, projectId)
+    return ORJSONResponse({
+        "total": total,
+        "page": None if cursor else page,
+        "pageSize": pageSize,
+        "items": items,
+        "nextCursor": next_cursor,
+    })
+
+
+@router.get("/reviews/export")
+async def export_reviews(
+    request: Request,
+    projectId: str = Query(..., description="Project ID"),
+    format: Literal["ndjson", "arrow"] = Query("ndjson", description="ndjson (one review per line) or arrow (Arrow IPC stream)"),
+    q: Optional[str] = Query(None, description="Full-text search (word prefixes, AND, case/accent-insensitive)"),
+    clusterId: Optional[str] = Query(None, description="Filter by cluster ID"),
+    lang: Optional[str] = Query(None, description="Filter by language"),
+    ratingMin: Optional[int] = Query(None, ge=1, le=5, description="Minimum rating"),
+    ratingMax: Optional[int] = Query(None, ge=1, le=5, description="Maximum rating"),
+    sentimentMin: Optional[float] = Query(-1.0, ge=-1, le=1, description="Minimum sentiment"),
+    sentimentMax: Optional[float] = Query(1.0, ge=-1, le=1, description="Maximum sentiment"),
+    dateFrom: Optional[str] = Query(None, description="Start date (YYYY-MM-DD or ISO)"),
+    dateTo: Optional[str] = Query(None, description="End date (YYYY-MM-DD or ISO)"),
+    sort: Literal["date", "sentiment", "rating"] = Query("date", description="Sort field"),
+    order: Literal["asc", "desc"] = Query("desc", description="Sort order"),
+) -> StreamingResponse:
+    if format == "arrow" and not arrow_available():
+        raise HTTPException(status_code=400, detail="Arrow export requires pyarrow on the server; use format=ndjson")
+
+    def select():
         try:
-            df = df[df["date"] <= pd.to_datetime(dateTo)]
-        except Exception:
-            pass
-
-    # Ordinamento (fallback su 'sentiment' se manca la colonna richiesta)
-    sort_col = sort if sort in df.columns else ("sentiment" if "sentiment" in df.columns else None)
-    if sort_col:
-        df = df.sort_values(by=sort_col, ascending=(order == "asc"))
-
-    # Paginazione
-    total = int(len(df))
-    start = (page - 1) * pageSize
-    end = start + pageSize
-    page_df = df.iloc[start:end]
-
-    # Serializzazione
-    items = []
-    for _, row in page_df.iterrows():
-        items.append(
-            Review(
-                id=str(row.get("id", "")),
-                text=str(row.get("text", "")),
-                clusterId=(row.get("clusterId") if pd.notna(row.get("clusterId")) else None),
-                clusterLabel=(row.get("clusterLabel") if pd.notna(row.get("clusterLabel")) else None),
-                sentiment=float(row.get("sentiment")) if pd.notna(row.get("sentiment")) else 0.0,
-                lang=str(row.get("lang", "unknown")),
-                date=row.get("date").strftime("%Y-%m-%d") if ("date" in row and pd.notna(row.get("date"))) else None,
-                rating=float(row.get("rating")) if ("rating" in row and pd.notna(row.get("rating"))) else None,
-                sourceId=str(row.get("sourceId", "")),
-                projectId=str(row.get("projectId", projectId)),
-            )
-        )
+            store = load_store(projectId)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error loading reviews: {e}")
+        rows = _select_rows(store, q, clusterId, lang, ratingMin, ratingMax, sentimentMin, sentimentMax, dateFrom, dateTo)
+        return store, rows
 
-    return ReviewPage(total=total, page=page, pageSize=pageSize, items=items)
+    store, rows = await run_blocking(select)
+    total = store.n if rows is None else len(rows)
 
+    # blocchi generati e serializzati on demand mentre il client legge
+    chunks = store.iter_ordered(rows, sort, order, EXPORT_CHUNK_ROWS)
+    if format == "arrow":
+        body = arrow_chunks(store, chunks, projectId)
+        media_type, ext = "application/vnd.apache.arrow.stream", "arrows"
+    else:
+        body = ndjson_chunks(store, chunks, projectId)
+        media_type, ext = "application/x-ndjson", "ndjson"
 
-@router.get("/reviews/stats")
-async def get_review_stats(projectId: str = Query(..., description="Project ID")) -> Dict[str, Any]:
-    df = load_reviews(projectId)
-
-    def safe_vc(col: str) -> Dict[str, int]:
-        return df[col].value_counts(dropna=False).to_dict() if col in df.columns else {}
-
-    payload: Dict[str, Any] = {
-        "total": int(len(df)),
-        "languages": safe_vc("lang"),
-        "clusters": safe_vc("clusterId"),
-        "sentiment": {
-            "mean": float(df["sentiment"].mean()) if "sentiment" in df.columns else None,
-            "std": float(df["sentiment"].std()) if "sentiment" in df.columns else None,
-            "min": float(df["sentiment"].min()) if "sentiment" in df.columns else None,
-            "max": float(df["sentiment"].max()) if "sentiment" in df.columns else None,
-        },
-        "rating": {
-            "mean": float(df["rating"].mean()) if "rating" in df.columns else None,
-            "distribution": safe_vc("rating"),
-        },
+    headers = {
+        "Content-Disposition": f'attachment; filename="{projectId}_reviews.{ext}"',
+        "X-Total-Count": str(total),
+        "Vary": "Accept-Encoding",
     }
-    return payload
+    if "gzip" in request.headers.get("accept-encoding", "").lower():
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+@router.get("/reviews/stats")
+async def get_review_stats(
+    projectId: str = Query(..., description="Project ID"),
+    q: Optional[str] = Query(None, description="Full-text search (word prefixes, AND, case/accent-insensitive)"),
+    clusterId: Optional[str] = Query(None, description="Filter by cluster ID"),
+    lang: Optional[str] = Query(None, description="Filter by language"),
+    ratingMin: Optional[int] = Query(None, ge=1, le=5, description="Minimum rating"),
+    ratingMax: Optional[int] = Query(None, ge=1, le=5, description="Maximum rating"),
+    sentimentMin: Optional[float] = Query(None, ge=-1, le=1, description="Minimum sentiment"),
+    sentimentMax: Optional[float] = Query(None, ge=-1, le=1, description="Maximum sentiment"),
+    dateFrom: Optional[str] = Query(None, description="Start date (YYYY-MM-DD or ISO)"),
+    dateTo: Optional[str] = Query(None, description="End date (YYYY-MM-DD or ISO)"),
+) -> Dict[str, Any]:
+    return await run_blocking(
+        _review_stats, projectId, q, clusterId, lang, ratingMin, ratingMax,
+        sentimentMin, sentimentMax, dateFrom, dateTo,
+    )
+
+
+def _review_stats(
+    projectId: str,
+    q: Optional[str] = None,
+    clusterId: Optional[str] = None,
+    lang: Optional[str] = None,
+    ratingMin: Optional[int] = None,
+    ratingMax: Optional[int] = None,
+    sentimentMin: Optional[float] = None,
+    sentimentMax: Optional[float] = None,
+    dateFrom: Optional[str] = None,
+    dateTo: Optional[str] = None,
+) -> Dict[str, Any]:
+    try:
+        stats = load_stats(projectId)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading reviews: {e}")
+    date_from, date_to = _parse_date(dateFrom), _parse_date(dateTo)
+
+    # cluster/lang/rating/date: risposta dalle celle pre-aggregate
+    if not stats.needs_rows(q, sentimentMin, sentimentMax, date_from, date_to):
+        return stats.summary(clusterId, lang, ratingMin, ratingMax, date_from, date_to)
+
+    # q / sentiment / date con orario: righe dallo store, aggregate sui codici
+    store = load_store(projectId)
+    rows = store.select(
+        clusterId=clusterId, lang=lang, ratingMin=ratingMin, ratingMax=ratingMax,
+        sentimentMin=sentimentMin, sentimentMax=sentimentMax, dateFrom=date_from, dateTo=date_to,
+    )
+    if q and "text" in store.df.columns:
+        rows = store.search(q, rows)
+    return stats.summary_rows(rows)
+
+
+@router.get("/reviews/facets")
+async def get_review_facets(
+    projectId: str = Query(..., description="Project ID"),
+    by: str = Query("clusterId", description=f"Comma-separated group-by dimensions: {', '.join(FACET_DIMS)}"),
+    q: Optional[str] = Query(None, description="Full-text search (word prefixes, AND, case/accent-insensitive)"),
+    clusterId: Optional[str] = Query(None, description="Filter by cluster ID"),
+    lang: Optional[str] = Query(None, description="Filter by language"),
+    ratingMin: Optional[int] = Query(None, ge=1, le=5, description="Minimum rating"),
+    ratingMax: Optional[int] = Query(None, ge=1, le=5, description="Maximum rating"),
+    sentimentMin: Optional[float] = Query(None, ge=-1, le=1, description="Minimum sentiment"),
+    sentimentMax: Optional[float] = Query(None, ge=-1, le=1, description="Maximum sentiment"),
+    dateFrom: Optional[str] = Query(None, description="Start date (YYYY-MM-DD or ISO)"),
+    dateTo: Optional[str] = Query(None, description="End date (YYYY-MM-DD or ISO)"),
+) -> Dict[str, Any]:
+    dims = [d.strip() for d in by.split(",") if d.strip()]
+    unknown = [d for d in dims if d not in FACET_DIMS]
+    if unknown or len(set(dims)) != len(dims):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid 'by' dimensions {unknown or dims}; allowed: {', '.join(FACET_DIMS)}",
+        )
+    return await run_blocking(
+        _review_facets, projectId, dims, q, clusterId, lang, ratingMin, ratingMax,
+        sentimentMin, sentimentMax, dateFrom, dateTo,
+    )
+
+
+def _review_facets(
+    projectId: str,
+    by: list,
+    q: Optional[str] = None,
+    clusterId: Optional[str] = None,
+    lang: Optional[str] = None,
+    ratingMin: Optional[int] = None,
+    ratingMax: Optional[int] = None,
+    sentimentMin: Optional[float] = None,
+    sentimentMax: Optional[float] = None,
+    dateFrom: Optional[str] = None,
+    dateTo: Optional[str] = None,
+) -> Dict[str, Any]:
+    try:
+        cube = load_facets(projectId)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading reviews: {e}")
+    filters = dict(
+        clusterId=clusterId, lang=lang, ratingMin=ratingMin, ratingMax=ratingMax,
+        sentimentMin=sentimentMin, sentimentMax=sentimentMax,
+        dateFrom=_parse_date(dateFrom), dateTo=_parse_date(dateTo),
+    )
+
+    # filtri allineati ai bucket: solo maschere sulle celle del cubo
+    mask = None if q else cube.cell_mask(**filters)
+    if mask is not None:
+        out = cube.facets(by, cube.cells, mask)
+        source = "cube"
+    else:
+        # q / estremi non allineati: righe dallo store, riaggregate per cella
+        store = load_store(projectId)
+        rows = store.select(**filters)
+        if q and "text" in store.df.columns:
+            rows = store.search(q, rows)
+        out = cube.facets(by, cube.measures_for_rows(rows))
+        source = "rows"
+    return {"total": out["total"], "by": by, "source": source, "facets": out["facets"]}
@@ -0,0 +1,510 @@
+"""
+Esecuzione dei job fuori banda.
+- POST /jobs/analyze salva il record e mette l'id in coda (lista KV, RPUSH).
+- I worker del runner (task asyncio nel processo API) spostano gli id dalla coda alla
+  lista dei job in lavorazione (LMOVE) e li rivendicano con un lock KV (SET NX EX): un job
+  viene eseguito da un solo worker anche con più istanze o se lo stesso id finisce in
+  coda due volte. L'id lascia la lista di lavorazione solo alla chiusura del job.
+- Il reaper (un task per processo, ogni JOB_REAP_SEC) rimette in coda gli id rimasti in
+  lavorazione senza lock: worker terminato tra LMOVE e lock, o durante l'esecuzione
+  (il lock è rinnovato a ogni flush, quindi scade solo se il worker non c'è più).
+- Il lavoro gira fuori dall'event loop, in thread propri del runner (uno per worker, non
+  quelli del pool delle richieste: un job può durare minuti); il progresso riportato dall'handler viene
+  scritto sul record a intervalli (JOB_PROGRESS_FLUSH_SEC), rinnovando il lock.
+- Ogni passaggio di stato (enqueue, presa in carico, flush del progresso, chiusura) è
+  un solo round-trip KV (pipeline/multi-exec).
+- GET /jobs/{id} legge solo il record: il polling è O(1) e non esegue nulla.
+- I worker sono task del processo API: servono un processo che resti vivo (uvicorn,
+  container). Su serverless (Vercel, maxDuration 60 s) il processo viene congelato tra
+  le richieste, quindi JOB_EXECUTION=inline (default se VERCEL è impostata) esegue il job
+  dentro la richiesta che lo crea, senza worker; un job rimasto in coda lo esegue
+  POST /jobs/{id}/run (run_inline).
+- Ogni scrittura incrementa job.version; il runner notifica in-process (JobNotifier) chi
+  attende un cambiamento (SSE /jobs/{id}/events, long-poll). Per i job eseguiti da un
+  altro processo l'attesa ricade su una lettura KV ogni JOB_EVENTS_POLL_SEC.
+- Ogni scrittura del record è un compare-and-set sulla versione (versioned_set_cmd) e
+  porta con sé i comandi che dipendono dal nuovo stato (indici, impronta, lock, coda):
+  due scrittori in gara non si sovrascrivono e nessuna versione si ripete.
+- POST /jobs/{id}/cancel: un job in coda viene marcato subito; per uno in esecuzione si
+  scrive job:<id>:cancel, che il worker controlla a ogni flush e inoltra all'handler
+  (Progress.cancelled), che interrompe il lavoro sollevando JobCancelledError; il record
+  di un job in esecuzione lo scrive solo il worker ("cancelling", poi "cancelled").
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import anyio
+import anyio.to_thread
+
+from .kv import JobStore, set_cmd, versioned_set_cmd
+
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", "86400"))  # 24h
+JOBS_INDEX_KEY = "jobs:index"  # sorted set (score=timestamp)
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+JOBS_QUEUE_KEY = "jobs:queue"  # lista FIFO di job id
+JOBS_PROCESSING_KEY = "jobs:processing"  # id prelevati da un worker, fino alla chiusura del job
+JOBS_REAPER_KEY = "jobs:reaper"  # lock: un solo reaper per giro tra le istanze
+JOB_REAP_SEC = float(os.environ.get("JOB_REAP_SEC", "30"))
+JOB_LOCK_SEC = int(os.environ.get("JOB_LOCK_SEC", "120"))
+JOB_POLL_SEC = float(os.environ.get("JOB_POLL_SEC", "2"))
+JOB_PROGRESS_FLUSH_SEC = float(os.environ.get("JOB_PROGRESS_FLUSH_SEC", "0.5"))
+# per quanto un risultato completato viene riusato da job identici (0 = niente deduplica)
+JOB_DEDUPE_TTL_SECONDS = int(os.environ.get("JOB_DEDUPE_TTL_SECONDS", "3600"))
+JOB_EVENTS_POLL_SEC = float(os.environ.get("JOB_EVENTS_POLL_SEC", "1"))
+# job eseguiti da questo processo: le notifiche locali bastano, la rilettura è solo di sicurezza
+JOB_EVENTS_LOCAL_POLL_SEC = 15.0
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def job_execution() -> str:
+    """JOB_EXECUTION: background (worker nel processo) | inline (nella richiesta); auto = inline su Vercel."""
+    mode = os.environ.get("JOB_EXECUTION", "auto").lower()
+    if mode == "auto":
+        return "inline" if os.environ.get("VERCEL") else "background"
+    return mode
+
+
+def utcnow_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def lock_key(job_id: str) -> str:
+    return f"{job_key(job_id)}:lock"
+
+
+def status_key(status: str) -> str:
+    """Indice secondario per stato (sorted set, stesso score di jobs:index)."""
+    return f"jobs:status:{status}"
+
+
+def fingerprint_key(fingerprint: str) -> str:
+    """job:fp:<impronta> → id dell'ultimo job con quegli input (in corso o riusabile)."""
+    return f"job:fp:{fingerprint}"
+
+
+def job_score(job: Dict[str, Any]) -> float:
+    return datetime.fromisoformat(job["created_at"]).timestamp()
+
+
+async def load_job(kv, job_id: str) -> Optional[Dict[str, Any]]:
+    return parse_job(await kv.get(job_key(job_id)))
+
+
+def save_job_cmd(job: Dict[str, Any], then: Sequence[Sequence[Any]] = ()) -> List[Any]:
+    """
+    Scrittura del record come compare-and-set sulla versione letta (risultato 1, o 0 se nel
+    frattempo l'ha cambiato qualcun altro); i comandi di `then` girano solo se riesce.
+    """
+    expected = int(job.get("version") or 0)
+    job["updated_at"] = utcnow_iso()
+    job["version"] = expected + 1
+    return versioned_set_cmd(job_key(job["id"]), json.dumps(job, ensure_ascii=False), expected,
+                             ex=JOB_TTL_SECONDS, then=then)
+
+
+def parse_job(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except Exception:
+        return None
+
+
+def status_cmds(job: Dict[str, Any], prev: Optional[str]) -> List[List[Any]]:
+    """Sposta il job nell'indice del nuovo stato (prev=None: job nuovo)."""
+    cmds: List[List[Any]] = []
+    if prev is not None and prev != job["status"]:
+        cmds.append(["ZREM", status_key(prev), job["id"]])
+    if prev != job["status"]:
+        cmds.append(["ZADD", status_key(job["status"]), job_score(job), job["id"]])
+    return cmds
+
+
+def trim_cmds(now: float) -> List[List[Any]]:
+    """Toglie dagli indici i job più vecchi del TTL (i record sono già scaduti)."""
+    cutoff = now - JOB_TTL_SECONDS
+    return [["ZREMRANGEBYSCORE", k, "-inf", cutoff]
+            for k in (JOBS_INDEX_KEY, *(status_key(st) for st in JOB_STATUSES))]
+
+
+async def save_job(kv, job: Dict[str, Any], prev: Optional[str] = None) -> bool:
+    """Salva il record spostandolo nell'indice del nuovo stato; False se la versione è cambiata."""
+    return (await kv.command(*save_job_cmd(job, then=status_cmds(job, prev or job["status"])))) == 1
+
+
+class JobCancelledError(Exception):
+    pass
+
+
+def cancel_key(job_id: str) -> str:
+    return f"{job_key(job_id)}:cancel"
+
+
+class Progress:
+    """Progresso condiviso tra il thread del job e il worker asyncio che lo pubblica."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: Optional[Tuple[float, Optional[str]]] = None
+        self.cancelled = threading.Event()
+
+    def __call__(self, progress: float, message: Optional[str] = None) -> None:
+        with self._lock:
+            self._state = (max(0.0, min(100.0, float(progress))), message)
+
+    def take(self) -> Optional[Tuple[float, Optional[str]]]:
+        with self._lock:
+            state, self._state = self._state, None
+        return state
+
+
+class _Subscription:
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.latest: Optional[Dict[str, Any]] = None
+
+
+class JobNotifier:
+    """Pub/sub in-process: chi scrive un record lo pubblica, chi aspetta quel job si sveglia."""
+
+    def __init__(self):
+        self._subs: Dict[str, List[_Subscription]] = {}
+
+    def subscribe(self, job_id: str) -> _Subscription:
+        sub = _Subscription()
+        self._subs.setdefault(job_id, []).append(sub)
+        return sub
+
+    def unsubscribe(self, job_id: str, sub: _Subscription) -> None:
+        subs = self._subs.get(job_id, [])
+        if sub in subs:
+            subs.remove(sub)
+        if not subs:
+            self._subs.pop(job_id, None)
+
+    def publish(self, job: Dict[str, Any]) -> None:
+        for sub in self._subs.get(job["id"], ()):
+            sub.latest = dict(job)
+            sub.event.set()
+
+
+# handler(params, progress) -> result, eseguito fuori dall'event loop
+Handler = Callable[[Dict[str, Any], Progress], Dict[str, Any]]
+
+
+class JobRunner:
+    def __init__(self, kv_factory: Callable[[], Optional[JobStore]], handler: Handler, workers: int = 1,
+                 inline: bool = False):
+        self._kv_factory = kv_factory
+        self._handler = handler
+        self.workers = max(1, workers)
+        self.inline = inline  # nessun worker: i job girano in run_inline
+        self._suspects: Set[str] = set()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+        self.notifier = JobNotifier()
+        self._running: set = set()  # job in esecuzione in questo processo
+
+    # ---------------- ciclo di vita ----------------
+    def ensure_started(self) -> None:
+        """Avvia i worker sul loop corrente (idempotente; riavvia se il loop è cambiato)."""
+        if self.inline:
+            return
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and any(not t.done() for t in self._tasks):
+            return
+        self._loop = loop
+        self._wake = asyncio.Event()
+        self._limiter = anyio.CapacityLimiter(self.workers)
+        self._tasks = [loop.create_task(self._worker(), name=f"job-worker-{i}") for i in range(self.workers)]
+        self._tasks.append(loop.create_task(self._reaper(), name="job-reaper"))
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def enqueue(self, job: Dict[str, Any]) -> None:
+        kv = self._kv_factory()
+        # record + indici + coda in una transazione (un solo round-trip)
+        await kv.multi([
+            save_job_cmd(job),
+            ["ZADD", JOBS_INDEX_KEY, job_score(job), job["id"]],
+            *status_cmds(job, None),
+            ["RPUSH", JOBS_QUEUE_KEY, job["id"]],
+            *trim_cmds(time.time()),
+        ])
+        self.notifier.publish(job)
+        self.ensure_started()
+        self.wake()
+
+    async def run_inline(self, job_id: str) -> None:
+        """
+        Esegue il job nella richiesta corrente, se è ancora in coda (modalità inline). Come
+        per i worker l'id passa dalla coda alla lista di lavorazione; poi un giro del reaper.
+        """
+        kv = self._kv_factory()
+        removed, _ = await kv.multi([["LREM", JOBS_QUEUE_KEY, 1, job_id], ["RPUSH", JOBS_PROCESSING_KEY, job_id]])
+        if removed:
+            await self._run(kv, job_id)
+        else:
+            await kv.command("LREM", JOBS_PROCESSING_KEY, 1, job_id)  # preso da un'altra richiesta
+        self._suspects = await self.reap(self._suspects)
+
+    # ---------------- worker ----------------
+    async def _worker(self) -> None:
+        while True:
+            try:
+                kv = self._kv_factory()
+                job_id = await kv.lmove(JOBS_QUEUE_KEY, JOBS_PROCESSING_KEY) if kv is not None else None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[jobs] queue error: {e}")
+                job_id = None
+            if job_id is None:
+                # coda vuota: attende un enqueue locale o il prossimo giro di polling
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=JOB_POLL_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(kv, job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[jobs] job {job_id} crashed: {e}")
+
+    async def _run(self, kv, job_id: str) -> None:
+        lock = lock_key(job_id)
+        # lock + record + richiesta di annullo in un solo round-trip
+        locked, raw, cancel = await kv.pipeline([
+            set_cmd(lock, self.worker_id, ex=JOB_LOCK_SEC, nx=True),
+            ["GET", job_key(job_id)],
+            ["GET", cancel_key(job_id)],
+        ])
+        if locked != "OK":
+            # id duplicato, già rivendicato da un altro worker: si toglie solo questa copia
+            await kv.command("LREM", JOBS_PROCESSING_KEY, 1, job_id)
+            return
+        job = parse_job(raw)
+        # rilascio di lock, annullo e lista di lavorazione: con l'ultima scrittura del record
+        release: List[List[Any]] = [["DEL", lock], ["DEL", cancel_key(job_id)],
+                                    ["LREM", JOBS_PROCESSING_KEY, 1, job_id]]
+        final: Optional[List[Any]] = None  # scrittura finale (compare-and-set), se serve
+        owned = True  # False se il record è cambiato sotto il worker (es. rimesso in coda dal reaper)
+        progress = Progress()
+        task: Optional[asyncio.Future] = None
+        self._running.add(job_id)
+        try:
+            if not job or job.get("status") != "queued":
+                return
+            if cancel is not None:
+                job.update(status="cancelled", message="cancelled", completed_at=utcnow_iso())
+                final = save_job_cmd(job, then=[*status_cmds(job, "queued"), *self._fingerprint_cmds(job), *release])
+                return
+            job.update(status="running", progress=0.0, message="running")
+            if not await save_job(kv, job, prev="queued"):
+                # annullato tra la lettura e la presa in carico
+                job = await load_job(kv, job_id)
+                if job and job.get("status") == "queued":
+                    release.append(["RPUSH", JOBS_QUEUE_KEY, job_id])
+                job = None
+                return
+            self.notifier.publish(job)
+
+            call = functools.partial(self._handler, job.get("params") or {}, progress)
+            task = asyncio.ensure_future(anyio.to_thread.run_sync(call, limiter=self._limiter))
+            dirty = False  # record da riscrivere al prossimo flush
+            while not task.done():
+                await asyncio.wait({task}, timeout=JOB_PROGRESS_FLUSH_SEC)
+                if task.done():
+                    break
+                # progresso + rinnovo del lock + controllo annullo: un round-trip per flush
+                cmds: List[List[Any]] = [["EXPIRE", lock, JOB_LOCK_SEC], ["GET", cancel_key(job_id)]]
+                state = progress.take()
+                if state is not None:
+                    job["progress"], message = state
+                    if not progress.cancelled.is_set():
+                        job["message"] = message or job["message"]
+                    dirty = True
+                if dirty:
+                    cmds.append(save_job_cmd(job))
+                res = await kv.pipeline(cmds)
+                if dirty:
+                    if res[2] != 1:
+                        # il record non è più di questo worker: il lavoro si ferma e non si scrive altro
+                        owned = False
+                        progress.cancelled.set()
+                        break
+                    self.notifier.publish(job)
+                    dirty = False
+                if res[1] is not None and not progress.cancelled.is_set():
+                    progress.cancelled.set()
+                    job["message"] = "cancelling"
+                    dirty = True
+            if not owned:
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())  # esito ignorato
+                return
+            try:
+                result = task.result()
+            except JobCancelledError:
+                job.update(status="cancelled", message="cancelled")
+                job["completed_at"] = utcnow_iso()
+            except Exception as e:
+                job.update(status="failed", message="failed", error=str(e))
+            else:
+                job.update(status="completed", progress=100.0, message="completed", result=result)
+                job["completed_at"] = utcnow_iso()
+            final = save_job_cmd(job, then=[*status_cmds(job, "running"), *self._fingerprint_cmds(job), *release])
+        except asyncio.CancelledError:
+            # runner fermato (shutdown): il job si interrompe e torna in coda per il prossimo worker
+            if job and job.get("status") == "running" and owned:
+                progress.cancelled.set()
+                if task is not None:
+                    task.add_done_callback(lambda t: t.cancelled() or t.exception())  # esito ignorato
+                release.remove(["DEL", cancel_key(job_id)])  # un annullo richiesto vale anche dopo
+                job.update(status="queued", progress=0.0, message="requeued")
+                final = save_job_cmd(job, then=[*status_cmds(job, "running"), ["RPUSH", JOBS_QUEUE_KEY, job_id],
+                                                *release])
+            raise
+        finally:
+            self._running.discard(job_id)
+            if final is not None:
+                if await kv.command(*final) == 1:
+                    self.notifier.publish(job)
+            elif owned:
+                await kv.pipeline(release)
+
+    # ---------------- reaper ----------------
+    async def _reaper(self) -> None:
+        suspects: Set[str] = set()
+        while True:
+            await asyncio.sleep(JOB_REAP_SEC)
+            try:
+                suspects = await self.reap(suspects)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[jobs] reaper error: {e}")
+
+    async def reap(self, suspects: Set[str]) -> Set[str]:
+        """
+        Rimette in coda gli id in lavorazione senza lock sia in questo giro sia nel
+        precedente (`suspects`): tra LMOVE e SET NX di un worker vivo passano millisecondi.
+        Un job rimasto 'running' torna 'queued'. Restituisce i sospetti per il giro dopo.
+        """
+        kv = self._kv_factory()
+        if kv is None or not await kv.set(JOBS_REAPER_KEY, self.worker_id, ex=max(1, int(JOB_REAP_SEC * 0.8)),
+                                          nx=True):
+            return suspects
+        ids = list(dict.fromkeys(await kv.command("LRANGE", JOBS_PROCESSING_KEY, 0, -1) or []))
+        if not ids:
+            return set()
+        values = await kv.mget([lock_key(i) for i in ids] + [job_key(i) for i in ids])
+        orphans = {i for i, held in zip(ids, values) if held is None}
+        cmds: List[List[Any]] = []
+        for job_id, raw in zip(ids, values[len(ids):]):
+            if job_id not in orphans or job_id not in suspects:
+                continue
+            job = parse_job(raw)
+            requeue = [["LREM", JOBS_PROCESSING_KEY, 0, job_id], ["RPUSH", JOBS_QUEUE_KEY, job_id]]
+            if job is None or job["status"] not in ("queued", "running"):
+                cmds.append(requeue[0])  # scaduto o già chiuso: basta toglierlo dalla lista
+                continue
+            if job["status"] == "running":
+                # compare-and-set: se il worker ha scritto nel frattempo, il job resta suo
+                job.update(status="queued", progress=0.0, message="requeued")
+                cmds.append(save_job_cmd(job, then=[*status_cmds(job, "running"), *requeue]))
+            else:
+                cmds += requeue
+            print(f"[jobs] requeued orphaned job {job_id}")
+        if cmds:
+            await kv.multi(cmds)
+            self.wake()
+        return orphans - suspects
+
+    @staticmethod
+    def _fingerprint_cmds(job: Dict[str, Any]) -> List[List[Any]]:
+        # completato e riusabile: l'impronta resta valida per JOB_DEDUPE_TTL_SECONDS;
+        # altrimenti si libera, così la prossima richiesta identica crea un job nuovo
+        fp = job.get("fingerprint")
+        if not fp:
+            return []
+        if job["status"] == "completed" and job.get("memoize"):
+            return [["EXPIRE", fingerprint_key(fp), JOB_DEDUPE_TTL_SECONDS]]
+        return [["DEL", fingerprint_key(fp)]]
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Annulla un job: subito se è in coda, altrimenti segnala al worker che lo esegue."""
+        kv = self._kv_factory()
+        job = await load_job(kv, job_id)
+        if job is None or job.get("status") not in ("queued", "running"):
+            return job
+        # la chiave copre anche la corsa con un worker che lo ha appena prelevato
+        cmds = [set_cmd(cancel_key(job_id), "1", ex=JOB_TTL_SECONDS)]
+        if job["status"] == "running":
+            # il record lo scrive solo il worker: "cancelling" al prossimo flush, poi "cancelled"
+            await kv.pipeline(cmds)
+            return job
+        # in coda: il worker che lo preleverà lo salta (lo stato non è più 'queued')
+        job.update(status="cancelled", message="cancelled", completed_at=utcnow_iso())
+        cmds.append(save_job_cmd(job, then=[*status_cmds(job, "queued"), *self._fingerprint_cmds(job)]))
+        if (await kv.pipeline(cmds))[1] != 1:
+            # preso in carico da un worker nel frattempo: lo interrompe la chiave di annullo
+            return await load_job(kv, job_id)
+        self.notifier.publish(job)
+        return job
+
+    async def wait_for_update(self, job_id: str, version: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Attende fino a timeout secondi una versione del record diversa da `version` e la
+        restituisce; alla scadenza restituisce il record invariato (None se non esiste).
+        """
+        kv = self._kv_factory()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        sub = self.notifier.subscribe(job_id)
+        try:
+            # lettura dopo la sottoscrizione: nessun aggiornamento può andare perso
+            job = await load_job(kv, job_id)
+            while job is not None and int(job.get("version") or 0) == version:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                poll = JOB_EVENTS_LOCAL_POLL_SEC if job_id in self._running else JOB_EVENTS_POLL_SEC
+                try:
+                    await asyncio.wait_for(sub.event.wait(), timeout=min(remaining, poll))
+                except asyncio.TimeoutError:
+                    job = await load_job(kv, job_id)
+                else:
+                    sub.event.clear()
+                    job = sub.latest
+            return job
+        finally:
+            self.notifier.unsubscribe(job_id, sub)
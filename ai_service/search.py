@@ -0,0 +1,97 @@
+"""
+Indice invertito per la ricerca full-text `q` su /reviews.
+- Normalizzazione: NFKD senza segni diacritici + casefold ("Perché" → "perche").
+- Vocabolario ordinato + posting list in formato CSR (indptr/indices, indici riga ordinati).
+- Ogni token della query è una ricerca per prefisso ("letto" trova "letto", "lettone");
+  i token sono in AND. Il costo dipende dalle posting coinvolte, non dal numero di recensioni.
+"""
+from __future__ import annotations
+
+import bisect
+import re
+import sys
+import unicodedata
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_MAX_CHAR = "\U0010ffff"
+
+
+def normalize(text: str) -> str:
+    s = unicodedata.normalize("NFKD", text)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return s.casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text)) if text else []
+
+
+class InvertedIndex:
+    def __init__(self, texts: Iterable[Optional[str]]):
+        term_ids: dict[str, int] = {}
+        pair_terms: List[int] = []
+        pair_docs: List[int] = []
+        n = 0
+        for doc, text in enumerate(texts):
+            n += 1
+            if not isinstance(text, str):
+                continue
+            for tok in set(tokenize(text)):
+                tid = term_ids.get(tok)
+                if tid is None:
+                    tid = term_ids[tok] = len(term_ids)
+                pair_terms.append(tid)
+                pair_docs.append(doc)
+        self.n_docs = n
+
+        # rinumera i termini in ordine alfabetico così i prefissi sono intervalli contigui
+        vocab = sorted(term_ids)
+        remap = np.empty(len(vocab), dtype=np.int64)
+        for new_id, term in enumerate(vocab):
+            remap[term_ids[term]] = new_id
+        terms = remap[np.asarray(pair_terms, dtype=np.int64)] if pair_terms else np.empty(0, dtype=np.int64)
+        docs = np.asarray(pair_docs, dtype=np.int64)
+        order = np.lexsort((docs, terms))
+        self.vocab = vocab
+        self.indices = docs[order]
+        self.indptr = np.searchsorted(terms[order], np.arange(len(vocab) + 1))
+
+    @property
+    def nbytes(self) -> int:
+        # posting list + vocabolario (stringhe Python e array di puntatori della lista)
+        return (self.indices.nbytes + self.indptr.nbytes
+                + sys.getsizeof(self.vocab) + sum(sys.getsizeof(t) for t in self.vocab))
+
+    def _prefix_rows(self, prefix: str) -> np.ndarray:
+        lo = bisect.bisect_left(self.vocab, prefix)
+        hi = bisect.bisect_left(self.vocab, prefix + _MAX_CHAR, lo)
+        if lo == hi:
+            return np.empty(0, dtype=np.int64)
+        if hi - lo == 1:
+            return self.indices[self.indptr[lo]:self.indptr[hi]]
+        a, b = self.indptr[lo], self.indptr[hi]
+        if b - a > self.n_docs // 8:
+            # prefissi molto generici: unione via maschera, O(n) ma senza sort
+            mask = np.zeros(self.n_docs, dtype=bool)
+            mask[self.indices[a:b]] = True
+            return np.flatnonzero(mask)
+        return np.unique(self.indices[a:b])
+
+    def search(self, query: str) -> Optional[np.ndarray]:
+        """
+        Indici riga ordinati che contengono tutti i token della query (per prefisso).
+        None se la query non contiene token (es. solo punteggiatura).
+        """
+        tokens = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not tokens:
+            return None
+        result: Optional[np.ndarray] = None
+        for tok in tokens:
+            rows = self._prefix_rows(tok)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result
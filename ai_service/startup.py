@@ -0,0 +1,125 @@
+"""
+Avvio rapido dell'API (cold start serverless).
+- I router si registrano pigramente: all'import dell'app non si carica nessun router;
+  la prima richiesta sotto /reviews importa (in un thread) e include solo quel router,
+  e così per gli altri. /docs, /redoc e /openapi.json li caricano tutti.
+- pandas/numpy arrivano col router delle recensioni, cioè alla prima richiesta di dati,
+  oppure prima con warmup() (API_WARMUP=1 all'avvio, o GET /health/warmup).
+- API_LAZY_ROUTERS=0 torna alla registrazione di tutti i router all'avvio.
+"""
+from __future__ import annotations
+
+import importlib
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import anyio.to_thread
+from fastapi import FastAPI
+
+# modulo in ai_service.routers → prefissi di path che serve
+ROUTERS: Dict[str, Sequence[str]] = {
+    "health": ("/health",),
+    "reviews": ("/reviews",),
+    "jobs": ("/jobs",),
+    "projects": ("/projects",),
+}
+# path che descrivono tutta l'API: servono tutti i router
+DOCS_PATHS = ("/docs", "/redoc", "/openapi.json")
+
+_INCLUDE_LOCK = threading.Lock()
+
+
+def lazy_routers_enabled() -> bool:
+    return os.getenv("API_LAZY_ROUTERS", "1") != "0"
+
+
+def warmup_projects_from_env() -> List[str]:
+    return [p.strip() for p in os.getenv("WARMUP_PROJECTS", "").split(",") if p.strip()]
+
+
+def route_path(scope: Dict[str, Any]) -> str:
+    # come il routing di Starlette: il path relativo a root_path ("/api" su Vercel)
+    path, root = scope.get("path", ""), scope.get("root_path", "")
+    if root and path.startswith(root) and path[len(root):len(root) + 1] in ("", "/"):
+        return path[len(root):]
+    return path
+
+
+def routers_for(path: str) -> List[str]:
+    if any(path == p or path.startswith(p + "/") for p in DOCS_PATHS):
+        return list(ROUTERS)
+    return [name for name, prefixes in ROUTERS.items()
+            if any(path == p or path.startswith(p + "/") for p in prefixes)]
+
+
+def loaded_routers(app: FastAPI) -> set:
+    if not hasattr(app.state, "routers"):
+        app.state.routers = set()
+    return app.state.routers
+
+
+def include_routers(app: FastAPI, names: Optional[Iterable[str]] = None) -> None:
+    """Importa e include i router indicati (tutti se None), una volta sola per app."""
+    loaded = loaded_routers(app)
+    for name in (list(ROUTERS) if names is None else names):
+        if name in loaded:
+            continue
+        module = importlib.import_module(f"{__package__}.routers.{name}")
+        with _INCLUDE_LOCK:
+            if name in loaded:
+                continue
+            app.include_router(module.router, tags=[name])
+            loaded.add(name)
+            app.openapi_schema = None  # lo schema OpenAPI va rigenerato con le nuove route
+
+
+class LazyRouters:
+    """Middleware ASGI: prima di passare la richiesta all'app, include i router che le servono."""
+
+    def __init__(self, app, target: FastAPI):
+        self.app = app
+        self.target = target
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            loaded = loaded_routers(self.target)
+            missing = [n for n in routers_for(route_path(scope)) if n not in loaded]
+            if missing:
+                # l'import (es. pandas) non blocca l'event loop
+                await anyio.to_thread.run_sync(include_routers, self.target, missing)
+        await self.app(scope, receive, send)
+
+
+def warmup(app: Optional[FastAPI] = None, projects: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Paga in anticipo quello che altrimenti costa la prima richiesta di dati:
+    import dei router (pandas, numpy) e, per i progetti indicati, caricamento
+    di recensioni, indici e documento in cache. Restituisce i tempi in ms.
+    """
+    timings: Dict[str, Any] = {}
+    t0 = time.perf_counter()
+    for name in ROUTERS:
+        importlib.import_module(f"{__package__}.routers.{name}")
+    if app is not None:
+        include_routers(app)
+    timings["imports_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+    from fastapi import HTTPException
+
+    from .routers.projects import DOCUMENT_CACHE
+    from .routers.reviews import load_facets, load_stats, load_store
+
+    for project_id in projects:
+        t = time.perf_counter()
+        try:
+            load_store(project_id)
+            load_stats(project_id)
+            load_facets(project_id)
+            DOCUMENT_CACHE.get(project_id)
+            timings[project_id] = round((time.perf_counter() - t) * 1000, 1)
+        except HTTPException as e:
+            timings[project_id] = f"error: {e.detail}"
+    timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return timings
@@ -0,0 +1,437 @@
+"""
+Aggregati pre-calcolati per /reviews/stats e /reviews/facets.
+Costruiti una volta per versione del file (oggetto derivato della cache di progetto):
+- ogni dimensione (lang, clusterId, rating, giorno) è codificata in interi, con un
+  livello esplicito per i valori mancanti;
+- le righe sono raggruppate in celle, una per combinazione presente, con count e
+  n/somma/M2 (scarti quadratici)/min/max di sentiment e n/somma di rating;
+- i filtri su cluster, lang, rating e date si risolvono mascherando le celle, senza
+  riscandire le righe.
+I filtri che le celle non rappresentano (q, range di sentiment, date con orario) passano
+dalle righe selezionate dallo store e si aggregano con bincount sui codici.
+FacetCube (in fondo) è il cubo analogo per le faccette, con mese e banda di sentiment.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .store import _ts_value
+
+NS_PER_DAY = 86_400 * 10**9
+
+
+def _label(value: Any) -> Any:
+    # rating interi come int (chiavi "5", non "5.0"), il resto come stringa
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return int(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return str(value)
+
+
+def _num(value: float) -> Optional[float]:
+    return None if value is None or np.isnan(value) else float(value)
+
+
+class _Dim:
+    """Dimensione codificata: codes per riga, etichette per livello (ultimo = mancante)."""
+
+    def __init__(self, series: Optional[pd.Series], n: int, numeric: bool = False):
+        self.present = series is not None
+        if series is None:
+            uniques: List[Any] = []
+            codes = np.zeros(n, dtype=np.int64)
+        else:
+            codes, uniq = pd.factorize(series, sort=True, use_na_sentinel=True)
+            uniques = list(uniq)
+            codes = np.where(codes < 0, len(uniques), codes).astype(np.int64)
+        self.codes = codes
+        self.size = len(uniques) + 1
+        self.labels: List[Any] = [_label(u) for u in uniques] + [None]
+        self.lookup = {str(label): i for i, label in enumerate(self.labels[:-1])}
+        # valore numerico per livello, per i filtri di range (NaN = mancante)
+        self.values = np.array([float(u) for u in uniques] + [np.nan]) if numeric else None
+
+    def level_mask(self, lo=None, hi=None) -> np.ndarray:
+        m = ~np.isnan(self.values)
+        if lo is not None:
+            m &= self.values >= lo
+        if hi is not None:
+            m &= self.values <= hi
+        return m
+
+
+class ReviewStats:
+    def __init__(self, df: pd.DataFrame):
+        n = self.n = len(df)
+        col = lambda name: df[name] if name in df.columns else None  # noqa: E731
+
+        self.has_sentiment = "sentiment" in df.columns
+        self.has_rating = "rating" in df.columns
+        self.sentiment = (
+            pd.to_numeric(df["sentiment"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            if self.has_sentiment else np.full(n, np.nan)
+        )
+        rating = pd.to_numeric(df["rating"], errors="coerce") if self.has_rating else None
+
+        # giorno come dimensione solo se le date non hanno orario: così i filtri
+        # dateFrom/dateTo sono esatti anche sulle celle
+        day = None
+        self.day_exact = False
+        if "date" in df.columns:
+            ns = df["date"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+            valid = df["date"].notna().to_numpy()
+            if bool((ns[valid] % NS_PER_DAY == 0).all()):
+                self.day_exact = True
+                day = pd.Series(np.where(valid, ns // NS_PER_DAY, np.nan))
+
+        self.dims: Dict[str, _Dim] = {
+            "lang": _Dim(col("lang"), n),
+            "clusterId": _Dim(col("clusterId"), n),
+            "rating": _Dim(rating, n, numeric=True),
+            "day": _Dim(day, n, numeric=True),
+        }
+
+        # celle: una per combinazione (lang, cluster, rating, giorno) presente
+        key = np.zeros(n, dtype=np.int64)
+        for d in self.dims.values():
+            key = key * d.size + d.codes
+        cell_keys, inverse = np.unique(key, return_inverse=True)
+        m = len(cell_keys)
+        decoded = np.unravel_index(cell_keys, tuple(d.size for d in self.dims.values()))
+        self.cell_codes = dict(zip(self.dims, decoded))
+
+        s = self.sentiment
+        s_valid = ~np.isnan(s)
+        s0 = np.where(s_valid, s, 0.0)
+        grouped = pd.Series(s).groupby(inverse)
+        self.cells: Dict[str, np.ndarray] = {
+            "count": np.bincount(inverse, minlength=m).astype(np.int64),
+            "s_n": np.bincount(inverse, weights=s_valid, minlength=m),
+            "s_sum": np.bincount(inverse, weights=s0, minlength=m),
+            "s_min": grouped.min().reindex(range(m)).to_numpy(dtype=np.float64),
+            "s_max": grouped.max().reindex(range(m)).to_numpy(dtype=np.float64),
+        }
+        # somma dei quadrati degli scarti dalla media di cella (combinabile senza cancellazione)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cell_mean = self.cells["s_sum"] / self.cells["s_n"]
+        dev = np.where(s_valid, s - cell_mean[inverse], 0.0)
+        self.cells["s_m2"] = np.bincount(inverse, weights=dev * dev, minlength=m)
+        rvals = self.dims["rating"].values[self.cell_codes["rating"]]
+        r_valid = ~np.isnan(rvals)
+        self.cells["r_n"] = np.where(r_valid, self.cells["count"], 0)
+        self.cells["r_sum"] = np.where(r_valid, rvals, 0.0) * self.cells["count"]
+        self._all: Optional[Dict[str, Any]] = None
+
+    @property
+    def nbytes(self) -> int:
+        total = sum(a.nbytes for a in self.cells.values()) + sum(a.nbytes for a in self.cell_codes.values())
+        return total + sum(d.codes.nbytes for d in self.dims.values()) + self.sentiment.nbytes
+
+    # ---------------- query ----------------
+    def needs_rows(
+        self,
+        q: Optional[str] = None,
+        sentimentMin: Optional[float] = None,
+        sentimentMax: Optional[float] = None,
+        dateFrom: Optional[pd.Timestamp] = None,
+        dateTo: Optional[pd.Timestamp] = None,
+    ) -> bool:
+        """True se i filtri richiedono le righe (non rappresentabili nelle celle)."""
+        if q or sentimentMin is not None or sentimentMax is not None:
+            return True
+        return (dateFrom is not None or dateTo is not None) and not self.day_exact
+
+    def summary(
+        self,
+        clusterId: Optional[str] = None,
+        lang: Optional[str] = None,
+        ratingMin: Optional[float] = None,
+        ratingMax: Optional[float] = None,
+        dateFrom: Optional[pd.Timestamp] = None,
+        dateTo: Optional[pd.Timestamp] = None,
+    ) -> Dict[str, Any]:
+        """Statistiche dalle sole celle (nessun accesso alle righe)."""
+        unfiltered = not any(v is not None for v in (clusterId, lang, ratingMin, ratingMax, dateFrom, dateTo))
+        if unfiltered and self._all is not None:
+            return self._all
+        mask = self._cell_mask(clusterId, lang, ratingMin, ratingMax, dateFrom, dateTo)
+        c = {k: v[mask] for k, v in self.cells.items()}
+        counts = {name: (self.cell_codes[name][mask], c["count"]) for name in ("lang", "clusterId", "rating")}
+        s_n, s_sum = c["s_n"].sum(), c["s_sum"].sum()
+        # M2 totale = Σ (M2 di cella + n_i · (media_i − media)²)
+        has = c["s_n"] > 0
+        s_m2 = 0.0
+        if s_n:
+            mean_i = c["s_sum"][has] / c["s_n"][has]
+            s_m2 = c["s_m2"][has].sum() + (c["s_n"][has] * (mean_i - s_sum / s_n) ** 2).sum()
+        payload = self._payload(
+            int(c["count"].sum()), counts,
+            s_n=s_n, s_sum=s_sum, s_m2=s_m2,
+            s_min=np.nanmin(c["s_min"]) if np.any(c["s_n"] > 0) else np.nan,
+            s_max=np.nanmax(c["s_max"]) if np.any(c["s_n"] > 0) else np.nan,
+            r_n=c["r_n"].sum(), r_sum=c["r_sum"].sum(),
+        )
+        if unfiltered:
+            self._all = payload
+        return payload
+
+    def summary_rows(self, rows: Optional[np.ndarray]) -> Dict[str, Any]:
+        """Statistiche su un insieme di righe (None = tutte), via bincount sui codici."""
+        if rows is None:
+            return self.summary()
+        counts = {name: (self.dims[name].codes[rows], None) for name in ("lang", "clusterId", "rating")}
+        s = self.sentiment[rows]
+        s = s[~np.isnan(s)]
+        rating = self.dims["rating"]
+        rv = rating.values[rating.codes[rows]]
+        rv = rv[~np.isnan(rv)]
+        return self._payload(
+            len(rows), counts,
+            s_n=len(s), s_sum=s.sum(), s_m2=((s - s.mean()) ** 2).sum() if len(s) else 0.0,
+            s_min=s.min() if len(s) else np.nan, s_max=s.max() if len(s) else np.nan,
+            r_n=len(rv), r_sum=rv.sum(),
+        )
+
+    def _cell_mask(self, clusterId, lang, ratingMin, ratingMax, dateFrom, dateTo) -> np.ndarray:
+        mask = np.ones(len(self.cells["count"]), dtype=bool)
+        for name, value in (("clusterId", clusterId), ("lang", lang)):
+            d = self.dims[name]
+            if value and d.present:
+                mask &= self.cell_codes[name] == d.lookup.get(value, -1)
+        if (ratingMin is not None or ratingMax is not None) and self.dims["rating"].present:
+            mask &= self.dims["rating"].level_mask(ratingMin, ratingMax)[self.cell_codes["rating"]]
+        if (dateFrom is not None or dateTo is not None) and self.dims["day"].present:
+            lo, hi = _ts_value(dateFrom), _ts_value(dateTo)
+            # date a mezzanotte: date >= from ⇔ giorno >= ceil(from); date <= to ⇔ giorno <= floor(to)
+            lo_day = None if lo is None else -(-lo // NS_PER_DAY)
+            hi_day = None if hi is None else hi // NS_PER_DAY
+            mask &= self.dims["day"].level_mask(lo_day, hi_day)[self.cell_codes["day"]]
+        return mask
+
+    # ---------------- payload ----------------
+    def _distribution(self, name: str, codes: np.ndarray, weights: Optional[np.ndarray]) -> Dict[Any, int]:
+        d = self.dims[name]
+        if not d.present:
+            return {}
+        counts = np.bincount(codes, weights=weights, minlength=d.size).astype(np.int64)
+        # come value_counts: per frequenza decrescente; mancanti sotto la chiave null
+        order = np.argsort(-counts, kind="stable")
+        return {("null" if d.labels[i] is None else d.labels[i]): int(counts[i]) for i in order if counts[i] > 0}
+
+    def _payload(self, total, counts, s_n, s_sum, s_m2, s_min, s_max, r_n, r_sum) -> Dict[str, Any]:
+        mean = s_sum / s_n if s_n else np.nan
+        # std campionaria (ddof=1, come pandas)
+        std = np.sqrt(s_m2 / (s_n - 1)) if s_n > 1 else np.nan
+        return {
+            "total": total,
+            "languages": self._distribution("lang", *counts["lang"]),
+            "clusters": self._distribution("clusterId", *counts["clusterId"]),
+            "sentiment": {
+                "mean": _num(mean) if self.has_sentiment else None,
+                "std": _num(std) if self.has_sentiment else None,
+                "min": _num(s_min) if self.has_sentiment else None,
+                "max": _num(s_max) if self.has_sentiment else None,
+            },
+            "rating": {
+                "mean": _num(r_sum / r_n if r_n else np.nan) if self.has_rating else None,
+                "distribution": self._distribution("rating", *counts["rating"]),
+            },
+        }
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Cubo per /reviews/facets
+# ──────────────────────────────────────────────────────────────────────────────
+FACET_DIMS = ("clusterId", "lang", "rating", "month", "sentimentBand")
+BAND_WIDTH = 0.05
+N_BANDS = int(round(2 / BAND_WIDTH))
+_EDGE_EPS = 1e-9
+
+
+def _band_codes(s: np.ndarray) -> np.ndarray:
+    """
+    Codice di banda del sentiment: 2k per un valore esattamente sul bordo k,
+    2k+1 per l'intervallo aperto tra i bordi k e k+1 (NaN resta NaN).
+    Così i filtri inclusivi con estremi sui bordi restano esatti.
+    """
+    t = (np.clip(s, -1, 1) + 1) / BAND_WIDTH
+    r = np.round(t)
+    return np.where(np.abs(t - r) < _EDGE_EPS, 2 * r, 2 * np.floor(t) + 1)
+
+
+def _band_bound(value: Optional[float]) -> Optional[float]:
+    """Codice del bordo se `value` cade su un bordo di banda, altrimenti NaN."""
+    if value is None:
+        return None
+    t = (value + 1) / BAND_WIDTH
+    r = round(t)
+    return 2.0 * r if abs(t - r) < _EDGE_EPS else np.nan
+
+
+def _month_of_day(day: int) -> int:
+    return int(np.datetime64(int(day), "D").astype("datetime64[M]").astype(np.int64))
+
+
+class FacetCube:
+    """
+    Cubo clusterId × lang × rating × mese × banda di sentiment (count, somme di sentiment e rating).
+    I filtri di /reviews diventano maschere sulle celle quando gli estremi cadono sui bordi
+    dei bucket (date su mesi interi, sentiment su multipli di BAND_WIDTH); altrimenti si
+    riaggregano le sole righe selezionate, tramite la mappa riga → cella.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        n = len(df)
+        col = lambda name: df[name] if name in df.columns else None  # noqa: E731
+        self.sentiment = (
+            pd.to_numeric(df["sentiment"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            if "sentiment" in df.columns else np.full(n, np.nan)
+        )
+        rating = pd.to_numeric(df["rating"], errors="coerce") if "rating" in df.columns else None
+
+        month = None
+        self.day_exact = False
+        if "date" in df.columns:
+            dt = df["date"].to_numpy(dtype="datetime64[ns]")
+            valid = df["date"].notna().to_numpy()
+            ns = dt.astype(np.int64)
+            self.day_exact = bool((ns[valid] % NS_PER_DAY == 0).all())
+            month = pd.Series(np.where(valid, dt.astype("datetime64[M]").astype(np.int64), np.nan))
+        band = pd.Series(_band_codes(self.sentiment)) if "sentiment" in df.columns else None
+
+        self.dims: Dict[str, _Dim] = {
+            "clusterId": _Dim(col("clusterId"), n),
+            "lang": _Dim(col("lang"), n),
+            "rating": _Dim(rating, n, numeric=True),
+            "month": _Dim(month, n, numeric=True),
+            "sentimentBand": _Dim(band, n, numeric=True),
+        }
+
+        key = np.zeros(n, dtype=np.int64)
+        for d in self.dims.values():
+            key = key * d.size + d.codes
+        cell_keys, self.inverse = np.unique(key, return_inverse=True)
+        decoded = np.unravel_index(cell_keys, tuple(d.size for d in self.dims.values()))
+        self.cell_codes = dict(zip(self.dims, decoded))
+        self._cell_rating = self.dims["rating"].values[self.cell_codes["rating"]]
+        self.cells = self.measures_for_rows(None)
+
+        # etichette in uscita: mese "YYYY-MM", banda = estremo inferiore dell'intervallo
+        self._out: Dict[str, Tuple[np.ndarray, List[Any]]] = {}
+        for name, d in self.dims.items():
+            if name == "month":
+                labels = [str(np.datetime64(int(v), "M")) for v in d.values[:-1]] + [None]
+                self._out[name] = (np.arange(d.size), labels)
+            elif name == "sentimentBand":
+                # bordo k e intervallo (k, k+1) → banda k; il bordo 1.0 finisce nell'ultima
+                k = np.minimum(d.values[:-1] // 2, N_BANDS - 1).astype(np.int64)
+                labels = [round(-1 + i * BAND_WIDTH, 2) for i in range(N_BANDS)] + [None]
+                self._out[name] = (np.append(k, N_BANDS), labels)
+            else:
+                self._out[name] = (np.arange(d.size), d.labels)
+
+    @property
+    def nbytes(self) -> int:
+        total = self.inverse.nbytes + self.sentiment.nbytes
+        total += sum(a.nbytes for a in self.cells.values()) + sum(a.nbytes for a in self.cell_codes.values())
+        return total
+
+    def measures_for_rows(self, rows: Optional[np.ndarray]) -> Dict[str, np.ndarray]:
+        """Misure per cella, ristrette alle righe `rows` (None = tutte)."""
+        m = len(self._cell_rating)
+        inv = self.inverse if rows is None else self.inverse[rows]
+        s = self.sentiment if rows is None else self.sentiment[rows]
+        valid = ~np.isnan(s)
+        count = np.bincount(inv, minlength=m).astype(np.int64)
+        r_valid = ~np.isnan(self._cell_rating)
+        return {
+            "count": count,
+            "s_n": np.bincount(inv, weights=valid, minlength=m),
+            "s_sum": np.bincount(inv, weights=np.where(valid, s, 0.0), minlength=m),
+            "r_n": np.where(r_valid, count, 0),
+            "r_sum": np.where(r_valid, self._cell_rating, 0.0) * count,
+        }
+
+    def cell_mask(
+        self,
+        clusterId: Optional[str] = None,
+        lang: Optional[str] = None,
+        ratingMin: Optional[float] = None,
+        ratingMax: Optional[float] = None,
+        sentimentMin: Optional[float] = None,
+        sentimentMax: Optional[float] = None,
+        dateFrom: Optional[pd.Timestamp] = None,
+        dateTo: Optional[pd.Timestamp] = None,
+    ) -> Optional[np.ndarray]:
+        """Maschera sulle celle equivalente ai filtri, o None se non esprimibile sul cubo."""
+        mask = np.ones(len(self.cells["count"]), dtype=bool)
+        for name, value in (("clusterId", clusterId), ("lang", lang)):
+            d = self.dims[name]
+            if value and d.present:
+                mask &= self.cell_codes[name] == d.lookup.get(value, -1)
+        ranges = [("rating", ratingMin, ratingMax)]
+        if sentimentMin is not None or sentimentMax is not None:
+            lo, hi = _band_bound(sentimentMin), _band_bound(sentimentMax)
+            if (lo is not None and np.isnan(lo)) or (hi is not None and np.isnan(hi)):
+                return None
+            ranges.append(("sentimentBand", lo, hi))
+        if dateFrom is not None or dateTo is not None:
+            months = self._month_range(dateFrom, dateTo)
+            if months is None:
+                return None
+            ranges.append(("month", *months))
+        for name, lo, hi in ranges:
+            if (lo is not None or hi is not None) and self.dims[name].present:
+                mask &= self.dims[name].level_mask(lo, hi)[self.cell_codes[name]]
+        return mask
+
+    def _month_range(self, dateFrom, dateTo) -> Optional[Tuple[Optional[int], Optional[int]]]:
+        # esatto solo con date senza orario e estremi che coprono mesi interi
+        if not self.day_exact:
+            return None
+        lo, hi = _ts_value(dateFrom), _ts_value(dateTo)
+        lo_m = hi_m = None
+        if lo is not None:
+            day = -(-lo // NS_PER_DAY)
+            lo_m = _month_of_day(day)
+            if _month_of_day(day - 1) == lo_m:
+                return None
+        if hi is not None:
+            day = hi // NS_PER_DAY
+            hi_m = _month_of_day(day)
+            if _month_of_day(day + 1) == hi_m:
+                return None
+        return lo_m, hi_m
+
+    def facets(self, by: List[str], measures: Dict[str, np.ndarray], mask: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """Gruppi per le dimensioni `by`, ordinati per chiave, con count e medie."""
+        sel = measures["count"] > 0
+        if mask is not None:
+            sel &= mask
+        idx = np.flatnonzero(sel)
+        c = {k: v[idx] for k, v in measures.items()}
+
+        sizes = tuple(len(self._out[name][1]) for name in by)
+        if by:
+            codes = [self._out[name][0][self.cell_codes[name][idx]] for name in by]
+            groups, inv = np.unique(np.ravel_multi_index(codes, sizes), return_inverse=True)
+            decoded = np.unravel_index(groups, sizes)
+        else:
+            groups, inv, decoded = np.zeros(1, dtype=np.int64), np.zeros(len(idx), dtype=np.int64), ()
+        agg = {k: np.bincount(inv, weights=v, minlength=len(groups)).tolist() for k, v in c.items()}
+        labels = [(self._out[name][1], decoded[j].tolist()) for j, name in enumerate(by)]
+
+        items = []
+        for i in range(len(groups)):
+            if not agg["count"][i]:
+                continue
+            item: Dict[str, Any] = {name: lab[codes_[i]] for name, (lab, codes_) in zip(by, labels)}
+            item["count"] = int(agg["count"][i])
+            item["sentimentMean"] = agg["s_sum"][i] / agg["s_n"][i] if agg["s_n"][i] else None
+            item["ratingMean"] = agg["r_sum"][i] / agg["r_n"][i] if agg["r_n"][i] else None
+            items.append(item)
+        return {"total": int(c["count"].sum()), "facets": items}
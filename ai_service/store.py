@@ -0,0 +1,403 @@
+"""
+Review store colonnare per l'API /reviews.
+Costruito una volta per progetto a partire dal DataFrame caricato:
+- permutazioni pre-ordinate (stabili, NaN in fondo) per date/sentiment/rating, asc e desc,
+  più il rank inverso di ogni riga;
+- codici categoriali + posting list (indici riga ordinati) per clusterId e lang;
+- valori ordinati per i filtri di range via searchsorted.
+Una query lavora sugli indici delle righe candidate (niente copie del DataFrame):
+si parte dall'insieme più selettivo, si applicano gli altri filtri solo su quello e si
+ordina per rank. Senza filtri una pagina costa O(pageSize).
+La ricerca `q` usa un indice invertito (search.py) costruito alla prima ricerca.
+Le pagine vengono serializzate per colonne da colonne Python pre-calcolate (records()).
+after()/position() danno la paginazione a cursore: si riparte dalla posizione dell'ultima
+riga nella permutazione, senza riordinare ciò che precede.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .search import InvertedIndex
+
+SORT_KEYS = ("date", "sentiment", "rating")
+CATEGORICAL_KEYS = ("clusterId", "lang")
+# campi del modello Review, nell'ordine della risposta
+REVIEW_FIELDS = ("id", "text", "clusterId", "clusterLabel", "sentiment", "lang", "date", "rating", "sourceId", "projectId")
+
+
+class _SortedColumn:
+    """Colonna numerica con permutazioni ordinate e supporto ai range."""
+
+    def __init__(self, values: np.ndarray, valid: np.ndarray):
+        self.values = values
+        self.valid = valid
+        valid_idx = np.flatnonzero(valid)
+        invalid_idx = np.flatnonzero(~valid)
+        v = values[valid_idx]
+        asc = valid_idx[np.argsort(v, kind="stable")]
+        desc = valid_idx[np.argsort(-v, kind="stable")]
+        self.sorted_values = values[asc]
+        self._asc_valid = asc
+        self.n_invalid = len(invalid_idx)
+        # i NaN restano in fondo in entrambe le direzioni (come pandas.sort_values)
+        self.perm = {
+            "asc": np.concatenate([asc, invalid_idx]),
+            "desc": np.concatenate([desc, invalid_idx]),
+        }
+        self.rank: Dict[str, np.ndarray] = {}
+        for order, perm in self.perm.items():
+            r = np.empty(len(perm), dtype=np.int64)
+            r[perm] = np.arange(len(perm))
+            self.rank[order] = r
+
+    def range_rows(self, lo=None, hi=None) -> Optional[np.ndarray]:
+        """Righe con lo <= valore <= hi (None = tutte le righe, nessuna restrizione)."""
+        i = 0 if lo is None else int(np.searchsorted(self.sorted_values, lo, side="left"))
+        j = len(self.sorted_values) if hi is None else int(np.searchsorted(self.sorted_values, hi, side="right"))
+        if i == 0 and j == len(self.sorted_values) and self.n_invalid == 0:
+            return None
+        return self._asc_valid[i:j]
+
+    def range_mask(self, rows: np.ndarray, lo=None, hi=None) -> np.ndarray:
+        vals = self.values[rows]
+        m = self.valid[rows].copy()
+        if lo is not None:
+            m &= vals >= lo
+        if hi is not None:
+            m &= vals <= hi
+        return m
+
+
+class _CategoricalColumn:
+    def __init__(self, series: pd.Series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        self.codes = codes
+        self.lookup = {str(u): i for i, u in enumerate(uniques)}
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self.postings = [order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))]
+
+    def rows(self, value: str) -> np.ndarray:
+        code = self.lookup.get(value)
+        return self.postings[code] if code is not None else np.empty(0, dtype=np.int64)
+
+    def mask(self, rows: np.ndarray, value: str) -> np.ndarray:
+        code = self.lookup.get(value, -2)
+        return self.codes[rows] == code
+
+
+@dataclass
+class _Filter:
+    rows: Optional[np.ndarray]        # insieme candidato (None = nessuna restrizione)
+    kind: str                         # 'cat' | 'range'
+    key: str
+    args: tuple
+
+
+def _object_nbytes(arr: np.ndarray, deep: bool) -> int:
+    """Puntatori dell'array object più, se deep, gli oggetti Python distinti che referenzia."""
+    total = arr.nbytes
+    if deep:
+        seen = {id(v): v for v in arr.tolist()}
+        total += sum(sys.getsizeof(v) for v in seen.values())
+    return total
+
+
+class ReviewStore:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.n = len(df)
+        self.numeric: Dict[str, _SortedColumn] = {}
+        for key in SORT_KEYS:
+            if key not in df.columns:
+                continue
+            s = df[key]
+            if key == "date":
+                valid = s.notna().to_numpy()
+                values = s.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+            else:
+                values = pd.to_numeric(s, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                valid = ~np.isnan(values)
+            self.numeric[key] = _SortedColumn(values, valid)
+        self.categorical: Dict[str, _CategoricalColumn] = {
+            key: _CategoricalColumn(df[key]) for key in CATEGORICAL_KEYS if key in df.columns
+        }
+        self._index: Optional[InvertedIndex] = None
+        self._index_lock = threading.Lock()
+        self._serial: Optional[Dict[str, np.ndarray]] = None
+        self._serial_nbytes = 0
+        # impostato da ProjectCache: va chiamato quando crescono le strutture pigre
+        self.on_resize: Optional[Callable[[], None]] = None
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Stima della memoria dello store (per il budget della cache): indici numerici/categoriali,
+        più colonne serializzate e indice di testo una volta costruiti.
+        """
+        total = self._serial_nbytes
+        for c in self.numeric.values():
+            total += c.values.nbytes + c.valid.nbytes + c.sorted_values.nbytes
+            total += sum(p.nbytes for p in c.perm.values()) + sum(r.nbytes for r in c.rank.values())
+        for c in self.categorical.values():
+            total += c.codes.nbytes * 2
+        if self._index is not None:
+            total += self._index.nbytes
+        return total
+
+    def _resized(self) -> None:
+        if self.on_resize is not None:
+            self.on_resize()
+
+    # ---------------- serializzazione ----------------
+    def _serial_columns(self) -> Dict[str, np.ndarray]:
+        """Colonne già nel formato JSON di Review (str/float/None), come array object."""
+        if self._serial is not None:
+            return self._serial
+        df, n = self.df, self.n
+        # colonne object del DataFrame: le stringhe sono condivise, si contano solo i puntatori
+        shared = set()
+
+        def text_col(name: str, default):
+            if name not in df.columns:
+                return np.full(n, default, dtype=object)
+            s = df[name]
+            if s.dtype == object:
+                shared.add(name)
+            return s.astype(object).where(s.notna(), default).to_numpy(dtype=object)
+
+        cols: Dict[str, np.ndarray] = {
+            "id": text_col("id", ""),
+            "text": text_col("text", ""),
+            "clusterId": text_col("clusterId", None),
+            "clusterLabel": text_col("clusterLabel", None),
+            "lang": text_col("lang", "unknown"),
+            "sourceId": text_col("sourceId", ""),
+            "projectId": text_col("projectId", None),
+        }
+        if "sentiment" in self.numeric:
+            c = self.numeric["sentiment"]
+            cols["sentiment"] = np.where(c.valid, c.values, 0.0).astype(object)
+        else:
+            cols["sentiment"] = np.full(n, 0.0, dtype=object)
+        if "rating" in self.numeric:
+            c = self.numeric["rating"]
+            cols["rating"] = np.where(c.valid, c.values, None).astype(object)
+        else:
+            cols["rating"] = np.full(n, None, dtype=object)
+        if "date" in df.columns:
+            d = df["date"]
+            cols["date"] = d.dt.strftime("%Y-%m-%d").astype(object).where(d.notna(), None).to_numpy(dtype=object)
+        else:
+            cols["date"] = np.full(n, None, dtype=object)
+        self._serial_nbytes = sum(_object_nbytes(a, deep=name not in shared) for name, a in cols.items())
+        self._serial = cols
+        self._resized()
+        return cols
+
+    def columns(self, idx: np.ndarray, project_id: str) -> Dict[str, list]:
+        """Righe `idx` per colonna (campi di Review, valori JSON-ready)."""
+        cols = self._serial_columns()
+        out = {f: cols[f][idx].tolist() for f in REVIEW_FIELDS}
+        out["projectId"] = [v if v is not None else project_id for v in out["projectId"]]
+        return out
+
+    def records(self, idx: np.ndarray, project_id: str) -> List[Dict[str, object]]:
+        """Righe `idx` come dict JSON-ready (stessi campi di Review), senza iterrows."""
+        cols = self.columns(idx, project_id)
+        return [dict(zip(REVIEW_FIELDS, row)) for row in zip(*(cols[f] for f in REVIEW_FIELDS))]
+
+    def text_index(self) -> InvertedIndex:
+        built = False
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    texts = self.df["text"].tolist() if "text" in self.df.columns else [None] * self.n
+                    self._index = InvertedIndex(texts)
+                    built = True
+        if built:
+            self._resized()
+        return self._index
+
+    def search(self, q: str, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Interseca i candidati `rows` (None = tutti) con le righe che contengono la query."""
+        hits = self.text_index().search(q)
+        if hits is None:
+            # nessun token (solo punteggiatura/simboli): confronto letterale sui candidati
+            texts = self.df["text"] if rows is None else self.df["text"].iloc[rows]
+            hit = texts.str.contains(q, case=False, na=False, regex=False).to_numpy(dtype=bool)
+            return np.flatnonzero(hit) if rows is None else rows[hit]
+        if rows is None:
+            return hits
+        if len(rows) > len(hits) * 8:
+            return hits[self._membership(rows)[hits]]
+        return rows[np.isin(rows, hits, assume_unique=True)]
+
+    def _membership(self, rows: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.n, dtype=bool)
+        mask[rows] = True
+        return mask
+
+    # ---------------- filtri ----------------
+    def _filters(
+        self,
+        clusterId: Optional[str] = None,
+        lang: Optional[str] = None,
+        ratingMin: Optional[float] = None,
+        ratingMax: Optional[float] = None,
+        sentimentMin: Optional[float] = None,
+        sentimentMax: Optional[float] = None,
+        dateFrom: Optional[pd.Timestamp] = None,
+        dateTo: Optional[pd.Timestamp] = None,
+    ) -> List[_Filter]:
+        out: List[_Filter] = []
+        for key, value in (("clusterId", clusterId), ("lang", lang)):
+            if value and key in self.categorical:
+                out.append(_Filter(self.categorical[key].rows(value), "cat", key, (value,)))
+        ranges = (
+            ("rating", ratingMin, ratingMax),
+            ("sentiment", sentimentMin, sentimentMax),
+            ("date", _ts_value(dateFrom), _ts_value(dateTo)),
+        )
+        for key, lo, hi in ranges:
+            if (lo is None and hi is None) or key not in self.numeric:
+                continue
+            rows = self.numeric[key].range_rows(lo, hi)
+            out.append(_Filter(rows, "range", key, (lo, hi)))
+        return out
+
+    def select(self, **filters) -> Optional[np.ndarray]:
+        """
+        Indici (non ordinati) delle righe che soddisfano i filtri; None = tutte le righe.
+        Parte dall'insieme candidato più piccolo e verifica gli altri filtri solo su quello.
+        """
+        fs = self._filters(**filters)
+        restricted = [f for f in fs if f.rows is not None]
+        if not restricted:
+            return None
+        restricted.sort(key=lambda f: len(f.rows))
+        rows = restricted[0].rows
+        for f in restricted[1:]:
+            if len(rows) == 0:
+                break
+            if f.kind == "cat":
+                rows = rows[self.categorical[f.key].mask(rows, *f.args)]
+            else:
+                rows = rows[self.numeric[f.key].range_mask(rows, *f.args)]
+        return rows
+
+    # ---------------- ordinamento / pagine ----------------
+    def sort_key(self, sort: str) -> Optional[str]:
+        # fallback su 'sentiment' se manca la colonna richiesta (come prima)
+        if sort in self.numeric:
+            return sort
+        return "sentiment" if "sentiment" in self.numeric else None
+
+    def ordered(self, rows: Optional[np.ndarray], sort: str, order: str, limit: Optional[int] = None) -> np.ndarray:
+        """Righe ordinate per (sort, order); se `limit` è dato ne bastano le prime `limit`."""
+        key = self.sort_key(sort)
+        if key is None:
+            out = np.arange(self.n) if rows is None else np.sort(rows)
+            return out if limit is None else out[:limit]
+        col = self.numeric[key]
+        perm = col.perm[order]
+        if rows is None:
+            return perm if limit is None else perm[:limit]
+        m = len(rows)
+        if m == 0:
+            return rows
+        if m * max(1, int(np.log2(m))) < self.n:
+            rank = col.rank[order][rows]
+            if limit is not None and limit < m:
+                top = np.argpartition(rank, limit - 1)[:limit]
+                return rows[top[np.argsort(rank[top])]]
+            return rows[np.argsort(rank)]
+        mask = np.zeros(self.n, dtype=bool)
+        mask[rows] = True
+        out = perm[mask[perm]]
+        return out if limit is None else out[:limit]
+
+    def page(self, rows: Optional[np.ndarray], sort: str, order: str, start: int, size: int) -> Tuple[int, np.ndarray]:
+        total = self.n if rows is None else len(rows)
+        if start >= total:
+            return total, np.empty(0, dtype=np.int64)
+        return total, self.ordered(rows, sort, order, limit=start + size)[start:start + size]
+
+
+    def after(self, rows: Optional[np.ndarray], sort: str, order: str, position: int, size: int) -> np.ndarray:
+        """
+        Le prime `size` righe che seguono `position` nell'ordine (sort, order): keyset
+        pagination sulla permutazione pre-calcolata. Il costo non dipende da quanto si è
+        in profondità (niente ordinamento dei primi start+size elementi).
+        """
+        key = self.sort_key(sort)
+        start = position + 1
+        if key is None:
+            # senza colonne ordinabili: ordine di riga, la posizione è l'indice di riga
+            if rows is None:
+                return np.arange(start, min(start + size, self.n))
+            return np.sort(rows[rows >= start])[:size]
+        col = self.numeric[key]
+        perm = col.perm[order]
+        if rows is None:
+            return perm[start:start + size]
+        m = len(rows)
+        if m == 0 or size <= 0:
+            return rows[:0]
+        if m * max(1, int(np.log2(m))) < self.n:
+            rank = col.rank[order][rows]
+            cand, rank = rows[rank >= start], rank[rank >= start]
+            if size < len(cand):
+                top = np.argpartition(rank, size - 1)[:size]
+                cand, rank = cand[top], rank[top]
+            return cand[np.argsort(rank)]
+        # insieme grande: scorre la permutazione da `start` a blocchi finché la pagina è piena
+        member = self._membership(rows)
+        out: List[np.ndarray] = []
+        found = 0
+        step = max(size * 4, 1024)
+        while start < self.n and found < size:
+            block = perm[start:start + step]
+            hit = block[member[block]]
+            out.append(hit)
+            found += len(hit)
+            start += step
+            step *= 2
+        return np.concatenate(out)[:size] if out else rows[:0]
+
+    def position(self, row: int, sort: str, order: str) -> int:
+        """Posizione della riga nell'ordine (sort, order), per riprendere da un cursore."""
+        key = self.sort_key(sort)
+        return row if key is None else int(self.numeric[key].rank[order][row])
+
+    def row_id(self, row: int) -> str:
+        return self._serial_columns()["id"][row]
+
+    def sort_value(self, row: int, sort: str):
+        """Valore della chiave di ordinamento per la riga (None se mancante)."""
+        key = self.sort_key(sort)
+        if key is None or not self.numeric[key].valid[row]:
+            return None
+        v = self.numeric[key].values[row]
+        return int(v) if key == "date" else float(v)
+
+    def iter_ordered(self, rows: Optional[np.ndarray], sort: str, order: str, chunk: int = 5000):
+        """Tutte le righe in ordine, a blocchi di `chunk` indici (export/bulk)."""
+        # un solo passaggio sulla permutazione (solo indici, 8 byte per riga), poi fette
+        ordered = self.ordered(rows, sort, order)
+        for i in range(0, len(ordered), chunk):
+            yield ordered[i:i + chunk]
+
+
+def _ts_value(ts: Optional[pd.Timestamp]) -> Optional[int]:
+    if ts is None or pd.isna(ts):
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(None)
+    return int(ts.value)
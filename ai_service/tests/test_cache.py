@@ -0,0 +1,166 @@
+"""ProjectCache: budget LRU, rivalidazione su (mtime, size), caricamenti deduplicati, derivati."""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from ai_service.cache import ProjectCache
+from ai_service.store import ReviewStore
+from fastapi import HTTPException
+
+
+@pytest.fixture
+def files(tmp_path):
+    def write(name: str, size: int, mtime=None):
+        p = tmp_path / f"{name}.bin"
+        p.write_bytes(b"x" * size)
+        if mtime is not None:
+            os.utime(p, (mtime, mtime))
+        return p
+    return write
+
+
+def make_cache(tmp_path, loads, max_bytes=1000, revalidate_sec=60.0, delay=0.0):
+    def resolve(key):
+        p = tmp_path / f"{key}.bin"
+        if not p.exists():
+            raise HTTPException(status_code=404, detail=key)
+        return p
+
+    def load(path):
+        loads.append(path.stem)
+        time.sleep(delay)
+        return path.read_bytes()
+    return ProjectCache(resolve, load, max_bytes=max_bytes, revalidate_sec=revalidate_sec, sizeof=len)
+
+
+def test_lru_eviction_by_bytes(tmp_path, files):
+    for name in ("a", "b", "c"):
+        files(name, 400)
+    loads = []
+    cache = make_cache(tmp_path, loads)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")  # a diventa la più recente
+    cache.get("c")  # 1200 > 1000: esce b
+    stats = cache.stats()
+    assert sorted(stats["projects"]) == ["a", "c"] and stats["evictions"] == 1
+    assert stats["bytes"] == 800
+    cache.get("b")
+    assert loads == ["a", "b", "c", "b"]
+
+
+def test_entry_larger_than_budget_is_kept(tmp_path, files):
+    files("big", 5000)
+    cache = make_cache(tmp_path, [])
+    assert len(cache.get("big")) == 5000
+    assert cache.stats()["entries"] == 1
+
+
+def test_revalidation_reloads_only_when_file_changes(tmp_path, files):
+    files("a", 10, mtime=1_000_000)
+    loads = []
+    cache = make_cache(tmp_path, loads, revalidate_sec=0)
+    cache.get("a")
+    cache.get("a")
+    assert loads == ["a"] and cache.stats()["revalidations"] >= 1
+    files("a", 20, mtime=2_000_000)
+    assert len(cache.get("a")) == 20
+    assert loads == ["a", "a"] and cache.stats()["reloads"] == 1
+
+
+def test_revalidation_is_throttled(tmp_path, files):
+    files("a", 10, mtime=1_000_000)
+    loads = []
+    cache = make_cache(tmp_path, loads, revalidate_sec=60)
+    cache.get("a")
+    files("a", 20, mtime=2_000_000)
+    assert len(cache.get("a")) == 10  # entro revalidate_sec non si fa nemmeno la stat
+    assert cache.peek("a") is not None
+    cache.invalidate("a")
+    assert cache.peek("a") is None
+    assert len(cache.get("a")) == 20
+
+
+def test_concurrent_loads_are_deduplicated(tmp_path, files):
+    files("a", 10)
+    loads = []
+    cache = make_cache(tmp_path, loads, delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("a"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert loads == ["a"] and len(results) == 8
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["hits"] == 7
+
+
+def test_missing_project_raises_and_is_counted(tmp_path):
+    cache = make_cache(tmp_path, [])
+    with pytest.raises(HTTPException):
+        cache.get("nope")
+    assert cache.stats()["load_errors"] == 1
+
+
+def test_derived_objects_follow_their_entry(tmp_path, files):
+    files("a", 10, mtime=1_000_000)
+    built = []
+    cache = make_cache(tmp_path, [], revalidate_sec=0)
+
+    def factory(value):
+        built.append(value)
+        return {"len": len(value)}
+    assert cache.derived("a", "meta", factory) == {"len": 10}
+    assert cache.derived("a", "meta", factory) == {"len": 10}
+    files("a", 30, mtime=2_000_000)
+    assert cache.derived("a", "meta", factory) == {"len": 30}  # nuova versione del file
+    assert len(built) == 2
+
+
+class Growing:
+    """Derivato che cresce dopo la costruzione e lo segnala con on_resize."""
+
+    def __init__(self):
+        self.nbytes = 100
+        self.on_resize = None
+
+    def grow(self, n):
+        self.nbytes += n
+        self.on_resize()
+
+
+def test_resized_derived_is_reaccounted_and_evicts(tmp_path, files):
+    files("a", 300)
+    files("b", 300)
+    cache = ProjectCache(lambda k: tmp_path / f"{k}.bin", lambda p: p.read_bytes(), max_bytes=1000,
+                         sizeof=lambda v: len(v) if isinstance(v, bytes) else v.nbytes)
+    cache.get("a")
+    g = cache.derived("b", "store", lambda v: Growing())
+    assert cache.stats()["projects"]["b"]["bytes"] == 400
+    g.grow(400)  # b = 800: con a (300) si supera il budget
+    stats = cache.stats()
+    assert stats["projects"]["b"]["bytes"] == 800 and "a" not in stats["projects"]
+
+
+def test_store_lazy_structures_are_accounted(tmp_path):
+    n = 2000
+    df = pd.DataFrame({"id": [f"r{i}" for i in range(n)], "text": [f"room {i} clean" for i in range(n)],
+                       "sentiment": np.linspace(-1, 1, n)})
+    path = tmp_path / "p.pkl"
+    df.to_pickle(path)
+    cache = ProjectCache(lambda k: path, pd.read_pickle, max_bytes=1 << 30)
+    store = cache.derived("p", "store", ReviewStore)
+
+    def size():
+        return cache.stats()["projects"]["p"]["bytes"]
+    before = size()
+    store.records(np.arange(3), "p")  # colonne serializzate
+    after_serial = size()
+    store.search("clean", None)  # indice di testo
+    after_index = size()
+    assert before < after_serial < after_index
+    assert after_index - after_serial >= store.text_index().indices.nbytes
@@ -0,0 +1,119 @@
+"""Paginazione a cursore (after/position) contro quella per offset, nello store e su /reviews."""
+import numpy as np
+import pandas as pd
+import pytest
+from ai_service.routers import reviews
+from ai_service.store import ReviewStore
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+N = 3000
+
+
+@pytest.fixture(scope="module")
+def store() -> ReviewStore:
+    rng = np.random.default_rng(7)
+    sentiment = rng.uniform(-1, 1, N).round(2)  # valori ripetuti: conta lo spareggio
+    sentiment[rng.random(N) < 0.05] = np.nan
+    rating = rng.integers(1, 6, N).astype(float)
+    rating[rng.random(N) < 0.1] = np.nan
+    df = pd.DataFrame({
+        "id": [f"r{i}" for i in range(N)],
+        "clusterId": rng.choice(list("abcdefghij"), N),
+        "lang": rng.choice(["en", "it"], N),
+        "sentiment": sentiment,
+        "rating": rating,
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, N), unit="D"),
+    })
+    return ReviewStore(df)
+
+
+def walk(store: ReviewStore, rows, sort: str, order: str, size: int) -> np.ndarray:
+    """Tutte le pagine seguendo il cursore (posizione dell'ultima riga della pagina)."""
+    pages, position = [], -1
+    while True:
+        page = store.after(rows, sort, order, position, size)
+        if len(page) == 0:
+            break
+        pages.append(page)
+        position = store.position(int(page[-1]), sort, order)
+    return np.concatenate(pages) if pages else np.empty(0, dtype=np.int64)
+
+
+@pytest.mark.parametrize("sort", ["date", "sentiment", "rating"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+@pytest.mark.parametrize("filters", [
+    {},
+    {"clusterId": "c"},      # insieme piccolo: ordinamento per rank
+    {"sentimentMin": -0.9},  # insieme grande: scansione della permutazione
+    {"clusterId": "zz"},     # nessuna riga
+])
+def test_cursor_matches_offset(store, sort, order, filters):
+    rows = store.select(**filters)
+    size = 97
+    total, _ = store.page(rows, sort, order, 0, size)
+    by_offset = [store.page(rows, sort, order, start, size)[1] for start in range(0, total, size)]
+    expected = np.concatenate(by_offset) if by_offset else np.empty(0, dtype=np.int64)
+    walked = walk(store, rows, sort, order, size)
+    assert walked.tolist() == expected.tolist()
+    assert len(set(walked.tolist())) == total
+
+
+def test_cursor_resumes_mid_page(store):
+    rows = store.select(lang="it")
+    ordered = store.ordered(rows, "rating", "desc")
+    row = int(ordered[41])
+    nxt = store.after(rows, "rating", "desc", store.position(row, "rating", "desc"), 10)
+    assert nxt.tolist() == ordered[42:52].tolist()
+
+
+def test_nans_last_in_both_orders(store):
+    for order in ("asc", "desc"):
+        values = store.df["sentiment"].to_numpy()[walk(store, None, "sentiment", order, 500)]
+        n_valid = int(np.count_nonzero(~np.isnan(values)))
+        assert np.isnan(values[n_valid:]).all() and not np.isnan(values[:n_valid]).any()
+
+
+def test_unknown_sort_falls_back_to_sentiment(store):
+    assert store.sort_key("nope") == "sentiment"
+    assert store.after(None, "nope", "asc", -1, 5).tolist() == store.page(None, "sentiment", "asc", 0, 5)[1].tolist()
+
+
+# ---------------- /reviews ----------------
+@pytest.fixture(scope="module")
+def client():
+    app = FastAPI()
+    app.include_router(reviews.router)
+    with TestClient(app) as c:
+        yield c
+
+
+def test_endpoint_cursor_walk_matches_pages(client):
+    params = {"projectId": "airbnb", "sort": "sentiment", "order": "asc", "pageSize": 37}
+    by_page, page = [], 1
+    while True:
+        body = client.get("/reviews", params={**params, "page": page}).json()
+        if not body["items"]:
+            break
+        by_page += [r["id"] for r in body["items"]]
+        page += 1
+
+    first = client.get("/reviews", params=params).json()
+    walked = [r["id"] for r in first["items"]]
+    cursor = first["nextCursor"]
+    while cursor:
+        body = client.get("/reviews", params={**params, "cursor": cursor}).json()
+        assert body["page"] is None and body["total"] == first["total"]
+        walked += [r["id"] for r in body["items"]]
+        cursor = body["nextCursor"]
+    assert walked == by_page and len(walked) == first["total"]
+
+
+def test_endpoint_rejects_bad_or_mismatched_cursor(client):
+    params = {"projectId": "airbnb", "pageSize": 5}
+    cursor = client.get("/reviews", params=params).json()["nextCursor"]
+    assert client.get("/reviews", params={**params, "cursor": "not-a-cursor"}).status_code == 400
+    r = client.get("/reviews", params={**params, "cursor": cursor, "order": "asc"})
+    assert r.status_code == 400 and "sort/filters" in r.json()["detail"]
+    r = client.get("/reviews", params={**params, "cursor": cursor, "lang": "it"})
+    assert r.status_code == 400
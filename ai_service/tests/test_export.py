@@ -0,0 +1,83 @@
+"""/reviews/export: NDJSON e Arrow in streaming, stessi record e ordine di /reviews, gzip al volo."""
+import gzip
+import io
+
+import orjson
+import pytest
+from ai_service.export import arrow_available, gzip_chunks, pa
+from ai_service.routers import reviews
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+needs_arrow = pytest.mark.skipif(not arrow_available(), reason="pyarrow not usable")
+
+PARAMS = {"projectId": "airbnb", "sort": "rating", "order": "desc", "lang": "it"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(reviews, "EXPORT_CHUNK_ROWS", 50)  # più blocchi anche sui dati di esempio
+    app = FastAPI()
+    app.include_router(reviews.router)
+    with TestClient(app) as c:
+        yield c
+
+
+def all_pages(client, params) -> list:
+    body = client.get("/reviews", params={**params, "pageSize": 200}).json()
+    items, page = body["items"], 1
+    while len(items) < body["total"]:
+        page += 1
+        items += client.get("/reviews", params={**params, "pageSize": 200, "page": page}).json()["items"]
+    return items
+
+
+def test_ndjson_matches_reviews_pages(client):
+    r = client.get("/reviews/export", params=PARAMS, headers={"Accept-Encoding": "identity"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert 'filename="airbnb_reviews.ndjson"' in r.headers["content-disposition"]
+    assert "content-encoding" not in r.headers
+    records = [orjson.loads(line) for line in r.content.splitlines()]
+    assert int(r.headers["x-total-count"]) == len(records) > 50
+    assert records == all_pages(client, PARAMS)
+
+
+def test_gzip_is_compressed_on_the_fly(client):
+    with client.stream("GET", "/reviews/export", params=PARAMS, headers={"Accept-Encoding": "gzip"}) as r:
+        assert r.headers["content-encoding"] == "gzip"
+        raw = b"".join(r.iter_raw())
+    plain = client.get("/reviews/export", params=PARAMS, headers={"Accept-Encoding": "identity"}).content
+    assert gzip.decompress(raw) == plain and len(raw) < len(plain)
+
+
+def test_gzip_chunks_roundtrip():
+    parts = [b"a" * 1000, b"", b"b" * 10]
+    assert gzip.decompress(b"".join(gzip_chunks(iter(parts)))) == b"".join(parts)
+
+
+@needs_arrow
+def test_arrow_matches_ndjson(client):
+    r = client.get("/reviews/export", params={**PARAMS, "format": "arrow"}, headers={"Accept-Encoding": "identity"})
+    assert r.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(io.BytesIO(r.content)).read_all()
+    assert table.num_rows == int(r.headers["x-total-count"])
+    assert table.to_pylist() == all_pages(client, PARAMS)
+
+
+def test_empty_export(client):
+    r = client.get("/reviews/export", params={**PARAMS, "clusterId": "nope"})
+    assert r.headers["x-total-count"] == "0" and r.content == b""
+
+
+@needs_arrow
+def test_empty_arrow_export_is_a_valid_stream(client):
+    params = {**PARAMS, "clusterId": "nope"}
+    r = client.get("/reviews/export", params={**params, "format": "arrow"})
+    assert pa.ipc.open_stream(io.BytesIO(r.content)).read_all().num_rows == 0
+
+
+def test_arrow_without_pyarrow_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(reviews, "arrow_available", lambda: False)
+    r = client.get("/reviews/export", params={**PARAMS, "format": "arrow"})
+    assert r.status_code == 400 and "pyarrow" in r.json()["detail"]
@@ -0,0 +1,129 @@
+"""FacetCube: gruppi dal cubo, maschere sui bordi dei bucket e riaggregazione delle righe."""
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from ai_service.stats import BAND_WIDTH, FacetCube
+from ai_service.store import ReviewStore
+
+N = 2000
+
+
+@pytest.fixture(scope="module")
+def df() -> pd.DataFrame:
+    rng = np.random.default_rng(11)
+    sentiment = rng.uniform(-1, 1, N).round(2)  # molti valori esattamente sui bordi di banda
+    sentiment[rng.random(N) < 0.05] = np.nan
+    rating = rng.integers(1, 6, N).astype(float)
+    rating[rng.random(N) < 0.1] = np.nan
+    return pd.DataFrame({
+        "id": [f"r{i}" for i in range(N)],
+        "clusterId": rng.choice(list("abcd"), N),
+        "lang": rng.choice(["en", "it"], N),
+        "sentiment": sentiment,
+        "rating": rating,
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, N), unit="D"),
+    })
+
+
+@pytest.fixture(scope="module")
+def cube(df) -> FacetCube:
+    return FacetCube(df)
+
+
+@pytest.fixture(scope="module")
+def store(df) -> ReviewStore:
+    return ReviewStore(df)
+
+
+def reference(sub: pd.DataFrame, by: list) -> list:
+    """Gruppi calcolati con pandas, nello stesso ordine e formato del cubo."""
+    keys = pd.DataFrame({
+        "clusterId": sub["clusterId"],
+        "lang": sub["lang"],
+        "rating": sub["rating"],
+        "month": sub["date"].dt.strftime("%Y-%m"),
+        # banda k = [-1 + k·w, -1 + (k+1)·w), con 1.0 nell'ultima
+        "sentimentBand": np.minimum(np.floor((sub["sentiment"] + 1) / BAND_WIDTH + 1e-9), 2 / BAND_WIDTH - 1),
+    })
+    out = []
+    for key, g in sub.groupby([keys[name] for name in by], dropna=False, sort=True):
+        key = key if isinstance(key, tuple) else (key,)
+        item = {}
+        for name, v in zip(by, key):
+            if pd.isna(v):
+                item[name] = None
+            elif name == "sentimentBand":
+                item[name] = round(-1 + int(v) * BAND_WIDTH, 2)
+            elif name == "rating":
+                item[name] = int(v)
+            else:
+                item[name] = v
+        item["count"] = len(g)
+        item["sentimentMean"] = g["sentiment"].mean() if g["sentiment"].notna().any() else None
+        item["ratingMean"] = g["rating"].mean() if g["rating"].notna().any() else None
+        out.append(item)
+    return out
+
+
+def assert_facets(got: list, want: list):
+    def key(item):
+        return tuple((v is None, v if v is not None else "") for k, v in item.items() if k not in (
+            "count", "sentimentMean", "ratingMean"))
+    got, want = sorted(got, key=key), sorted(want, key=key)
+    assert [key(g) for g in got] == [key(w) for w in want]
+    for g, w in zip(got, want):
+        assert g["count"] == w["count"]
+        for m in ("sentimentMean", "ratingMean"):
+            assert (g[m] is None) == (w[m] is None)
+            assert g[m] is None or math.isclose(g[m], w[m], rel_tol=1e-9)
+
+
+@pytest.mark.parametrize("by", [[], ["clusterId"], ["lang", "rating"], ["month"], ["sentimentBand"],
+                                ["clusterId", "month", "sentimentBand"]])
+def test_unfiltered_facets_match_pandas(cube, df, by):
+    out = cube.facets(by, cube.cells)
+    assert out["total"] == N
+    if by:
+        assert_facets(out["facets"], reference(df, by))
+    else:
+        assert out["facets"][0]["count"] == N
+
+
+@pytest.mark.parametrize("filters", [
+    {"clusterId": "a", "lang": "it"},
+    {"ratingMin": 2, "ratingMax": 4},
+    {"sentimentMin": -0.25, "sentimentMax": 0.5},  # multipli di BAND_WIDTH
+    {"sentimentMin": 0.95, "sentimentMax": 1.0},
+    {"dateFrom": pd.Timestamp("2024-03-01"), "dateTo": pd.Timestamp("2024-06-30")},  # mesi interi
+])
+def test_aligned_filters_use_the_cube(cube, store, df, filters):
+    mask = cube.cell_mask(**filters)
+    assert mask is not None
+    rows = store.select(**filters)
+    for by in (["clusterId"], ["month", "sentimentBand"]):
+        got = cube.facets(by, cube.cells, mask)
+        assert got == cube.facets(by, cube.measures_for_rows(rows))
+        assert_facets(got["facets"], reference(df.iloc[rows], by))
+
+
+@pytest.mark.parametrize("filters", [
+    {"sentimentMin": 0.12},
+    {"sentimentMax": -0.33},
+    {"dateFrom": pd.Timestamp("2024-03-15")},
+    {"dateTo": pd.Timestamp("2024-06-29")},
+])
+def test_unaligned_filters_fall_back_to_rows(cube, store, df, filters):
+    assert cube.cell_mask(**filters) is None
+    rows = store.select(**filters)
+    got = cube.facets(["lang", "sentimentBand"], cube.measures_for_rows(rows))
+    assert got["total"] == len(rows)
+    assert_facets(got["facets"], reference(df.iloc[rows], ["lang", "sentimentBand"]))
+
+
+def test_dates_with_time_never_use_month_masks():
+    df = pd.DataFrame({"sentiment": [0.1, 0.2], "date": pd.to_datetime(["2024-01-01 10:00", "2024-02-01 00:00"])})
+    cube = FacetCube(df)
+    assert cube.cell_mask(dateFrom=pd.Timestamp("2024-01-01")) is None
+    assert cube.facets(["month"], cube.cells)["facets"][0]["month"] == "2024-01"
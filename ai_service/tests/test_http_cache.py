@@ -0,0 +1,172 @@
+"""Middleware HTTP: ETag/304 per policy di route e negoziazione della compressione."""
+import gzip
+
+import pytest
+from ai_service import http_cache
+from ai_service.http_cache import (
+    CachePolicy,
+    CompressionMiddleware,
+    ConditionalGetMiddleware,
+    etag_matches,
+    negotiate,
+    register_policy,
+)
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+BIG = b'{"rows": [' + b",".join(b'{"i": %d}' % i for i in range(500)) + b"]}"
+CALLS = []
+VERSION = {"v": "1"}
+
+# path propri dei test: le policy sono registrate a livello di modulo
+register_policy(r"/t/data", CachePolicy("public, max-age=0", version=lambda query: VERSION["v"]))
+register_policy(r"/t/stale", CachePolicy("no-store"))
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/t/data")
+    def data(page: int = 1):
+        CALLS.append(page)
+        return Response(BIG, media_type="application/json")
+
+    @app.get("/t/stale")
+    def stale():
+        return Response(BIG, media_type="application/json")
+
+    @app.get("/t/small")
+    def small():
+        return {"a": 1}
+
+    @app.get("/t/png")
+    def png():
+        return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+    @app.get("/t/stream")
+    def stream():
+        return StreamingResponse(iter([BIG, BIG]), media_type="application/x-ndjson", headers={"ETag": '"s1"'})
+
+    @app.get("/t/sse")
+    def sse():
+        return StreamingResponse(iter([b"data: x\n\n" * 500]), media_type="text/event-stream")
+
+    @app.get("/t/encoded")
+    def encoded():
+        return Response(gzip.compress(BIG), media_type="application/json", headers={"Content-Encoding": "gzip"})
+
+    @app.get("/t/missing")
+    def missing():
+        return PlainTextResponse("nope", status_code=404)
+
+    # stesso ordine di main.py: la compressione avvolge il GET condizionale
+    app.add_middleware(ConditionalGetMiddleware)
+    app.add_middleware(CompressionMiddleware)
+    return app
+
+
+@pytest.fixture
+def client():
+    CALLS.clear()
+    VERSION["v"] = "1"
+    return TestClient(make_app())
+
+
+@pytest.mark.parametrize("header,available,expected", [
+    ("gzip, deflate, br", ("br", "gzip"), "br"),
+    ("gzip, deflate, br", ("gzip",), "gzip"),
+    ("br;q=0, gzip", ("br", "gzip"), "gzip"),
+    ("gzip;q=0", ("gzip",), "identity"),
+    ("*", ("gzip",), "gzip"),
+    ("identity", ("br", "gzip"), "identity"),
+    ("", ("gzip",), "identity"),
+])
+def test_negotiate(header, available, expected):
+    assert negotiate(header, available) == expected
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x", "abc-gzip"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_conditional_get_skips_handler(client):
+    r = client.get("/t/data", headers={"accept-encoding": "identity"})
+    assert r.status_code == 200 and r.headers["cache-control"] == "public, max-age=0"
+    etag = r.headers["etag"]
+    assert CALLS == [1]
+
+    r = client.get("/t/data", headers={"if-none-match": etag, "accept-encoding": "identity"})
+    assert r.status_code == 304 and r.content == b"" and r.headers["etag"] == etag
+    assert CALLS == [1]
+
+    # query diversa o dati cambiati: ETag diverso, l'handler viene eseguito
+    assert client.get("/t/data?page=2", headers={"if-none-match": etag}).status_code == 200
+    VERSION["v"] = "2"
+    assert client.get("/t/data", headers={"if-none-match": etag}).status_code == 200
+    assert CALLS == [1, 2, 1]
+
+
+def test_compressed_etag_revalidates(client):
+    r = client.get("/t/data", headers={"accept-encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["etag"].endswith('-gzip"')
+    assert r.content == BIG  # httpx decodifica il gzip
+    r = client.get("/t/data", headers={"accept-encoding": "gzip", "if-none-match": r.headers["etag"]})
+    assert r.status_code == 304
+    assert r.headers["etag"].endswith('-gzip"')
+
+
+def test_policy_without_version_has_no_etag(client):
+    r = client.get("/t/stale")
+    assert r.headers["cache-control"] == "no-store" and "etag" not in r.headers
+
+
+def test_compression_rules(client):
+    r = client.get("/t/stale", headers={"accept-encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip" and "accept-encoding" in r.headers["vary"].lower()
+    assert int(r.headers["content-length"]) < len(BIG)
+
+    assert "content-encoding" not in client.get("/t/stale", headers={"accept-encoding": "identity"}).headers
+    small = client.get("/t/small", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in small.headers and small.json() == {"a": 1}
+    assert "content-encoding" not in client.get("/t/png", headers={"accept-encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/t/sse", headers={"accept-encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/t/missing", headers={"accept-encoding": "gzip"}).headers
+
+
+def test_already_encoded_response_untouched(client):
+    r = client.get("/t/encoded", headers={"accept-encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip" and r.content == BIG
+
+
+def test_streaming_response_compressed(client):
+    r = client.get("/t/stream", headers={"accept-encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["etag"] == '"s1-gzip"'
+    assert "content-length" not in r.headers
+    assert r.content == BIG + BIG
+
+
+@pytest.mark.skipif(http_cache.brotli is None, reason="brotli non installato")
+def test_brotli_preferred(client):
+    r = client.get("/t/stale", headers={"accept-encoding": "gzip, br"})
+    assert r.headers["content-encoding"] == "br"
+
+
+def test_app_middleware_order_on_data_routes():
+    from ai_service.main import create_app
+
+    app = TestClient(create_app(lazy=True))  # senza lifespan: nessun worker dei job
+    params = {"projectId": "airbnb", "pageSize": 200}
+    r = app.get("/reviews", params=params, headers={"accept-encoding": "gzip"})
+    assert r.status_code == 200 and r.headers["content-encoding"] == "gzip"
+    etag = r.headers["etag"]
+    assert etag.endswith('-gzip"') and "accept-encoding" in r.headers["vary"].lower()
+    r = app.get("/reviews", params=params, headers={"accept-encoding": "gzip", "if-none-match": etag})
+    assert r.status_code == 304 and r.headers["etag"] == etag
@@ -0,0 +1,189 @@
+"""Router /jobs in modalità inline su MemoryKV."""
+import uuid
+
+import orjson
+import pytest
+from ai_service import kv as kv_module
+from ai_service.kv import MemoryKV
+from ai_service.models import CreateJobRequest
+from ai_service.routers import jobs
+from ai_service.runner import fingerprint_key, job_key, utcnow_iso
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+BODY = {"dataset_url": "x", "dataset_type": "airbnb", "project_name": "Airbnb", "project_id": "airbnb",
+        "options": {"mode": "summary"}}
+
+
+def queued_job():
+    now = utcnow_iso()
+    return {"id": str(uuid.uuid4()), "status": "queued", "progress": 0.0, "message": "queued",
+            "params": {"project_id": "airbnb", "options": {"mode": "summary"}}, "fingerprint": None,
+            "memoize": True, "result": None, "error": None, "created_at": now, "updated_at": now,
+            "completed_at": None}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(kv_module, "_KV", MemoryKV())
+    monkeypatch.setattr(jobs.RUNNER, "inline", True)
+    app = FastAPI()
+    app.include_router(jobs.router)
+    with TestClient(app) as c:
+        yield c
+
+
+def test_post_runs_the_job_inline(client):
+    created = client.post("/jobs/analyze", json=BODY).json()
+    assert created["status"] == "completed" and created["result"]["project_id"] == "airbnb"
+    status = client.get(f"/jobs/{created['job_id']}").json()
+    assert status["status"] == "completed" and status["result"] == created["result"]
+
+
+def test_polling_is_read_only_and_run_executes_queued_job(client):
+    job = queued_job()
+    client.portal.call(jobs.RUNNER.enqueue, job)  # rimasto in coda: la funzione si è fermata prima
+    for _ in range(2):
+        r = client.get(f"/jobs/{job['id']}")
+        assert r.json()["status"] == "queued" and r.json()["version"] == 1
+    ran = client.post(f"/jobs/{job['id']}/run").json()
+    assert ran["status"] == "completed" and ran["result"]["total_reviews"] > 0
+    # non più in coda: restituisce il record senza rieseguire
+    again = client.post(f"/jobs/{job['id']}/run").json()
+    assert again["version"] == ran["version"]
+    assert client.post("/jobs/missing/run").status_code == 404
+
+
+def test_run_is_rejected_with_background_workers(client, monkeypatch):
+    monkeypatch.setattr(jobs.RUNNER, "inline", False)
+    r = client.post("/jobs/whatever/run")
+    assert r.status_code == 409 and "background" in r.json()["detail"]
+
+
+def test_cancel_finished_and_unknown_job(client):
+    job_id = client.post("/jobs/analyze", json=BODY).json()["job_id"]
+    assert client.post(f"/jobs/{job_id}/cancel").json()["status"] == "completed"
+    assert client.post("/jobs/missing/cancel").status_code == 404
+
+
+def test_list_views_filters_and_pages(client):
+    ok = [client.post("/jobs/analyze", params={"force": "true"}, json=BODY).json()["job_id"] for _ in range(2)]
+    failed = client.post("/jobs/analyze", json=dict(BODY, project_id="nope")).json()["job_id"]
+
+    full = client.get("/jobs").json()
+    summary = client.get("/jobs", params={"view": "summary"}).json()
+    assert [j["id"] for j in full] == [j["id"] for j in summary]
+    assert set(j["id"] for j in full) == {*ok, failed}
+    assert "result" in full[0] and "result" not in summary[0] and "params" not in summary[0]
+    by_id = {j["id"]: j for j in summary}
+    assert by_id[ok[0]]["mode"] == "summary" and by_id[ok[0]]["project_id"] == "airbnb"
+    assert by_id[failed]["status"] == "failed" and by_id[failed]["error"]
+    assert full[0]["created_at"] == summary[0]["created_at"] and summary[0]["created_at"].endswith("Z")
+
+    assert [j["id"] for j in client.get("/jobs", params={"status": "failed"}).json()] == [failed]
+    assert sorted(j["id"] for j in client.get("/jobs", params={"status": "completed"}).json()) == sorted(ok)
+    assert client.get("/jobs", params={"status": "queued"}).json() == []
+    pages = [client.get("/jobs", params={"limit": 2, "offset": o}).json() for o in (0, 2)]
+    assert [j["id"] for j in pages[0] + pages[1]] == [j["id"] for j in full]
+    assert client.get("/jobs", params={"status": "bogus"}).status_code == 400
+
+
+def test_list_skips_expired_records(client):
+    job_id = client.post("/jobs/analyze", json=BODY).json()["job_id"]
+    client.portal.call(kv_module._KV.delete, job_key(job_id))  # TTL scaduto, id ancora nell'indice
+    assert client.get("/jobs").json() == []
+
+
+def body_fingerprint(body=BODY) -> str:
+    fingerprint, _ = jobs._fingerprint(CreateJobRequest(**body).model_dump(), "summary")
+    return fingerprint_key(fingerprint)
+
+
+def test_identical_job_reuses_result(client):
+    first = client.post("/jobs/analyze", json=BODY).json()
+    assert first["status"] == "completed" and not first["deduplicated"]
+    again = client.post("/jobs/analyze", json=BODY).json()
+    assert again["deduplicated"] and again["job_id"] == first["job_id"]
+    assert again["message"] == "cached result" and again["result"] == first["result"]
+    forced = client.post("/jobs/analyze", params={"force": "true"}, json=BODY).json()
+    assert forced["job_id"] != first["job_id"] and not forced["deduplicated"]
+
+
+def test_missing_project_is_not_deduplicated(client):
+    body = dict(BODY, project_id="nope")
+    a = client.post("/jobs/analyze", json=body).json()
+    b = client.post("/jobs/analyze", json=body).json()
+    assert a["status"] == "failed" and a["job_id"] != b["job_id"]
+
+
+def test_lost_fingerprint_swap_attaches_to_winner(client, monkeypatch):
+    store = kv_module._KV
+    winner = queued_job()
+    winner["fingerprint"] = body_fingerprint()
+    client.portal.call(jobs.RUNNER.enqueue, winner)
+    client.portal.call(lambda: store.set(body_fingerprint(), winner["id"], ex=60))
+    # la lettura iniziale precede la presa dell'impronta da parte del vincitore
+    real_get, stale = store.get, [True]
+
+    async def get(key):
+        if key == body_fingerprint() and stale:
+            stale.clear()
+            return None
+        return await real_get(key)
+    monkeypatch.setattr(store, "get", get)
+
+    out = client.post("/jobs/analyze", json=BODY).json()
+    assert out["deduplicated"] and out["job_id"] == winner["id"]
+    assert out["message"] == "attached to in-flight job"
+    assert [j["id"] for j in client.get("/jobs").json()] == [winner["id"]]
+
+
+def test_stale_fingerprint_of_failed_job_is_replaced(client):
+    failed = client.post("/jobs/analyze", json=dict(BODY, project_id="nope")).json()["job_id"]
+    # impronta rimasta su un job fallito (es. scritta prima della sua chiusura)
+    client.portal.call(lambda: kv_module._KV.set(body_fingerprint(), failed, ex=60))
+    out = client.post("/jobs/analyze", json=BODY).json()
+    assert not out["deduplicated"] and out["status"] == "completed"
+    assert client.portal.call(kv_module._KV.get, body_fingerprint()) == out["job_id"]
+
+
+def test_conditional_get_and_long_poll(client):
+    job = queued_job()
+    client.portal.call(jobs.RUNNER.enqueue, job)
+    r = client.get(f"/jobs/{job['id']}")
+    etag = r.headers["etag"]
+    assert etag == f'"{job["id"]}:1"'
+    assert client.get(f"/jobs/{job['id']}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/jobs/{job['id']}", params={"version": 1}).status_code == 304
+    # long-poll senza cambiamenti: 304 alla scadenza
+    assert client.get(f"/jobs/{job['id']}", params={"version": 1, "wait": 0.1}).status_code == 304
+    client.post(f"/jobs/{job['id']}/run")
+    r = client.get(f"/jobs/{job['id']}", params={"version": 1, "wait": 5})
+    assert r.status_code == 200 and r.json()["status"] == "completed"
+    # job concluso: nessuna attesa
+    current = r.json()["version"]
+    assert client.get(f"/jobs/{job['id']}", params={"version": current, "wait": 30}).status_code == 304
+
+
+def sse_events(text: str) -> list:
+    events = []
+    for block in text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            events.append(fields)
+    return events
+
+
+def test_events_stream_closes_after_final_status(client):
+    created = client.post("/jobs/analyze", json=BODY).json()
+    r = client.get(f"/jobs/{created['job_id']}/events")
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert r.text.startswith("retry: ")
+    events = sse_events(r.text)
+    assert [e["event"] for e in events] == ["status"]
+    status = orjson.loads(events[0]["data"])
+    assert status["status"] == "completed" and events[0]["id"] == str(status["version"])
+    # il client ha già quella versione: nessun evento, lo stream si chiude
+    again = client.get(f"/jobs/{created['job_id']}/events", headers={"Last-Event-ID": events[0]["id"]})
+    assert sse_events(again.text) == []
+    assert client.get("/jobs/missing/events").status_code == 404
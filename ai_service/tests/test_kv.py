@@ -0,0 +1,151 @@
+"""Backend KV locali (MemoryKV, SQLiteKV): stessi risultati dei comandi Redis/Upstash."""
+import asyncio
+import json
+
+import pytest
+from ai_service import kv as kv_module
+from ai_service.kv import (
+    MemoryKV,
+    SQLiteKV,
+    SyncLocalKV,
+    compare_set_cmd,
+    get_kv,
+    get_sync_kv,
+    versioned_set_cmd,
+)
+from fastapi import HTTPException
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def kv(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryKV()
+        return
+    store = SQLiteKV(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_strings(kv):
+    async def go():
+        assert await kv.set("a", "1") is True
+        assert await kv.set("a", "2", nx=True) is False
+        assert await kv.get("a") == "1"
+        assert await kv.mget(["a", "missing"]) == ["1", None]
+        await kv.expire("a", 0)
+        assert await kv.get("a") is None
+        assert await kv.set("a", "3", ex=60, nx=True) is True
+        await kv.delete("a")
+        assert await kv.get("a") is None
+    run(go())
+
+
+def test_sorted_set(kv):
+    async def go():
+        for score, member in ((1, "x"), (3, "z"), (2, "y"), (2, "w")):
+            await kv.zadd("idx", score, member)
+        assert await kv.zrevrange("idx", 0, -1) == ["z", "y", "w", "x"]
+        assert await kv.zrevrange("idx", 1, 2) == ["y", "w"]
+        await kv.command("ZREM", "idx", "y")
+        await kv.command("ZREMRANGEBYSCORE", "idx", "-inf", 1)
+        assert await kv.zrevrange("idx", 0, -1) == ["z", "w"]
+    run(go())
+
+
+def test_lists(kv):
+    async def go():
+        for v in ("j1", "j2", "j3", "j1"):
+            await kv.rpush("q", v)
+        assert await kv.lmove("q", "p") == "j1"
+        assert await kv.lmove("q", "p") == "j2"
+        assert await kv.command("LRANGE", "p", 0, -1) == ["j1", "j2"]
+        assert await kv.command("LREM", "q", 0, "j1") == 1
+        assert await kv.lpop("q") == "j3"
+        assert await kv.lpop("q") is None
+        assert await kv.lmove("q", "p") is None
+        assert await kv.command("LREM", "p", 1, "j1") == 1
+        assert await kv.command("LRANGE", "p", 0, -1) == ["j2"]
+    run(go())
+
+
+def test_pipeline_and_multi(kv):
+    async def go():
+        res = await kv.pipeline([["SET", "k", "v", "NX"], ["GET", "k"], ["SET", "k", "w", "NX"]])
+        assert res == ["OK", "v", None]
+        res = await kv.multi([["RPUSH", "l", "a"], ["LMOVE", "l", "m", "LEFT", "RIGHT"], ["LRANGE", "m", 0, -1]])
+        assert res[1:] == ["a", ["a"]]
+    run(go())
+
+
+def test_sync_view_shares_data(kv):
+    sync = SyncLocalKV(kv)
+    sync.set("s", "1")
+    assert run(kv.get("s")) == "1"
+    sync.rpush("q", "a")
+    assert sync.lmove("q", "p") == "a"
+
+
+def test_unsupported_command(kv):
+    with pytest.raises(HTTPException) as e:
+        run(kv.command("BOGUS", "x"))
+    assert e.value.status_code == 500
+
+
+def test_sqlite_shared_between_instances(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    a, b = SQLiteKV(path), SQLiteKV(path)
+    try:
+        run(a.rpush("q", "j1"))
+        assert run(b.lmove("q", "p")) == "j1"
+        assert run(a.command("LRANGE", "p", 0, -1)) == ["j1"]
+    finally:
+        a.close()
+        b.close()
+
+
+def test_backend_selection(monkeypatch, tmp_path):
+    for name in ("_KV", "_SYNC_KV"):
+        monkeypatch.setattr(kv_module, name, None)
+    monkeypatch.setattr(kv_module, "JOBS_SQLITE_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setenv("JOBS_KV_BACKEND", "sqlite")
+    store = get_kv()
+    try:
+        assert isinstance(store, SQLiteKV) and get_kv() is store
+        sync = get_sync_kv()
+        assert isinstance(sync, SyncLocalKV)
+        sync.set("k", "v")
+        assert run(store.get("k")) == "v"
+    finally:
+        store.close()
+    monkeypatch.setattr(kv_module, "_KV", None)
+    monkeypatch.setenv("JOBS_KV_BACKEND", "memory")
+    assert isinstance(get_kv(), MemoryKV)
+
+
+def test_compare_set(kv):
+    async def go():
+        assert await kv.command(*compare_set_cmd("fp", None, "j1", ex=60)) == 1
+        assert await kv.command(*compare_set_cmd("fp", None, "j2", ex=60)) == 0  # non più assente
+        assert await kv.command(*compare_set_cmd("fp", "j0", "j2", ex=60)) == 0
+        assert await kv.command(*compare_set_cmd("fp", "j1", "j2", ex=60)) == 1
+        assert await kv.get("fp") == "j2"
+    run(go())
+
+
+def test_versioned_set(kv):
+    async def go():
+        first = json.dumps({"id": "j", "version": 1})
+        assert await kv.command(*versioned_set_cmd("job:j", first, 0, ex=60, then=[["RPUSH", "q", "j"]])) == 1
+        # versione attesa superata: niente scrittura e niente comandi collegati
+        stale = json.dumps({"id": "j", "version": 1, "stale": True})
+        assert await kv.command(*versioned_set_cmd("job:j", stale, 0, ex=60, then=[["RPUSH", "q", "j"]])) == 0
+        assert json.loads(await kv.get("job:j")) == {"id": "j", "version": 1}
+        assert await kv.command("LRANGE", "q", 0, -1) == ["j"]
+        second = json.dumps({"id": "j", "version": 2})
+        assert await kv.command(*versioned_set_cmd("job:j", second, 1, ex=60)) == 1
+        assert json.loads(await kv.get("job:j"))["version"] == 2
+    run(go())
@@ -0,0 +1,86 @@
+"""/projects/{id}: sezioni, codifiche negoziate ed ETag forti per rappresentazione."""
+import gzip
+import json
+import os
+
+import pytest
+from ai_service.cache import ProjectCache
+from ai_service.projects import ProjectDocument, brotli_available
+from ai_service.routers import projects
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+DOC = {
+    "meta": {"id": "demo", "name": "Demo"},
+    "aggregates": {"reviews": 3, "sentiment": 0.25},
+    "clusters": [{"id": f"c{i}", "label": "camera pulita " * 20} for i in range(30)],
+    "personas": [],
+}
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    (tmp_path / "demo.json").write_text(json.dumps(DOC))
+    monkeypatch.setenv("INSIGHTS_DATA_DIR", str(tmp_path))
+    cache = ProjectCache(projects._resolve_document, ProjectDocument.load, max_bytes=1 << 20, revalidate_sec=0)
+    monkeypatch.setattr(projects, "DOCUMENT_CACHE", cache)
+    return tmp_path
+
+
+@pytest.fixture
+def client(data_dir):
+    app = FastAPI()
+    app.include_router(projects.router)
+    with TestClient(app) as c:
+        yield c
+
+
+def get(client, path, encoding="identity", **kw):
+    return client.get(path, headers={"Accept-Encoding": encoding, **kw.pop("headers", {})}, **kw)
+
+
+def test_full_document_and_sections(client):
+    r = get(client, "/projects/demo")
+    assert r.json() == DOC and "content-encoding" not in r.headers
+    assert r.headers["cache-control"] == "public, no-cache" and r.headers["vary"] == "Accept-Encoding"
+    # sezioni nell'ordine del documento, qualunque sia l'ordine richiesto
+    r = get(client, "/projects/demo", params={"sections": "clusters, meta"})
+    assert list(r.json()) == ["meta", "clusters"] and r.json()["clusters"] == DOC["clusters"]
+    assert get(client, "/projects/demo", params={"sections": "meta,nope"}).status_code == 400
+    assert get(client, "/projects/missing").status_code == 404
+    assert get(client, "/projects/..%2Fdemo").status_code == 404
+
+
+def test_gzip_body_and_etag_per_encoding(client):
+    plain = get(client, "/projects/demo")
+    with client.stream("GET", "/projects/demo", headers={"Accept-Encoding": "gzip"}) as r:
+        assert r.headers["content-encoding"] == "gzip"
+        raw = b"".join(r.iter_raw())
+        zipped_etag = r.headers["etag"]
+    assert gzip.decompress(raw) == plain.content and len(raw) < len(plain.content)
+    assert zipped_etag == plain.headers["etag"][:-1] + '-gzip"'
+    sub = get(client, "/projects/demo", params={"sections": "meta"})
+    assert sub.headers["etag"] != plain.headers["etag"]
+
+
+def test_brotli_only_when_installed(client):
+    r = get(client, "/projects/demo", encoding="br, gzip")
+    assert r.headers["content-encoding"] == ("br" if brotli_available() else "gzip")
+    assert r.json() == DOC
+
+
+def test_if_none_match_and_file_change(client, data_dir):
+    etag = get(client, "/projects/demo").headers["etag"]
+    r = get(client, "/projects/demo", headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b"" and r.headers["etag"] == etag
+    # confronto debole: il tag di un'altra codifica dello stesso contenuto vale
+    r = get(client, "/projects/demo", "gzip", headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.headers["etag"] == etag[:-1] + '-gzip"'
+
+    path = data_dir / "demo.json"
+    path.write_text(json.dumps({**DOC, "personas": [{"id": "p1"}]}))
+    st = path.stat()
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+    r = get(client, "/projects/demo", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.json()["personas"] == [{"id": "p1"}]
+    assert r.headers["etag"] != etag
@@ -0,0 +1,72 @@
+"""RestKV contro un finto endpoint REST Upstash: pipeline e multi-exec in un round-trip, client riusato."""
+import asyncio
+import json
+
+import httpx
+import pytest
+from ai_service import kv as kv_module
+from ai_service.kv import MemoryKV, RestKV
+from fastapi import HTTPException
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Endpoint REST finto su MemoryKV; registra (path, comandi) di ogni richiesta."""
+    store, requests = MemoryKV(), []
+
+    def run(cmd):
+        try:
+            return {"result": store.execute(cmd)}
+        except HTTPException as e:
+            return {"error": e.detail}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["authorization"] == "Bearer t0k"
+        body = json.loads(request.content)
+        requests.append((request.url.path, body))
+        if request.url.path == "/":
+            return httpx.Response(200, json=run(body))
+        return httpx.Response(200, json=[run(c) for c in body])
+
+    monkeypatch.setattr(kv_module, "_client_options", lambda: {"transport": httpx.MockTransport(handler)})
+    return requests
+
+
+def test_pipeline_and_multi_are_one_request_each(server):
+    kv = RestKV("https://kv.example/", "t0k")
+
+    async def go():
+        assert await kv.pipeline([["SET", "a", "1"], ["RPUSH", "q", "x"], ["GET", "a"]]) == ["OK", 1, "1"]
+        assert await kv.multi([["LMOVE", "q", "p", "LEFT", "RIGHT"], ["DEL", "a"]]) == ["x", 1]
+        assert await kv.pipeline([]) == [] and await kv.multi([]) == []
+        await kv.aclose()
+    asyncio.run(go())
+    assert [path for path, _ in server] == ["/pipeline", "/multi-exec"]
+    assert server[0][1][1] == ["RPUSH", "q", "x"]
+
+
+def test_client_is_reused_within_a_loop(server):
+    kv = RestKV("https://kv.example", "t0k")
+
+    async def go():
+        first = kv._http()
+        await kv.set("k", "v", ex=10)
+        assert await kv.get("k") == "v"
+        assert kv._http() is first
+        await kv.aclose()
+        assert kv._http() is not first  # chiuso: se ne apre un altro
+        await kv.aclose()
+    asyncio.run(go())
+    assert [path for path, _ in server] == ["/", "/"]
+    assert server[0][1] == ["SET", "k", "v", "EX", 10]
+
+
+def test_command_errors_inside_a_pipeline_raise(server):
+    kv = RestKV("https://kv.example", "t0k")
+
+    async def go():
+        with pytest.raises(HTTPException) as e:
+            await kv.pipeline([["GET", "a"], ["EVAL", "return 1", 0]])
+        assert e.value.status_code == 500 and "EVAL" in e.value.detail
+        await kv.aclose()
+    asyncio.run(go())
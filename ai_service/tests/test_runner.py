@@ -0,0 +1,243 @@
+"""JobRunner su MemoryKV: esecuzione inline, coda, lista di lavorazione e reaper."""
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+from ai_service import runner
+from ai_service.kv import MemoryKV
+from ai_service.runner import (
+    JOBS_PROCESSING_KEY,
+    JOBS_QUEUE_KEY,
+    JobCancelledError,
+    JobRunner,
+    fingerprint_key,
+    job_key,
+    load_job,
+    lock_key,
+    save_job,
+    status_key,
+    utcnow_iso,
+)
+
+
+@pytest.fixture(autouse=True)
+def fast_flush(monkeypatch):
+    monkeypatch.setattr(runner, "JOB_PROGRESS_FLUSH_SEC", 0.02)
+
+
+def new_job(fingerprint=None, memoize=True, **params):
+    now = utcnow_iso()
+    return {"id": str(uuid.uuid4()), "status": "queued", "progress": 0.0, "message": "queued",
+            "params": params, "fingerprint": fingerprint, "memoize": memoize, "result": None,
+            "error": None, "created_at": now, "updated_at": now, "completed_at": None}
+
+
+def test_inline_run_completes():
+    kv = MemoryKV()
+    progress_seen = []
+
+    def handler(params, progress):
+        progress(50.0, "half")
+        progress_seen.append(True)
+        return {"echo": params["x"]}
+    rn = JobRunner(lambda: kv, handler, inline=True)
+
+    async def go():
+        job = new_job(x=1)
+        await rn.enqueue(job)
+        assert await kv.command("LRANGE", JOBS_QUEUE_KEY, 0, -1) == [job["id"]]
+        await rn.run_inline(job["id"])
+        done = await load_job(kv, job["id"])
+        assert done["status"] == "completed" and done["result"] == {"echo": 1}
+        assert done["progress"] == 100.0 and done["completed_at"]
+        assert await kv.zrevrange(status_key("completed"), 0, -1) == [job["id"]]
+        assert await kv.zrevrange(status_key("queued"), 0, -1) == []
+        assert await kv.command("LRANGE", JOBS_QUEUE_KEY, 0, -1) == []
+        assert await kv.command("LRANGE", JOBS_PROCESSING_KEY, 0, -1) == []
+        assert await kv.get(lock_key(job["id"])) is None
+        # già eseguito: un secondo run_inline non fa nulla
+        await rn.run_inline(job["id"])
+        assert progress_seen == [True]
+    asyncio.run(go())
+
+
+def test_failed_job_records_error():
+    kv = MemoryKV()
+
+    def boom(params, progress):
+        raise RuntimeError("boom")
+    rn = JobRunner(lambda: kv, boom, inline=True)
+
+    async def go():
+        job = new_job()
+        await rn.enqueue(job)
+        await rn.run_inline(job["id"])
+        done = await load_job(kv, job["id"])
+        assert done["status"] == "failed" and done["error"] == "boom"
+        assert await kv.command("LRANGE", JOBS_PROCESSING_KEY, 0, -1) == []
+    asyncio.run(go())
+
+
+def test_background_workers_run_duplicate_queue_entry_once():
+    kv = MemoryKV()
+    calls = []
+    rn = JobRunner(lambda: kv, lambda params, progress: calls.append(1) or {}, workers=2)
+
+    async def go():
+        job = new_job()
+        await rn.enqueue(job)
+        await kv.rpush(JOBS_QUEUE_KEY, job["id"])  # stesso id in coda due volte
+        for _ in range(200):
+            if (await load_job(kv, job["id"]))["status"] == "completed":
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        await rn.stop()
+        assert calls == [1]
+        assert await kv.command("LRANGE", JOBS_PROCESSING_KEY, 0, -1) == []
+    asyncio.run(go())
+
+
+def test_reaper_requeues_orphans():
+    kv = MemoryKV()
+    rn = JobRunner(lambda: kv, lambda params, progress: {}, inline=True)
+
+    async def go():
+        job = new_job()
+        await rn.enqueue(job)
+        # worker morto tra LMOVE e lock: l'id resta in lavorazione senza lock
+        assert await kv.lmove(JOBS_QUEUE_KEY, JOBS_PROCESSING_KEY) == job["id"]
+        suspects = await rn.reap(set())
+        assert suspects == {job["id"]}  # primo giro: solo sospetto
+        await kv.delete(runner.JOBS_REAPER_KEY)
+        assert await rn.reap(suspects) == set()
+        assert await kv.command("LRANGE", JOBS_QUEUE_KEY, 0, -1) == [job["id"]]
+        assert await kv.command("LRANGE", JOBS_PROCESSING_KEY, 0, -1) == []
+    asyncio.run(go())
+
+
+def test_cancel_queued_job():
+    kv = MemoryKV()
+    calls = []
+    rn = JobRunner(lambda: kv, lambda params, progress: calls.append(1), inline=True)
+
+    async def go():
+        job = new_job()
+        await rn.enqueue(job)
+        cancelled = await rn.cancel(job["id"])
+        assert cancelled["status"] == "cancelled"
+        # chi lo preleva dopo lo trova già chiuso: non viene eseguito
+        await rn.run_inline(job["id"])
+        assert calls == []
+        assert (await load_job(kv, job["id"]))["status"] == "cancelled"
+        assert await kv.command("LRANGE", JOBS_PROCESSING_KEY, 0, -1) == []
+        # annullare un job concluso non cambia nulla
+        assert (await rn.cancel(job["id"]))["version"] == cancelled["version"]
+        assert await rn.cancel("missing") is None
+    asyncio.run(go())
+
+
+def test_cancel_running_job():
+    kv = MemoryKV()
+    started = threading.Event()
+
+    def slow(params, progress):
+        started.set()
+        while not progress.cancelled.is_set():
+            progress(10.0, "working")
+            time.sleep(0.005)
+        raise JobCancelledError()
+    rn = JobRunner(lambda: kv, slow, inline=True)
+
+    async def go():
+        job = new_job()
+        await rn.enqueue(job)
+        task = asyncio.ensure_future(rn.run_inline(job["id"]))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        running = await rn.cancel(job["id"])
+        assert running["status"] == "running"  # il record lo chiude il worker
+        await asyncio.wait_for(task, 5)
+        done = await load_job(kv, job["id"])
+        assert done["status"] == "cancelled" and done["completed_at"]
+        assert await kv.get(f"{job_key(job['id'])}:cancel") is None
+    asyncio.run(go())
+
+
+async def enqueue_claimed(kv, rn, job):
+    await kv.set(fingerprint_key(job["fingerprint"]), job["id"], ex=60)
+    await rn.enqueue(job)
+
+
+def test_completed_job_keeps_fingerprint_failed_frees_it():
+    kv = MemoryKV()
+
+    def handler(params, progress):
+        if params.get("fail"):
+            raise RuntimeError("boom")
+        return {}
+    rn = JobRunner(lambda: kv, handler, inline=True)
+
+    async def go():
+        ok, bad = new_job(fingerprint="fp1"), new_job(fingerprint="fp2", fail=True)
+        for job in (ok, bad):
+            await enqueue_claimed(kv, rn, job)
+            await rn.run_inline(job["id"])
+        # risultato riusabile: l'impronta resta e punta al job; il fallito la libera
+        assert await kv.get(fingerprint_key("fp1")) == ok["id"]
+        assert await kv.get(fingerprint_key("fp2")) is None
+        # non memoizzabile (dataset da URL): liberata anche a job completato
+        url = new_job(fingerprint="fp3", memoize=False)
+        await enqueue_claimed(kv, rn, url)
+        await rn.run_inline(url["id"])
+        assert await kv.get(fingerprint_key("fp3")) is None
+    asyncio.run(go())
+
+
+def test_cancel_frees_fingerprint():
+    kv = MemoryKV()
+    rn = JobRunner(lambda: kv, lambda params, progress: {}, inline=True)
+
+    async def go():
+        job = new_job(fingerprint="fp4")
+        await enqueue_claimed(kv, rn, job)
+        await rn.cancel(job["id"])
+        assert await kv.get(fingerprint_key("fp4")) is None
+    asyncio.run(go())
+
+
+def test_stale_write_is_rejected():
+    kv = MemoryKV()
+    rn = JobRunner(lambda: kv, lambda params, progress: {}, inline=True)
+
+    async def go():
+        job = new_job()
+        await rn.enqueue(job)
+        stale = dict(await load_job(kv, job["id"]))
+        cancelled = await rn.cancel(job["id"])
+        stale.update(status="running")
+        assert await save_job(kv, stale, prev="queued") is False
+        current = await load_job(kv, job["id"])
+        assert current["status"] == "cancelled" and current["version"] == cancelled["version"] == 2
+    asyncio.run(go())
+
+
+def test_wait_for_update_wakes_on_write_and_times_out():
+    kv = MemoryKV()
+    rn = JobRunner(lambda: kv, lambda params, progress: {}, inline=True)
+
+    async def go():
+        job = new_job()
+        await rn.enqueue(job)
+        waiter = asyncio.ensure_future(rn.wait_for_update(job["id"], 1, 5))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await rn.cancel(job["id"])
+        woken = await asyncio.wait_for(waiter, 1)
+        assert woken["version"] == 2 and woken["status"] == "cancelled"
+        # nessun cambiamento: alla scadenza il record invariato
+        same = await rn.wait_for_update(job["id"], 2, 0.05)
+        assert same["version"] == 2
+        assert await rn.wait_for_update("missing", 0, 0.05) is None
+    asyncio.run(go())
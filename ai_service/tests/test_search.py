@@ -0,0 +1,60 @@
+"""Indice invertito della ricerca `q`: normalizzazione, prefissi, AND e fallback letterale."""
+import numpy as np
+import pandas as pd
+from ai_service.search import InvertedIndex, normalize, tokenize
+from ai_service.store import ReviewStore
+
+TEXTS = [
+    "Perché il letto era scomodo",
+    "Lettone enorme, colazione ottima",
+    None,
+    "Colazione scarsa; PERCHE' nessuno risponde?",
+    "Great bed, great breakfast",
+    "",
+]
+
+
+def test_normalize_and_tokenize():
+    assert normalize("Perché ÀÉÎ") == "perche aei"
+    assert tokenize("Letto, colazione!! 24h") == ["letto", "colazione", "24h"]
+    assert tokenize("") == [] and tokenize(None) == []
+
+
+def test_prefix_and_and_semantics():
+    idx = InvertedIndex(TEXTS)
+    assert idx.n_docs == len(TEXTS)
+    assert idx.search("perche").tolist() == [0, 3]
+    assert idx.search("LETT").tolist() == [0, 1]         # prefisso: letto, lettone
+    assert idx.search("colazione lett").tolist() == [1]  # token in AND
+    assert idx.search("great bre").tolist() == [4]
+    assert idx.search("nothing").tolist() == []
+    assert idx.search("?!") is None                       # nessun token
+
+
+def test_generic_prefix_uses_mask_path():
+    texts = [f"word{i} common" for i in range(200)]
+    idx = InvertedIndex(texts)
+    assert idx.search("word").tolist() == list(range(200))
+    assert idx.search("word1").tolist() == [1] + list(range(10, 20)) + list(range(100, 200))
+
+
+def test_matches_substring_scan_on_tokens():
+    rng = np.random.default_rng(1)
+    words = ["camera", "pulita", "rumorosa", "staff", "gentile", "caffè", "caffettiera"]
+    texts = [" ".join(rng.choice(words, 4)) for _ in range(500)]
+    idx = InvertedIndex(texts)
+    for q in ("caff", "caffe", "staff gent", "camera rumor"):
+        expected = [i for i, t in enumerate(texts)
+                    if all(any(w.startswith(p) for w in tokenize(t)) for p in tokenize(q))]
+        assert idx.search(q).tolist() == expected
+
+
+def test_store_search_with_candidates_and_literal_fallback():
+    df = pd.DataFrame({"id": ["a", "b", "c", "d"], "text": ["letto ok", "letto :-)", "no", ":-) ciao"],
+                       "sentiment": [0.1, 0.2, 0.3, 0.4], "lang": ["it", "en", "it", "it"]})
+    store = ReviewStore(df)
+    assert store.search("letto", None).tolist() == [0, 1]
+    assert store.search("letto", store.select(lang="it")).tolist() == [0]
+    # solo punteggiatura: confronto letterale, anche sui candidati
+    assert store.search(":-)", None).tolist() == [1, 3]
+    assert store.search(":-)", np.array([2, 3])).tolist() == [3]
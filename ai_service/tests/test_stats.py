@@ -0,0 +1,95 @@
+"""ReviewStats: aggregati dalle celle e dalle righe contro il calcolo diretto in pandas."""
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from ai_service.stats import ReviewStats
+
+N = 2000
+
+
+@pytest.fixture(scope="module")
+def df() -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    sentiment = rng.uniform(-1, 1, N)
+    sentiment[rng.random(N) < 0.05] = np.nan
+    rating = rng.integers(1, 6, N).astype(float)
+    rating[rng.random(N) < 0.1] = np.nan
+    lang = rng.choice(["en", "it", "fr"], N).astype(object)
+    lang[rng.random(N) < 0.03] = None
+    return pd.DataFrame({
+        "clusterId": rng.choice(list("abcde"), N),
+        "lang": lang,
+        "sentiment": sentiment,
+        "rating": rating,
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, N), unit="D"),
+    })
+
+
+def expected(sub: pd.DataFrame) -> dict:
+    def dist(series):
+        counts = series.value_counts(dropna=False)
+        return {("null" if pd.isna(k) else k): int(v) for k, v in counts.items()}
+    s = sub["sentiment"]
+    return {
+        "total": len(sub),
+        "languages": dist(sub["lang"]),
+        "clusters": dist(sub["clusterId"]),
+        "sentiment": {"mean": s.mean(), "std": s.std(), "min": s.min(), "max": s.max()},
+        "rating": {"mean": sub["rating"].mean(), "distribution": dist(sub["rating"])},  # 5.0 == 5 come chiave
+    }
+
+
+def assert_same(got: dict, want: dict):
+    assert got["total"] == want["total"]
+    assert got["languages"] == want["languages"]
+    assert got["clusters"] == want["clusters"]
+    assert got["rating"]["distribution"] == want["rating"]["distribution"]
+    for key in ("mean", "std", "min", "max"):
+        assert math.isclose(got["sentiment"][key], want["sentiment"][key], rel_tol=1e-9, abs_tol=1e-12)
+    assert math.isclose(got["rating"]["mean"], want["rating"]["mean"], rel_tol=1e-9)
+
+
+@pytest.mark.parametrize("filters,mask", [
+    ({}, lambda d: d.index >= 0),
+    ({"clusterId": "b"}, lambda d: d["clusterId"] == "b"),
+    ({"clusterId": "a", "lang": "it"}, lambda d: (d["clusterId"] == "a") & (d["lang"] == "it")),
+    ({"ratingMin": 2, "ratingMax": 4}, lambda d: d["rating"].between(2, 4)),
+    ({"dateFrom": pd.Timestamp("2024-03-01 12:00"), "dateTo": pd.Timestamp("2024-05-31")},
+     lambda d: (d["date"] >= "2024-03-01 12:00") & (d["date"] <= "2024-05-31")),
+])
+def test_summary_from_cells_matches_pandas(df, filters, mask):
+    stats = ReviewStats(df)
+    assert stats.day_exact and not stats.needs_rows(**{k: v for k, v in filters.items() if k.startswith("date")})
+    assert_same(stats.summary(**filters), expected(df[mask(df)]))
+
+
+def test_summary_rows_matches_pandas(df):
+    stats = ReviewStats(df)
+    rows = np.flatnonzero((df["sentiment"] > 0.2).to_numpy())
+    assert_same(stats.summary_rows(rows), expected(df.iloc[rows]))
+    assert stats.summary_rows(None) is stats.summary()  # senza filtri: payload memorizzato
+
+
+def test_unknown_value_and_empty_selection(df):
+    stats = ReviewStats(df)
+    out = stats.summary(clusterId="zz")
+    assert out["total"] == 0 and out["clusters"] == {} and out["sentiment"]["mean"] is None
+    assert out["rating"] == {"mean": None, "distribution": {}}
+
+
+def test_dates_with_time_need_rows():
+    df = pd.DataFrame({"sentiment": [0.1, 0.2], "date": pd.to_datetime(["2024-01-01 10:00", "2024-01-02 00:00"])})
+    stats = ReviewStats(df)
+    assert not stats.day_exact
+    assert stats.needs_rows(dateFrom=pd.Timestamp("2024-01-01"))
+    assert stats.needs_rows(q="x") and not stats.needs_rows()
+
+
+def test_missing_columns():
+    stats = ReviewStats(pd.DataFrame({"text": ["a", "b"]}))
+    out = stats.summary()
+    assert out["total"] == 2 and out["languages"] == {} and out["clusters"] == {}
+    assert out["sentiment"] == {"mean": None, "std": None, "min": None, "max": None}
+    assert out["rating"] == {"mean": None, "distribution": {}}
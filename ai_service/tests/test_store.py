@@ -0,0 +1,95 @@
+"""ReviewStore: filtri, ordinamento, pagine e serializzazione contro un riferimento in Python."""
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from ai_service.store import REVIEW_FIELDS, ReviewStore
+
+N = 3000
+
+
+@pytest.fixture(scope="module")
+def df() -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    sentiment = rng.uniform(-1, 1, N).round(2)  # valori ripetuti: conta lo spareggio
+    sentiment[rng.random(N) < 0.05] = np.nan
+    rating = rng.integers(1, 6, N).astype(float)
+    rating[rng.random(N) < 0.1] = np.nan
+    return pd.DataFrame({
+        "id": [f"r{i}" for i in range(N)],
+        "text": [f"review {i} {'clean' if i % 3 else 'noisy'} room" for i in range(N)],
+        "clusterId": rng.choice(list("abcdefghij"), N),
+        "lang": rng.choice(["en", "it"], N),
+        "sentiment": sentiment,
+        "rating": rating,
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, N), unit="D"),
+    })
+
+
+@pytest.fixture(scope="module")
+def store(df) -> ReviewStore:
+    return ReviewStore(df)
+
+
+def reference_order(df: pd.DataFrame, rows, sort: str, order: str) -> list:
+    """Ordinamento stabile, NaN in fondo in entrambe le direzioni."""
+    values = df[sort].astype("int64").to_numpy() if sort == "date" else df[sort].to_numpy()
+    sign = 1 if order == "asc" else -1
+
+    def key(i):
+        v = values[i]
+        missing = v is None or (isinstance(v, float) and math.isnan(v))
+        return (missing, 0 if missing else sign * v, i)
+    return sorted(range(len(df)) if rows is None else rows.tolist(), key=key)
+
+
+@pytest.mark.parametrize("sort", ["date", "sentiment", "rating"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_ordered_matches_reference(store, df, sort, order):
+    assert store.ordered(None, sort, order).tolist() == reference_order(df, None, sort, order)
+    rows = store.select(clusterId="c")
+    assert store.ordered(rows, sort, order).tolist() == reference_order(df, rows, sort, order)
+    # con limit bastano le prime righe, nello stesso ordine
+    assert store.ordered(rows, sort, order, limit=7).tolist() == reference_order(df, rows, sort, order)[:7]
+
+
+@pytest.mark.parametrize("filters,mask", [
+    ({"clusterId": "a"}, lambda d: d["clusterId"] == "a"),
+    ({"clusterId": "a", "lang": "it"}, lambda d: (d["clusterId"] == "a") & (d["lang"] == "it")),
+    ({"ratingMin": 4}, lambda d: d["rating"] >= 4),
+    ({"sentimentMin": -0.2, "sentimentMax": 0.3}, lambda d: d["sentiment"].between(-0.2, 0.3)),
+    ({"dateFrom": pd.Timestamp("2024-06-01"), "lang": "en"},
+     lambda d: (d["date"] >= "2024-06-01") & (d["lang"] == "en")),
+    ({"clusterId": "zz"}, lambda d: d["clusterId"] == "zz"),
+])
+def test_select_matches_pandas(store, df, filters, mask):
+    rows = store.select(**filters)
+    assert sorted(rows.tolist()) == np.flatnonzero(mask(df).to_numpy()).tolist()
+
+
+def test_select_without_filters_is_all_rows(store):
+    assert store.select() is None
+    assert store.select(clusterId=None, ratingMin=None) is None
+
+
+def test_page_slices_the_order(store, df):
+    rows = store.select(lang="it")
+    expected = reference_order(df, rows, "rating", "desc")
+    total, page = store.page(rows, "rating", "desc", 40, 20)
+    assert total == len(rows) and page.tolist() == expected[40:60]
+    total, page = store.page(rows, "rating", "desc", total + 5, 20)
+    assert page.tolist() == []
+
+
+def test_records_are_json_ready(store, df):
+    idx = np.array([0, 1, 2])
+    records = store.records(idx, "proj")
+    assert [tuple(r) for r in records] == [REVIEW_FIELDS] * 3
+    for r, i in zip(records, idx):
+        assert r["id"] == f"r{i}" and r["projectId"] == "proj"
+        assert r["date"] == df["date"].iloc[i].strftime("%Y-%m-%d")
+        assert r["rating"] is None or isinstance(r["rating"], float)
+        assert isinstance(r["sentiment"], float)
+    cols = store.columns(idx, "proj")
+    assert cols["id"] == ["r0", "r1", "r2"]
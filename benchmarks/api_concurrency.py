@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark di concorrenza dell'API (in-process, via ASGI, senza rete).
+Carico misto per --duration secondi:
+- client "heavy": /reviews/stats e /reviews con filtri/ricerca su un progetto sintetico grande
+- client "light": /health
+Confronta la latenza (p50/p95/p99) con il lavoro eseguito inline sull'event loop
+(API_WORKER_THREADS=0, comportamento precedente) e nel pool di thread:
+
+    python benchmarks/api_concurrency.py --rows 300000 --duration 10 --out bench_api.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+HEAVY_REQUESTS = [
+    ("/reviews/stats", {}),
+    ("/reviews", {"lang": "it", "ratingMin": 2, "sort": "rating", "pageSize": 200}),
+    ("/reviews", {"q": "camera", "sort": "sentiment", "order": "asc", "pageSize": 100}),
+    ("/reviews", {"sentimentMin": -0.5, "sentimentMax": 0.5, "sort": "date", "page": 20}),
+]
+
+
+def make_project(data_dir: Path, project_id: str, rows: int, seed: int = 42) -> None:
+    """Progetto sintetico replicando (con id univoci) le recensioni incluse nel bundle."""
+    base = pd.read_json(ROOT / "ai_service" / "_data" / "airbnb_reviews.jsonl", lines=True, dtype={"id": str})
+    rng = np.random.default_rng(seed)
+    df = base.iloc[rng.integers(0, len(base), rows)].reset_index(drop=True)
+    df["id"] = [f"b{i}" for i in range(rows)]
+    df["projectId"] = project_id
+    # niente valori mancanti nelle colonne categoriali: /reviews/stats deve restare serializzabile
+    df["clusterId"] = df["clusterId"].fillna("noise")
+    df["clusterLabel"] = df["clusterLabel"].fillna("noise")
+    df["sentiment"] = np.clip(df["sentiment"].fillna(0) + rng.normal(0, 0.05, rows), -1, 1).round(3)
+    df.to_json(data_dir / f"{project_id}_reviews.jsonl", orient="records", lines=True, force_ascii=False)
+
+
+def _pct(values: List[float], p: float) -> float:
+    return round(float(np.percentile(values, p)) * 1000, 2) if values else None
+
+
+async def run_load(app, project_id: str, duration: float, heavy: int, light: int) -> Dict[str, Any]:
+    import httpx
+
+    lat: Dict[str, List[float]] = {"heavy": [], "light": []}
+    errors = 0
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # warmup: carica il progetto e costruisce store/indice prima di misurare
+        for path, params in HEAVY_REQUESTS:
+            await client.get(path, params={"projectId": project_id, **params})
+        deadline = time.perf_counter() + duration
+
+        async def worker(kind: str, seed: int):
+            nonlocal errors
+            rnd = random.Random(seed)
+            while time.perf_counter() < deadline:
+                if kind == "heavy":
+                    path, params = rnd.choice(HEAVY_REQUESTS)
+                    params = {"projectId": project_id, **params}
+                else:
+                    path, params = "/health", {}
+                t0 = time.perf_counter()
+                r = await client.get(path, params=params)
+                lat[kind].append(time.perf_counter() - t0)
+                if r.status_code >= 400:
+                    errors += 1
+                if kind == "light":
+                    await asyncio.sleep(0.005)
+
+        await asyncio.gather(
+            *[worker("heavy", i) for i in range(heavy)],
+            *[worker("light", 1000 + i) for i in range(light)],
+        )
+
+    return {
+        kind: {
+            "requests": len(v),
+            "rps": round(len(v) / duration, 1),
+            "p50_ms": _pct(v, 50),
+            "p95_ms": _pct(v, 95),
+            "p99_ms": _pct(v, 99),
+            "max_ms": round(max(v) * 1000, 2) if v else None,
+        }
+        for kind, v in lat.items()
+    } | {"errors": errors}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=300_000)
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--heavy-clients", type=int, default=4)
+    ap.add_argument("--light-clients", type=int, default=4)
+    ap.add_argument("--threads", type=int, default=4, help="API_WORKER_THREADS per la modalità pool")
+    ap.add_argument("--out", default="bench_api.json")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        project_id = "bench"
+        print(f"Generating synthetic project with {args.rows:,} reviews ...")
+        make_project(Path(tmp), project_id, args.rows)
+        os.environ["INSIGHTS_DATA_DIR"] = tmp
+        from ai_service.main import app
+
+        results = {}
+        for mode, threads in (("inline", 0), ("pool", args.threads)):
+            os.environ["API_WORKER_THREADS"] = str(threads)
+            print(f"\n--- {mode} (API_WORKER_THREADS={threads}) ---")
+            res = asyncio.run(run_load(app, project_id, args.duration, args.heavy_clients, args.light_clients))
+            results[mode] = res
+            for kind in ("light", "heavy"):
+                r = res[kind]
+                print(f"  {kind:<6} n={r['requests']:<6} p50={r['p50_ms']}ms p95={r['p95_ms']}ms "
+                      f"p99={r['p99_ms']}ms max={r['max_ms']}ms")
+
+    report = {
+        "generated_at": pd.Timestamp.utcnow().isoformat(),
+        "rows": args.rows,
+        "duration_s": args.duration,
+        "heavy_clients": args.heavy_clients,
+        "light_clients": args.light_clients,
+        "results": results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Costo di avvio dell'API, ognuno in un processo Python nuovo:
+- profilo di import (`python -X importtime -c "import ai_service.main"`): tempo totale,
+  moduli più costosi e quali dipendenze pesanti (pandas, numpy, httpx, ...) sono già caricate;
+- cold start → primo byte: uvicorn avviato da zero, tempo fino agli header della prima
+  risposta, per path (un processo per path), con router pigri (default) ed eager
+  (API_LAZY_ROUTERS=0).
+
+    python benchmarks/import_time.py --out bench_startup.json
+    # confronto con un report precedente (exit code 1 se una misura è >20% più lenta)
+    python benchmarks/import_time.py --compare bench_startup.json
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "httpx", "multiprocessing", "ai_service.routers.reviews")
+DEFAULT_PATHS = "/health,/projects/airbnb,/reviews?projectId=airbnb&pageSize=1"
+
+
+def _env(extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "PYTHONDONTWRITEBYTECODE": "1", **(extra or {})}
+    env.pop("API_WARMUP", None)
+    return env
+
+
+# ---------------- profilo di import ----------------
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Righe `import time: self | cumulative | name` → self/cumulative in ms e profondità."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({"module": name.strip(), "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                     "self_ms": int(self_us) / 1000, "cumulative_ms": int(cum_us) / 1000})
+    return rows
+
+
+def import_profile(repeat: int, top: int) -> Dict[str, Any]:
+    code = ("import json, sys, time; t = time.perf_counter(); import ai_service.main; "
+            "print(json.dumps({'wall_ms': (time.perf_counter() - t) * 1000, "
+            f"'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))")
+    best = None
+    for _ in range(repeat):
+        p = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=_env(),
+                           capture_output=True, text=True, check=True)
+        out = json.loads(p.stdout.strip().splitlines()[-1])
+        if best is None or out["wall_ms"] < best[0]["wall_ms"]:
+            best = (out, parse_importtime(p.stderr))
+    out, rows = best
+    return {
+        "wall_ms": round(out["wall_ms"], 1),
+        "heavy_loaded": out["loaded"],
+        "top_cumulative": [
+            {"module": r["module"], "cumulative_ms": round(r["cumulative_ms"], 1)}
+            for r in sorted((r for r in rows if r["depth"] <= 1), key=lambda r: -r["cumulative_ms"])[:top]
+        ],
+        "top_self": [
+            {"module": r["module"], "self_ms": round(r["self_ms"], 1)}
+            for r in sorted(rows, key=lambda r: -r["self_ms"])[:top]
+        ],
+    }
+
+
+# ---------------- cold start → primo byte ----------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cold_start(path: str, lazy: bool, timeout: float = 60.0) -> Dict[str, Any]:
+    """Avvia uvicorn da zero e misura fino al primo byte della risposta a `path`."""
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _env({"API_LAZY_ROUTERS": "1" if lazy else "0",
+                    "JOBS_KV_BACKEND": "sqlite", "JOBS_SQLITE_PATH": str(Path(tmp) / "jobs.sqlite3")})
+        t0 = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "ai_service.main:app", "--port", str(port),
+                                 "--log-level", "warning"], cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited: {proc.stderr.read().decode()[-2000:]}")
+                if time.perf_counter() - t0 > timeout:
+                    raise TimeoutError(f"server not listening after {timeout:g}s")
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                    break
+                except OSError:
+                    time.sleep(0.005)
+            listening = time.perf_counter()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            conn.request("GET", path)
+            resp = conn.getresponse()  # ritorna con status e header: il primo byte è arrivato
+            first_byte = time.perf_counter()
+            resp.read()
+            conn.close()
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return {
+        "path": path, "lazy": lazy, "status": resp.status,
+        "listening_ms": round((listening - t0) * 1000, 1),
+        "first_request_ms": round((first_byte - listening) * 1000, 1),
+        "ttfb_ms": round((first_byte - t0) * 1000, 1),
+    }
+
+
+def cold_starts(paths: List[str], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for lazy in (True, False):
+        for path in paths:
+            best = min((cold_start(path, lazy) for _ in range(repeat)), key=lambda r: r["ttfb_ms"])
+            results.append(best)
+            print(f"  {'lazy' if lazy else 'eager':<5} {path:<45} ttfb {best['ttfb_ms']:>8.1f} ms "
+                  f"(listening {best['listening_ms']:.1f}, first request {best['first_request_ms']:.1f}) "
+                  f"[{best['status']}]")
+    return results
+
+
+# ---------------- report ----------------
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(report: Dict[str, Any], baseline_path: str, tolerance: float) -> int:
+    """Confronta con un report precedente; ritorna il numero di regressioni oltre la tolleranza."""
+    base = json.loads(Path(baseline_path).read_text())
+    pairs = [("import", base["import"]["wall_ms"], report["import"]["wall_ms"])]
+    old = {(r["path"], r["lazy"]): r["ttfb_ms"] for r in base["cold_start"]}
+    for r in report["cold_start"]:
+        if (r["path"], r["lazy"]) in old:
+            pairs.append((f"{'lazy' if r['lazy'] else 'eager'} {r['path']}", old[(r["path"], r["lazy"])], r["ttfb_ms"]))
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (tolerance {tolerance:.0%}):")
+    for name, before, now in pairs:
+        ratio = now / before if before else 1.0
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        regressions += bool(flag)
+        print(f"  {name:<52} {before:>8.1f} ms → {now:>8.1f} ms  x{ratio:.2f} {flag}")
+    return regressions
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--paths", default=DEFAULT_PATHS, help="Path per il cold start, separati da virgola")
+    ap.add_argument("--repeat", type=int, default=3, help="Ripetizioni per misura (si tiene la migliore)")
+    ap.add_argument("--top", type=int, default=15, help="Moduli più costosi da riportare")
+    ap.add_argument("--out", default="bench_startup.json")
+    ap.add_argument("--compare", default=None, help="Report precedente con cui confrontare")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    imports = import_profile(args.repeat, args.top)
+    print(f"import ai_service.main: {imports['wall_ms']:.1f} ms; heavy modules loaded: {imports['heavy_loaded'] or 'none'}")
+    for r in imports["top_cumulative"][:8]:
+        print(f"  {r['module']:<45} {r['cumulative_ms']:>8.1f} ms")
+    print("\nCold start → first byte:")
+    starts = cold_starts([p for p in args.paths.split(",") if p], args.repeat)
+
+    report = {
+        "meta": {"generated_at": datetime.now(timezone.utc).isoformat(), "git_rev": _git_rev(),
+                 "python": platform.python_version(), "platform": platform.platform(), "repeat": args.repeat},
+        "import": imports,
+        "cold_start": starts,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {args.out}")
+
+    if args.compare and compare(report, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Throughput dei backend locali dello store dei job (in-process, senza rete).
+Misura gli aggiornamenti di stato al secondo, ognuno con la stessa pipeline del
+runner a ogni flush del progresso (rinnovo lock + controllo annullo + record):
+
+    python benchmarks/job_store.py --updates 20000 --out bench_job_store.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+async def run_updates(kv, updates: int, jobs: int) -> Dict[str, Any]:
+    from ai_service.runner import cancel_key, job_key, save_job_cmd, utcnow_iso
+
+    records = [{"id": f"bench{i}", "status": "running", "progress": 0.0, "message": "running",
+                "params": {"project_id": "bench", "options": {"mode": "summary"}},
+                "created_at": utcnow_iso(), "completed_at": None, "result": None, "error": None}
+               for i in range(jobs)]
+    t0 = time.perf_counter()
+    for n in range(updates):
+        job = records[n % jobs]
+        job["progress"] = float(n % 100)
+        await kv.pipeline([
+            ["EXPIRE", f"{job_key(job['id'])}:lock", 120],
+            ["GET", cancel_key(job["id"])],
+            save_job_cmd(job),
+        ])
+    elapsed = time.perf_counter() - t0
+    return {"updates": updates, "elapsed_s": round(elapsed, 3), "updates_per_s": round(updates / elapsed)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--updates", type=int, default=20_000)
+    ap.add_argument("--jobs", type=int, default=50, help="job distinti aggiornati a rotazione")
+    ap.add_argument("--out", default="bench_job_store.json")
+    args = ap.parse_args()
+
+    from ai_service.kv import MemoryKV, SQLiteKV
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, kv in (("memory", MemoryKV()), ("sqlite", SQLiteKV(str(Path(tmp) / "jobs.sqlite3")))):
+            results[name] = asyncio.run(run_updates(kv, args.updates, args.jobs))
+            print(f"  {name:<7} {results[name]['updates_per_s']:>8} updates/s")
+            if isinstance(kv, SQLiteKV):
+                kv.close()
+
+    report = {"updates": args.updates, "jobs": args.jobs, "results": results}
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
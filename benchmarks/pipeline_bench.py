@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Benchmark riproducibili dei percorsi caldi della pipeline.
+- Corpus sintetici multilingua (default 10k / 100k / 1M righe) generati in modo
+  deterministico a partire da public/demo/projects/*_reviews.jsonl.
+- Backend stub per embeddings (feature hashing) e LLM (sommari/personas placeholder):
+  gira offline, senza API key.
+- Risultati in JSON (una entry per dimensione × operazione) da confrontare fra run:
+
+    python benchmarks/pipeline_bench.py --sizes 10k,100k --out bench.json
+    python benchmarks/pipeline_bench.py --sizes 10k --compare bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "pipeline"))
+os.environ.setdefault("SKIP_LANG_DETECT", "1")
+
+from utils import (  # noqa: E402
+    calculate_timeseries,
+    clean_text,
+    preprocess_for_keywords,
+    save_project_json,
+    _safe_detect_lang,
+)
+from cluster import cluster_reviews  # noqa: E402
+from profiling import process_peak_rss_mb  # noqa: E402
+from summarize import generate_placeholder_summary  # noqa: E402
+from personas import generate_placeholder_personas, enrich_personas_with_data  # noqa: E402
+from run_demo import _assign_rest_labels_by_tfidf  # noqa: E402
+
+SEED_GLOB = "public/demo/projects/*_reviews.jsonl"
+_SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+_NOISE = ["", "", "", " <br/>", " &amp; ", " 👍", " !!", "​", "  ", " <b>top</b>"]
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _parse_size(s: str) -> int:
+    s = s.strip().lower()
+    return _SIZES.get(s) or int(float(s.rstrip("k")) * 1000 if s.endswith("k") else s)
+
+
+# ---------------- corpus ----------------
+def load_seed() -> pd.DataFrame:
+    frames = []
+    for p in sorted(ROOT.glob(SEED_GLOB)):
+        frames.append(pd.read_json(p, lines=True, dtype={"id": str}))
+    if not frames:
+        raise FileNotFoundError(f"No seed reviews found under {ROOT / SEED_GLOB}")
+    seed = pd.concat(frames, ignore_index=True)
+    seed = seed.dropna(subset=["text"])
+    return seed[["text", "lang", "rating", "sentiment"]].reset_index(drop=True)
+
+
+def synth_corpus(seed: pd.DataFrame, n: int, rng_seed: int = 42) -> pd.DataFrame:
+    """
+    Ogni recensione combina 1-3 frasi del seed (stessa lingua della prima) più rumore
+    HTML/emoji/whitespace, così clean_text e il clustering lavorano su testi realistici.
+    """
+    rng = np.random.default_rng(rng_seed)
+    texts = seed["text"].astype(str).to_numpy()
+    langs = seed["lang"].fillna("unknown").astype(str).to_numpy()
+    by_lang = {l: np.flatnonzero(langs == l) for l in np.unique(langs)}
+
+    first = rng.integers(0, len(seed), n)
+    extra = rng.integers(0, 3, n)
+    noise = rng.integers(0, len(_NOISE), n)
+    out_text = []
+    for i in range(n):
+        j = first[i]
+        parts = [texts[j]]
+        if extra[i]:
+            pool = by_lang[langs[j]]
+            parts.extend(texts[pool[rng.integers(0, len(pool), extra[i])]])
+        out_text.append(" ".join(parts) + _NOISE[noise[i]])
+
+    start = np.datetime64("2023-01-01")
+    days = rng.integers(0, 730, n)
+    rating = seed["rating"].to_numpy()[first]
+    sentiment = seed["sentiment"].fillna(0.0).to_numpy()[first]
+    sentiment = np.clip(sentiment + rng.normal(0, 0.05, n), -1, 1).round(3)
+    return pd.DataFrame({
+        "id": [f"s{i}" for i in range(n)],
+        "text": out_text,
+        "rating": rating,
+        "timestamp": pd.to_datetime(start + days.astype("timedelta64[D]")),
+        "lang": langs[first],
+        "sentiment": sentiment,
+    })
+
+
+# ---------------- stub backends ----------------
+def stub_embeddings(texts: List[str], dim: int = 256) -> np.ndarray:
+    """Feature hashing normalizzato: testi con parole in comune finiscono vicini."""
+    X = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, t in enumerate(texts):
+        for tok in _TOKEN_RE.findall(t.lower()):
+            h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=4).digest(), "little")
+            X[i, h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+
+def stub_summaries(clusters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [generate_placeholder_summary(c) for c in clusters]
+
+
+# ---------------- timing ----------------
+def _measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    best_wall = best_cpu = None
+    result = None
+    for _ in range(repeat):
+        t0, c0 = time.perf_counter(), time.process_time()
+        result = fn()
+        wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+        if best_wall is None or wall < best_wall:
+            best_wall, best_cpu = wall, cpu
+    return {"wall_s": round(best_wall, 4), "cpu_s": round(best_cpu, 4), "_result": result}
+
+
+def run_size(seed: pd.DataFrame, n: int, args) -> List[Dict[str, Any]]:
+    print(f"\n=== {n:,} rows ===")
+    t0 = time.perf_counter()
+    corpus = synth_corpus(seed, n, args.seed)
+    print(f"corpus generated in {time.perf_counter() - t0:.1f}s")
+    embed_max = min(n, args.embed_max)
+    rows: List[Dict[str, Any]] = []
+
+    def bench(op: str, n_rows: int, fn: Callable[[], Any]) -> Any:
+        m = _measure(fn, args.repeat)
+        res = m.pop("_result")
+        m.update({
+            "size": n, "op": op, "rows": n_rows,
+            "rows_per_s": round(n_rows / m["wall_s"], 1) if m["wall_s"] > 0 else None,
+            "process_peak_rss_mb": process_peak_rss_mb(),
+        })
+        rows.append(m)
+        print(f"  {op:<28} {m['wall_s']:>9.3f}s  {m['rows_per_s'] or 0:>12,.0f} rows/s")
+        return res
+
+    texts = corpus["text"].tolist()
+    cleaned = bench("clean_text", n, lambda: [clean_text(t) for t in texts])
+    corpus["text"] = cleaned
+
+    # langdetect è ~1ms/testo: si misura su un sottoinsieme e si riporta il throughput
+    n_lang = min(n, args.langdetect_max)
+    bench("lang_detect", n_lang, lambda: [_safe_detect_lang(t) for t in cleaned[:n_lang]])
+
+    sample = corpus.sample(n=embed_max, random_state=123) if n > embed_max else corpus
+    kw_text = bench("preprocess_for_keywords", len(sample), lambda: [
+        preprocess_for_keywords(t, lang=l) for t, l in zip(sample["text"], sample["lang"])
+    ])
+
+    emb = bench("stub_embeddings", len(sample), lambda: stub_embeddings(sample["text"].tolist()))
+    kw_df = sample.copy()
+    kw_df["text"] = kw_text
+    clusters, labels = bench("cluster_reviews", len(sample), lambda: cluster_reviews(kw_df, emb))
+
+    sample = sample.copy()
+    sample["cluster_label"] = ["cluster_" + str(l) if l != -1 else "noise" for l in labels]
+    if n > embed_max:
+        corpus["cluster_label"] = bench(
+            "_assign_rest_labels_by_tfidf", n,
+            lambda: _assign_rest_labels_by_tfidf(corpus, sample, labels),
+        )
+    else:
+        corpus["cluster_label"] = sample["cluster_label"]
+
+    timeseries = bench("calculate_timeseries", n, lambda: calculate_timeseries(corpus, clusters))
+
+    clusters = stub_summaries(clusters)
+    personas = enrich_personas_with_data(generate_placeholder_personas(clusters, 3), sample, clusters)
+    with tempfile.TemporaryDirectory() as tmp:
+        bench("save_project_json", n, lambda: save_project_json(
+            f"bench-{n}", corpus, clusters, personas, {"name": "Bench", "source": "synthetic"}, tmp,
+            timeseries=timeseries,
+        ))
+    return rows
+
+
+# ---------------- report ----------------
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def _env_info(args) -> Dict[str, Any]:
+    import sklearn
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "embed_max": args.embed_max,
+    }
+
+
+def compare(current: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> int:
+    """Confronta con un report precedente; ritorna il numero di regressioni oltre la tolleranza."""
+    base = {(r["size"], r["op"]): r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (tolerance {tolerance:.0%}):")
+    for r in current:
+        b = base.get((r["size"], r["op"]))
+        if not b or not b["wall_s"]:
+            continue
+        ratio = r["wall_s"] / b["wall_s"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        regressions += bool(flag)
+        print(f"  {r['size']:>9,} {r['op']:<28} {b['wall_s']:>9.3f}s → {r['wall_s']:>9.3f}s  x{ratio:.2f} {flag}")
+    return regressions
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10k,100k,1m", help="Dimensioni dei corpus (es. 10k,100k,1m o numeri)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=1, help="Ripetizioni per operazione (si tiene la migliore)")
+    ap.add_argument("--embed-max", type=int, default=int(os.getenv("EMBED_MAX", "30000")),
+                    help="Campione embeddato/clusterizzato, come EMBED_MAX nella pipeline")
+    ap.add_argument("--langdetect-max", type=int, default=5000)
+    ap.add_argument("--out", default="bench_pipeline.json")
+    ap.add_argument("--compare", default=None, help="Report precedente con cui confrontare")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    seed = load_seed()
+    print(f"Seed: {len(seed)} reviews, languages: {sorted(seed['lang'].dropna().unique())}")
+    results: List[Dict[str, Any]] = []
+    for s in args.sizes.split(","):
+        results.extend(run_size(seed, _parse_size(s), args))
+
+    report = {"meta": _env_info(args), "results": results}
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {args.out}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,8 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 
 import hdbscan
 
+from profiling import profiled
+
 
 # Stopwords multilingua
 STOPWORDS_MULTI = {
@@ -117,6 +119,7 @@ def _clean_keyword(word: str) -> str:
     return word.lower()
 
 
+@profiled("_keywords_for_cluster", items=lambda texts, *a, **k: len(texts))
 def _keywords_for_cluster(texts: List[str], top_k: int = 15) -> List[str]:
     """
     Estrae keywords pulite usando TF-IDF con rimozione stopwords
@@ -232,6 +235,7 @@ def _build_clusters(df: pd.DataFrame, labels: np.ndarray) -> List[Dict]:
     return clusters
 
 
+@profiled("cluster_reviews", items=lambda df, *a, **k: len(df))
 def cluster_reviews(df: pd.DataFrame, embeddings: np.ndarray) -> Tuple[List[Dict], np.ndarray]:
     """
     Ritorna (clusters, labels)
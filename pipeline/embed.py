@@ -5,6 +5,7 @@ Embeddings via Voyage AI with local disk cache, tqdm progress, and smart throttl
   VOYAGE_MAX_RPM    (default 2  requests/min)
   VOYAGE_MAX_TPM    (default 9000 tokens/min)
 - Salva cache su disco e riprende dopo restart.
+- Il throttling è globale al processo (progetti in parallelo condividono la quota).
 """
 from __future__ import annotations
 
@@ -13,12 +14,15 @@ import time
 import math
 import pickle
 import hashlib
+import threading
 from pathlib import Path
 from typing import List, Dict
 
 import numpy as np
 from tqdm.auto import tqdm
 
+import profiling
+
 # voyageai client
 try:
     import voyageai  # type: ignore
@@ -68,6 +72,47 @@ def test_voyage_connection() -> bool:
         return False
 
 
+class _Throttle:
+    """
+    Limiti RPM/TPM condivisi da tutte le chiamate del processo (anche da progetti
+    elaborati in parallelo), così la quota della API key non viene superata.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_call = 0.0
+        self._window_start = time.time()
+        self._tokens_in_window = 0
+
+    def acquire(self, est_tokens: int) -> None:
+        max_rpm = float(os.getenv("VOYAGE_MAX_RPM", "2"))
+        max_tpm = int(os.getenv("VOYAGE_MAX_TPM", "9000"))  # per free-tier/limite ridotto
+        min_interval = 60.0 / max(1.0, max_rpm)
+        with self._lock:
+            # throttling semplice RPM
+            elapsed = time.time() - self._last_call
+            if elapsed < min_interval:
+                time.sleep(min_interval - elapsed)
+
+            # throttling TPM (stima) su finestrella di 60s
+            now = time.time()
+            if now - self._window_start >= 60.0:
+                self._window_start = now
+                self._tokens_in_window = 0
+            if self._tokens_in_window + est_tokens > max_tpm:
+                sleep_s = 60.0 - (now - self._window_start)
+                if sleep_s > 0:
+                    time.sleep(sleep_s)
+                self._window_start = time.time()
+                self._tokens_in_window = 0
+
+            self._tokens_in_window += est_tokens
+            self._last_call = time.time()
+
+
+_THROTTLE = _Throttle()
+
+
 def _estimate_tokens(text: str) -> int:
     # stima grossolana: ~4 char/token
     return max(1, math.ceil(len(text) / 4))
@@ -90,14 +135,6 @@ def compute_embeddings_with_cache(
         raise RuntimeError("Voyage API not available in this environment")
 
     batch_size = int(os.getenv("VOYAGE_BATCH_SIZE", str(batch_size or 32)))
-    max_rpm = float(os.getenv("VOYAGE_MAX_RPM", "2"))
-    max_tpm = int(os.getenv("VOYAGE_MAX_TPM", "9000"))  # per free-tier/limite ridotto
-
-    # finestrella di 60s per TPM
-    window_start = time.time()
-    tokens_in_window = 0
-
-    min_interval = 60.0 / max(1.0, max_rpm)
 
     cache = _load_cache(cache_file)
     out: List[List[float] | None] = [None] * len(texts)
@@ -113,11 +150,12 @@ def compute_embeddings_with_cache(
         else:
             idx_to_embed.append(i)
 
+    profiling.incr("cache.embeddings.hits", len(texts) - len(idx_to_embed))
+    profiling.incr("cache.embeddings.misses", len(idx_to_embed))
     if not idx_to_embed:
         return np.array(out, dtype=np.float32)
 
     pbar = tqdm(total=len(idx_to_embed), desc=desc or "Embeddings", unit="txt")
-    last_call = 0.0
 
     i0 = 0
     while i0 < len(idx_to_embed):
@@ -125,29 +163,16 @@ def compute_embeddings_with_cache(
         batch_idx = idx_to_embed[i0:i1]
         batch = [texts[i] for i in batch_idx]
 
-        # throttling semplice RPM
-        elapsed = time.time() - last_call
-        if elapsed < min_interval:
-            time.sleep(min_interval - elapsed)
-
-        # throttling TPM (stima)
-        now = time.time()
-        if now - window_start >= 60.0:
-            window_start = now
-            tokens_in_window = 0
-
         est_tokens = sum(_estimate_tokens(t) for t in batch)
-        if tokens_in_window + est_tokens > max_tpm:
-            sleep_s = 60.0 - (now - window_start)
-            if sleep_s > 0:
-                time.sleep(sleep_s)
-            window_start = time.time()
-            tokens_in_window = 0
+        _THROTTLE.acquire(est_tokens)
 
         # chiamata API con retry/backoff su 429
+        profiling.incr("voyage.calls")
         try:
-            resp = vo.embed(batch, model=model, input_type="document")
+            with profiling.timed("vo.embed", items=len(batch)):
+                resp = vo.embed(batch, model=model, input_type="document")
         except RateLimitError as e:
+            profiling.incr("voyage.rate_limited")
             # backoff aggressivo e riduzione batch
             wait = 20
             print(f"Rate limit: backing off {wait}s and reducing batch size")
@@ -161,13 +186,12 @@ def compute_embeddings_with_cache(
             continue
 
         embs = resp.embeddings  # List[List[float]]
+        profiling.incr("voyage.est_tokens", est_tokens)
         for j, k in enumerate(batch_idx):
             h = _text_hash(str(texts[k]))
             cache[h] = embs[j]
             out[k] = embs[j]
 
-        tokens_in_window += est_tokens
-        last_call = time.time()
         pbar.update(len(batch_idx))
         i0 = i1
 
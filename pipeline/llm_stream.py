@@ -0,0 +1,205 @@
+"""
+Streaming delle risposte Anthropic con validazione JSON incrementale.
+- La risposta viene letta token per token: appena arriva un carattere che rende
+  il JSON strutturalmente invalido lo stream viene chiuso (niente attesa fino a max_tokens).
+- Il retry riparte dal prefisso valido già ricevuto, passato come prefill dell'assistente,
+  invece di rigenerare tutta la risposta.
+- Per ogni chiamata registra time-to-first-token, latenza totale e token usati.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+import profiling
+
+_WS = frozenset(" \t\r\n")
+# caratteri ammessi fuori dalle stringhe oltre a struttura/separatori (numeri, true/false/null)
+_SCALAR_CHARS = frozenset("0123456789+-.eEtrufalsn")
+
+
+class JSONStreamValidator:
+    """
+    Validatore strutturale incrementale per un singolo oggetto JSON top-level.
+    Non è un parser completo: controlla bilanciamento di {}/[], stringhe e caratteri
+    ammessi, che è quanto basta per accorgersi subito di prosa o markdown nella risposta.
+    Stati: 'ok' (in corso), 'done' (oggetto chiuso), 'malformed'.
+    """
+
+    def __init__(self, prefix: str = ""):
+        self.text = ""
+        self.valid_upto = 0
+        self.state = "ok"
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        if prefix:
+            self.feed(prefix)
+
+    @property
+    def valid_text(self) -> str:
+        return self.text[:self.valid_upto]
+
+    def feed(self, chunk: str) -> str:
+        if self.state != "ok" or not chunk:
+            return self.state
+        base = len(self.text)
+        self.text += chunk
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch in _WS:
+                continue
+            if not self._started:
+                if ch != "{":
+                    return self._fail(base + i)
+                self._started = True
+                self._stack.append("}")
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._stack.append("}")
+            elif ch == "[":
+                self._stack.append("]")
+            elif ch in "}]":
+                if not self._stack or self._stack.pop() != ch:
+                    return self._fail(base + i)
+                if not self._stack:
+                    self.valid_upto = base + i + 1
+                    self.state = "done"
+                    return self.state
+            elif ch in ",:" or ch in _SCALAR_CHARS:
+                pass
+            else:
+                return self._fail(base + i)
+        self.valid_upto = len(self.text)
+        return self.state
+
+    def _fail(self, pos: int) -> str:
+        self.valid_upto = pos
+        self.state = "malformed"
+        return self.state
+
+
+# -------- Metriche per chiamata --------
+@dataclass
+class LLMCallStats:
+    label: str
+    model: str
+    attempt: int
+    outcome: str                 # ok | malformed | incomplete | invalid_json | error
+    ttft_s: Optional[float]
+    total_s: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    prefill_chars: int = 0
+
+
+_CALL_LOG: List[LLMCallStats] = []
+_CALL_LOG_LOCK = threading.Lock()
+
+
+def _record(stats: LLMCallStats) -> None:
+    with _CALL_LOG_LOCK:
+        _CALL_LOG.append(stats)
+    profiling.incr("anthropic.calls")
+    profiling.incr(f"anthropic.outcome.{stats.outcome}")
+    profiling.incr("anthropic.input_tokens", stats.input_tokens)
+    profiling.incr("anthropic.output_tokens", stats.output_tokens)
+
+
+def call_stats() -> List[Dict[str, Any]]:
+    """Copia delle metriche registrate (una entry per tentativo)."""
+    with _CALL_LOG_LOCK:
+        return [asdict(s) for s in _CALL_LOG]
+
+
+def reset_call_stats() -> None:
+    with _CALL_LOG_LOCK:
+        _CALL_LOG.clear()
+
+
+def stream_json(
+    client,
+    *,
+    model: str,
+    system: str,
+    user: str,
+    max_tokens: int,
+    temperature: float = 0.3,
+    label: str = "llm",
+    max_attempts: int = 2,
+) -> Optional[Dict[str, Any]]:
+    """
+    Chiede un oggetto JSON in streaming e lo valida mentre arriva.
+    L'assistente viene pre-compilato con '{' così la risposta parte già come JSON;
+    se lo stream diventa malformato o si tronca, il tentativo successivo riprende dal
+    prefisso valido. Ritorna il dict parsato oppure None.
+    Gli errori API (APIStatusError, rete) vengono propagati al chiamante dopo la registrazione.
+    """
+    prefix = "{"
+    for attempt in range(max_attempts):
+        validator = JSONStreamValidator(prefix)
+        t0 = time.perf_counter()
+        ttft: Optional[float] = None
+        in_tok = out_tok = 0
+        try:
+            with client.messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=system,
+                messages=[
+                    {"role": "user", "content": user},
+                    {"role": "assistant", "content": prefix},
+                ],
+            ) as stream:
+                for event in stream:
+                    etype = getattr(event, "type", "")
+                    if etype == "message_start":
+                        usage = getattr(event.message, "usage", None)
+                        in_tok = int(getattr(usage, "input_tokens", 0) or 0)
+                    elif etype == "message_delta":
+                        usage = getattr(event, "usage", None)
+                        out_tok = int(getattr(usage, "output_tokens", 0) or 0)
+                    elif etype == "content_block_delta" and getattr(event.delta, "type", "") == "text_delta":
+                        if ttft is None:
+                            ttft = time.perf_counter() - t0
+                        if validator.feed(event.delta.text) != "ok":
+                            # chiudere il context manager interrompe la risposta HTTP
+                            break
+        except Exception:
+            _record(LLMCallStats(label, model, attempt, "error", ttft,
+                                 time.perf_counter() - t0, in_tok, out_tok, len(prefix)))
+            raise
+
+        elapsed = time.perf_counter() - t0
+        if validator.state == "done":
+            try:
+                result = json.loads(validator.valid_text, strict=False)
+            except ValueError:
+                # struttura bilanciata ma token invalidi: si riparte da zero
+                _record(LLMCallStats(label, model, attempt, "invalid_json", ttft,
+                                     elapsed, in_tok, out_tok, len(prefix)))
+                prefix = "{"
+                continue
+            _record(LLMCallStats(label, model, attempt, "ok", ttft, elapsed, in_tok, out_tok, len(prefix)))
+            return result if isinstance(result, dict) else None
+
+        # malformato o troncato (max_tokens): riprova riusando il prefisso valido come contesto
+        outcome = "malformed" if validator.state == "malformed" else "incomplete"
+        _record(LLMCallStats(label, model, attempt, outcome, ttft, elapsed, in_tok, out_tok, len(prefix)))
+        # il prefill non può terminare con whitespace
+        prefix = validator.valid_text.rstrip() or "{"
+
+    return None
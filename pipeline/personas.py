@@ -9,6 +9,8 @@ from typing import List, Dict, Any
 import numpy as np
 import pandas as pd
 
+from llm_stream import stream_json
+
 # Anthropic (opzionale, gestito a runtime)
 try:
     import anthropic
@@ -177,15 +179,15 @@ def generate_personas(clusters: List[Dict[str, Any]], embed_df: pd.DataFrame, n_
         clusters_json=clusters_json,
     )
     try:
-        res = client.messages.create(
+        data = stream_json(
+            client,
             model=_anthropic_model_name(),
+            system=PERSONA_SYSTEM,
+            user=user,
             max_tokens=2000,
             temperature=0.3,
-            system=PERSONA_SYSTEM,
-            messages=[{"role": "user", "content": user}],
-        )
-        txt = "".join([c.text for c in res.content if hasattr(c, "text")])
-        data = json.loads(txt)
+            label="personas",
+        ) or {}
         personas = data.get("personas", [])
         print(f">> Generated {len(personas)} AI personas successfully")
     except Exception as e:
@@ -266,7 +268,7 @@ def _classify_domain(keywords: List[str], embed_df: pd.DataFrame) -> str:
     keywords_str = " ".join(keywords).lower()
     
     # Analizza anche i testi per pattern
-    sample_texts = embed_df["text"].head(20).str.lower().str.cat(sep=" ")
+    sample_texts = embed_df["text"].head(20).str.lower().str.cat(sep=" ") if "text" in embed_df.columns else ""
     combined_text = keywords_str + " " + sample_texts
     
     # Classificazione per pattern
@@ -0,0 +1,242 @@
+"""
+Strumentazione dei run della pipeline.
+- Ogni progetto registra le metriche nel proprio scope (thread-local: i progetti in
+  parallelo non si mescolano).
+- Per stadio: wall time, CPU time del thread che lo esegue, picco RSS del processo, righe/s,
+  esito (ran/cached).
+- cpu_s viene da time.thread_time(): conta solo il thread dello scope (il thread principale,
+  o quello del progetto con i progetti in parallelo); il lavoro delegato ad altri thread
+  (pool, librerie native) o processi compare solo nel wall time.
+- process_peak_rss_mb è ru_maxrss: il massimo dell'intero processo dall'avvio, non il
+  consumo dello stadio (con progetti in parallelo include anche gli altri).
+- Funzioni calde decorate con @profiled: chiamate, wall/CPU cumulati, item/s.
+- Contatori liberi (chiamate API, token, hit/miss delle cache) via incr().
+- Report JSON con write_report(); dump cProfile per progetto con cprofile_scope().
+Senza uno scope attivo decoratori e contatori non registrano nulla.
+"""
+from __future__ import annotations
+
+import cProfile
+import functools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource  # solo unix
+except ImportError:  # pragma: no cover - windows
+    resource = None
+
+
+def process_peak_rss_mb() -> Optional[float]:
+    """Picco di memoria residente dell'intero processo dall'avvio (MB), non per stadio."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux: KB, macOS: byte
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    status: str                      # ran | cached
+    wall_s: float = 0.0
+    cpu_s: float = 0.0               # solo il thread dello scope
+    rows: Optional[int] = None
+    rows_per_s: Optional[float] = None
+    process_peak_rss_mb: Optional[float] = None
+
+
+@dataclass
+class FunctionMetrics:
+    calls: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    items: int = 0
+
+
+@dataclass
+class RunProfile:
+    project_id: str
+    started_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    stages: List[StageMetrics] = field(default_factory=list)
+    functions: Dict[str, FunctionMetrics] = field(default_factory=dict)
+    counters: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        for name, fm in out["functions"].items():
+            fm["wall_s"] = round(fm["wall_s"], 4)
+            fm["cpu_s"] = round(fm["cpu_s"], 4)
+            fm["items_per_s"] = round(fm["items"] / fm["wall_s"], 1) if fm["wall_s"] > 0 and fm["items"] else None
+        out["cache_hit_rates"] = _hit_rates(self.counters)
+        return out
+
+
+def _hit_rates(counters: Dict[str, float]) -> Dict[str, Optional[float]]:
+    """'cache.<nome>.hits' / 'cache.<nome>.misses' → hit rate per cache."""
+    names = {k[len("cache."):].rsplit(".", 1)[0] for k in counters if k.startswith("cache.")}
+    rates: Dict[str, Optional[float]] = {}
+    for n in sorted(names):
+        hits = counters.get(f"cache.{n}.hits", 0)
+        total = hits + counters.get(f"cache.{n}.misses", 0)
+        rates[n] = round(hits / total, 4) if total else None
+    return rates
+
+
+_local = threading.local()
+_RUNS: List[RunProfile] = []
+_RUNS_LOCK = threading.Lock()
+
+
+def current() -> Optional[RunProfile]:
+    return getattr(_local, "run", None)
+
+
+@contextmanager
+def run_scope(project_id: str):
+    """Attiva uno scope di profiling per il progetto nel thread corrente."""
+    prev = current()
+    run = RunProfile(project_id)
+    _local.run = run
+    t0, c0 = time.perf_counter(), time.thread_time()
+    try:
+        yield run
+    finally:
+        run.wall_s = round(time.perf_counter() - t0, 3)
+        run.cpu_s = round(time.thread_time() - c0, 3)
+        _local.run = prev
+        with _RUNS_LOCK:
+            _RUNS.append(run)
+
+
+@contextmanager
+def stage_scope(name: str):
+    """Misura uno stadio; chi lo esegue può impostare `rows` sull'oggetto restituito."""
+    run = current()
+    m = StageMetrics(name=name, status="ran")
+    t0, c0 = time.perf_counter(), time.thread_time()
+    try:
+        yield m
+    finally:
+        m.wall_s = round(time.perf_counter() - t0, 3)
+        m.cpu_s = round(time.thread_time() - c0, 3)
+        if m.rows and m.wall_s > 0:
+            m.rows_per_s = round(m.rows / m.wall_s, 1)
+        m.process_peak_rss_mb = process_peak_rss_mb()
+        if run is not None:
+            run.stages.append(m)
+
+
+def stage_cached(name: str) -> None:
+    run = current()
+    if run is not None:
+        run.stages.append(StageMetrics(name=name, status="cached", process_peak_rss_mb=process_peak_rss_mb()))
+
+
+def incr(name: str, value: float = 1) -> None:
+    run = current()
+    if run is not None:
+        run.counters[name] = run.counters.get(name, 0) + value
+
+
+@contextmanager
+def timed(name: str, items: int = 0):
+    """Come @profiled, per un blocco di codice (es. una singola chiamata API)."""
+    run = current()
+    if run is None:
+        yield
+        return
+    t0, c0 = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        _add(run, name, time.perf_counter() - t0, time.thread_time() - c0, items)
+
+
+def _add(run: RunProfile, name: str, wall: float, cpu: float, items: int) -> None:
+    fm = run.functions.get(name)
+    if fm is None:
+        fm = run.functions[name] = FunctionMetrics()
+    fm.calls += 1
+    fm.wall_s += wall
+    fm.cpu_s += cpu
+    fm.items += items
+
+
+def profiled(name: Optional[str] = None, items: Optional[Callable[..., int]] = None):
+    """
+    Decoratore per le funzioni calde. `items(*args, **kwargs)` stima gli elementi
+    elaborati dalla chiamata (default 1) per calcolare il throughput.
+    """
+    def deco(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = current()
+            if run is None:
+                return fn(*args, **kwargs)
+            t0, c0 = time.perf_counter(), time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                n = 1
+                if items is not None:
+                    try:
+                        n = int(items(*args, **kwargs))
+                    except Exception:
+                        n = 0
+                _add(run, label, time.perf_counter() - t0, time.thread_time() - c0, n)
+        return wrapper
+    return deco
+
+
+@contextmanager
+def cprofile_scope(out_dir: Optional[str], project_id: str):
+    """
+    Profila con cProfile il thread corrente e salva <out_dir>/<project_id>.prof
+    (formato pstats: snakeviz, `python -m pstats`, flameprof...).
+    """
+    if not out_dir:
+        yield
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        path = Path(out_dir)
+        path.mkdir(parents=True, exist_ok=True)
+        prof.dump_stats(str(path / f"{project_id}.prof"))
+
+
+def runs() -> List[Dict[str, Any]]:
+    with _RUNS_LOCK:
+        return [r.to_dict() for r in _RUNS]
+
+
+def write_report(path: str, extra: Optional[Dict[str, Any]] = None) -> Path:
+    """Scrive il report JSON di tutti i progetti profilati nel processo."""
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "process_peak_rss_mb": process_peak_rss_mb(),
+        "runs": runs(),
+    }
+    if extra:
+        report.update(extra)
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return p
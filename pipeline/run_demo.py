@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 import argparse
+import copy
 import os
+import sys
 import json
 from pathlib import Path
 
@@ -28,6 +30,9 @@ from embed import compute_embeddings_with_cache, test_voyage_connection
 from cluster import cluster_reviews
 from summarize import summarize_clusters, test_anthropic_connection
 from personas import generate_personas, enrich_personas_with_data
+import profiling
+from scheduler import ProjectTask, configure_limits, run_projects, stage_slot
+from stages import ROOT, Stage, StageRunner, hash_frame
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -93,6 +98,8 @@ def _compute_sentiment_with_resume(df: pd.DataFrame, project_id: str, chunk_size
         df['sentiment'] = np.nan
         missing = df['sentiment'].isna()
 
+    profiling.incr("cache.sentiment.hits", int((~missing).sum()))
+    profiling.incr("cache.sentiment.misses", int(missing.sum()))
     if missing.sum() == 0:
         return df
 
@@ -170,120 +177,60 @@ def _save_reviews_enriched(df: pd.DataFrame, project_id: str, output_dir: str, s
     output_path = Path(output_dir) / f"{project_id}_reviews.jsonl"
     enriched.to_json(output_path, orient='records', lines=True, force_ascii=False)
     print(f">> Saved enriched reviews to {output_path}")
+    arrow_path = _save_reviews_arrow(enriched, output_path.with_suffix('.arrow'))
+    if arrow_path:
+        print(f">> Saved columnar reviews to {arrow_path}")
     return output_path
 
 
-def process_dataset(
-    df: pd.DataFrame,
-    project_id: str,
-    project_name: str,
-    source_name: str,
-    output_dir: str,
-    max_reviews: int = 10000,
-    use_lemmatization: bool = False
-) -> str:
-    print(f"\n=== Processing project: {project_id} ===")
-    df = _compute_sentiment_with_resume(df, project_id)
-    if len(df) > max_reviews:
-        df = df.sample(n=max_reviews, random_state=42).reset_index(drop=True)
-
-    steps = ["Embeddings","Clustering","Assegnazione","Sommari","Personas","Timeseries","Salvataggio"]
-    pbar = tqdm(total=len(steps), desc=f"{project_id} pipeline", leave=False)
-
-    embed_max = min(len(df), int(os.getenv("EMBED_MAX", "30000")))
-    embed_df = df.sample(n=embed_max, random_state=123).copy() if len(df) > embed_max else df.copy()
-
-    # Prepara dataframe per keywords con testo preprocessato
-    kw_df = embed_df.copy()
-    print(f"\n>> Preprocessing text for keywords (lemmatization={'ON' if use_lemmatization else 'OFF'})...")
-    kw_df['text'] = kw_df.apply(
-        lambda row: preprocess_for_keywords(
-            row['text'], 
-            lang=row.get('lang', 'en'), 
-            use_lemmatization=use_lemmatization
-        ), 
-        axis=1
-    )
-    
-    print("\n>> Step 3: Embeddings")
-    cache_file = f"./cache/embeddings/{project_id}_embeddings.pkl"
-    use_voyage = test_voyage_connection()
-    if use_voyage:
-        embeddings = compute_embeddings_with_cache(
-            embed_df['text'].tolist(),
-            cache_file=cache_file,
-            desc=f"{project_id} • Embeddings"
-        )
-    else:
-        print("WARNING: Using fallback embeddings (Voyage API not available)")
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        vectorizer = TfidfVectorizer(max_features=512, min_df=2, max_df=0.9)
-        embeddings = vectorizer.fit_transform(embed_df['text']).toarray()
-    pbar.update(1)
-
-    print("\n>> Step 4: Clustering")
-    # Usa kw_df per keywords migliori, ma mantieni embed_df per il resto
-    clusters, labels = cluster_reviews(kw_df, embeddings)
-    embed_df['cluster_label'] = ['cluster_' + str(l) if l != -1 else 'noise' for l in labels]
-    pbar.update(1)
-
-    print("\n>> Step 4b: Assigning labels to non-sampled reviews")
-    if len(df) > len(embed_df):
-        all_labels = _assign_rest_labels_by_tfidf(df, embed_df, labels)
-        df['cluster_label'] = all_labels
-        mask = df['cluster_label'] != 'noise'
-        total = int(mask.sum()) or 1
-        counts = df.loc[mask, 'cluster_label'].value_counts()
-        share_map = {k: v / total for k, v in counts.items()}
-        for c in clusters:
-            cid = c['id']
-            c['size'] = int(counts.get(cid, c['size']))
-            c['share'] = round(float(share_map.get(cid, c['share'])), 3)
-    else:
-        df['cluster_label'] = embed_df['cluster_label']
-    pbar.update(1)
+# colonne a bassa cardinalità → dictionary encoding nel file Arrow
+_ARROW_DICT_COLS = ('clusterId', 'clusterLabel', 'lang', 'sourceId', 'projectId')
 
-    # Aggiungi citazioni reali
-    clusters = _attach_cluster_quotes(clusters, df, n_per_cluster=12)
 
-    print("\n>> Step 5: Cluster Summarization")
-    use_claude = test_anthropic_connection()
-    if use_claude:
-        clusters = summarize_clusters(clusters, embed_df, max_clusters=10)
-    else:
-        print("WARNING: Using rule-based summarization (Claude API not available)")
-    
-    # Mappa cluster labels dopo summarization
-    cluster_label_map = {c['id']: c['label'] for c in clusters}
-    pbar.update(1)
+def _save_reviews_arrow(enriched: pd.DataFrame, path: Path) -> Path | None:
+    """
+    Versione tipizzata di <project>_reviews.jsonl per l'API (Arrow IPC / Feather v2):
+    date come timestamp, stringhe ripetute dictionary-encoded, nessuna compressione
+    così il file si può aprire in memory-map. Richiede pyarrow (opzionale).
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+    except Exception:
+        return None
+    df = enriched.copy()
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    for col in ('sentiment', 'rating'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in _ARROW_DICT_COLS:
+        df[col] = df[col].astype('category')
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp = path.with_suffix('.arrow.tmp')
+        feather.write_feather(table, str(tmp), compression='uncompressed')
+        os.replace(tmp, path)
+        return path
+    except Exception as e:
+        print(f"WARNING: could not write {path.name}: {e}")
+        return None
 
-    print("\n>> Step 6: Persona Generation")
-    if use_claude:
-        personas = generate_personas(clusters, embed_df, n_personas=3)
-    else:
-        from personas import generate_placeholder_personas
-        personas = generate_placeholder_personas(clusters, n_personas=3)
-    personas = enrich_personas_with_data(personas, embed_df, clusters)
-    pbar.update(1)
 
-    print("\n>> Step 7: Timeseries Analysis")
-    timeseries = calculate_timeseries(df, clusters)
-    pbar.update(1)
+def _sample_frames(sample_out: dict, clustering_out: dict | None = None, assignment_out: dict | None = None):
+    """Ricostruisce (df, embed_df) dagli output degli stadi, con cluster_label se disponibile."""
+    df = sample_out['df'].copy()
+    embed_df = df.loc[sample_out['embed_idx']].copy()
+    if clustering_out is not None:
+        embed_df['cluster_label'] = clustering_out['cluster_label']
+    if assignment_out is not None:
+        df['cluster_label'] = assignment_out['cluster_label']
+    return df, embed_df
 
-    print("\n>> Step 8: Saving Results")
-    meta = {"name": project_name, "source": source_name}
-    
-    # Salva JSON principale con timeseries
-    output_path = save_project_json(project_id, df, clusters, personas, meta, output_dir, timeseries=timeseries)
-    
-    # Salva recensioni arricchite per API
-    reviews_path = _save_reviews_enriched(df, project_id, output_dir, source_name, cluster_label_map)
-    
-    pbar.update(1); pbar.close()
 
+def _publish(project_id: str, output_path, reviews_path) -> None:
+    """Copia il progetto nel frontend (public/demo/projects) e nella cartella dati dell'API."""
+    import shutil
     front = Path('../public/demo/projects')
     if front.exists():
-        import shutil
         try:
             shutil.copy(output_path, front / f"{project_id}.json")
             shutil.copy(reviews_path, front / f"{project_id}_reviews.jsonl")
@@ -293,7 +240,236 @@ def process_dataset(
     else:
         print(f"WARNING: Frontend directory not found at {front}")
 
-    return output_path
+    # dati per l'API: documento di progetto, JSONL + artefatto colonnare (se generato)
+    api_data = Path('../ai_service/_data')
+    if api_data.exists():
+        try:
+            shutil.copy(output_path, api_data / f"{project_id}.json")
+            for src in (Path(reviews_path), Path(reviews_path).with_suffix('.arrow')):
+                if src.exists():
+                    shutil.copy(src, api_data / src.name)
+            print(f"Copied project and reviews to API data dir: {api_data}")
+        except Exception as e:
+            print(f"Copy to API data dir failed: {e}")
+
+
+def _build_stages(
+    project_id: str,
+    project_name: str,
+    source_name: str,
+    output_dir: str,
+    max_reviews: int,
+    use_lemmatization: bool,
+    publish: bool = True,
+) -> list[Stage]:
+    """
+    DAG degli stadi di process_dataset (in ordine topologico).
+    I parametri dichiarati in `params` entrano nella chiave di checkpoint dello stadio.
+    publish=False: il salvataggio resta in output_dir, senza copie nel frontend e nell'API.
+    """
+
+    def sentiment(ctx, inp):
+        df = inp[ROOT]['df'].copy()
+        ctx.rows = len(df)
+        return {'df': _compute_sentiment_with_resume(df, project_id)}
+
+    def sample(ctx, inp):
+        df = inp['sentiment']['df']
+        if len(df) > max_reviews:
+            df = df.sample(n=max_reviews, random_state=42).reset_index(drop=True)
+        embed_max = min(len(df), int(os.getenv("EMBED_MAX", "30000")))
+        embed_idx = df.sample(n=embed_max, random_state=123).index if len(df) > embed_max else df.index
+        ctx.rows = len(df)
+        return {'df': df, 'embed_idx': np.asarray(embed_idx)}
+
+    def keywords(ctx, inp):
+        # Testo preprocessato per keywords (embed_df resta invariato per il resto)
+        _, embed_df = _sample_frames(inp['sample'])
+        ctx.rows = len(embed_df)
+        print(f">> Preprocessing text for keywords (lemmatization={'ON' if use_lemmatization else 'OFF'})...")
+        kw_text = embed_df.apply(
+            lambda row: preprocess_for_keywords(
+                row['text'],
+                lang=row.get('lang', 'en'),
+                use_lemmatization=use_lemmatization
+            ),
+            axis=1
+        )
+        return {'kw_text': kw_text}
+
+    def embeddings(ctx, inp):
+        _, embed_df = _sample_frames(inp['sample'])
+        cache_file = f"./cache/embeddings/{project_id}_embeddings.pkl"
+        ctx.rows = len(embed_df)
+        with stage_slot("api"):
+            use_voyage = test_voyage_connection()
+            if use_voyage:
+                emb = compute_embeddings_with_cache(
+                    embed_df['text'].tolist(),
+                    cache_file=cache_file,
+                    desc=f"{project_id} • Embeddings"
+                )
+        if not use_voyage:
+            print("WARNING: Using fallback embeddings (Voyage API not available)")
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            with stage_slot("cpu"):
+                vectorizer = TfidfVectorizer(max_features=512, min_df=2, max_df=0.9)
+                emb = vectorizer.fit_transform(embed_df['text']).toarray()
+            # fallback: al prossimo run si riprova con Voyage
+            ctx.checkpoint = False
+        return {'embeddings': emb, 'backend': 'voyage' if use_voyage else 'tfidf'}
+
+    def clustering(ctx, inp):
+        # Usa kw_df per keywords migliori, ma mantieni embed_df per il resto
+        _, embed_df = _sample_frames(inp['sample'])
+        kw_df = embed_df.copy()
+        ctx.rows = len(kw_df)
+        kw_df['text'] = inp['keywords']['kw_text']
+        clusters, labels = cluster_reviews(kw_df, inp['embeddings']['embeddings'])
+        cluster_label = ['cluster_' + str(l) if l != -1 else 'noise' for l in labels]
+        return {'clusters': clusters, 'labels': labels, 'cluster_label': cluster_label}
+
+    def assignment(ctx, inp):
+        df, embed_df = _sample_frames(inp['sample'], inp['clustering'])
+        clusters = copy.deepcopy(inp['clustering']['clusters'])
+        ctx.rows = len(df)
+        if len(df) > len(embed_df):
+            all_labels = _assign_rest_labels_by_tfidf(df, embed_df, inp['clustering']['labels'])
+            df['cluster_label'] = all_labels
+            mask = df['cluster_label'] != 'noise'
+            total = int(mask.sum()) or 1
+            counts = df.loc[mask, 'cluster_label'].value_counts()
+            share_map = {k: v / total for k, v in counts.items()}
+            for c in clusters:
+                cid = c['id']
+                c['size'] = int(counts.get(cid, c['size']))
+                c['share'] = round(float(share_map.get(cid, c['share'])), 3)
+        else:
+            df['cluster_label'] = embed_df['cluster_label']
+        return {'cluster_label': df['cluster_label'], 'clusters': clusters}
+
+    def quotes(ctx, inp):
+        # Aggiungi citazioni reali
+        df, _ = _sample_frames(inp['sample'], assignment_out=inp['assignment'])
+        clusters = copy.deepcopy(inp['assignment']['clusters'])
+        ctx.rows = len(df)
+        return {'clusters': _attach_cluster_quotes(clusters, df, n_per_cluster=12)}
+
+    def summaries(ctx, inp):
+        _, embed_df = _sample_frames(inp['sample'], inp['clustering'])
+        clusters = copy.deepcopy(inp['quotes']['clusters'])
+        with stage_slot("api"):
+            use_claude = test_anthropic_connection()
+            if use_claude:
+                clusters = summarize_clusters(clusters, embed_df, max_clusters=10)
+        if not use_claude:
+            print("WARNING: Using rule-based summarization (Claude API not available)")
+            if os.getenv("ANTHROPIC_API_KEY"):
+                # chiave presente ma API non raggiungibile: non congelare i placeholder
+                ctx.checkpoint = False
+        return {'clusters': clusters, 'use_claude': use_claude}
+
+    def personas(ctx, inp):
+        _, embed_df = _sample_frames(inp['sample'], inp['clustering'])
+        clusters = inp['summaries']['clusters']
+        if inp['summaries']['use_claude']:
+            with stage_slot("api"):
+                out = generate_personas(clusters, embed_df, n_personas=3)
+        else:
+            from personas import generate_placeholder_personas
+            out = generate_placeholder_personas(clusters, n_personas=3)
+        return {'personas': enrich_personas_with_data(out, embed_df, clusters)}
+
+    def timeseries(ctx, inp):
+        # Usa solo gli id dei cluster: non dipende dai sommari
+        df, _ = _sample_frames(inp['sample'], assignment_out=inp['assignment'])
+        ctx.rows = len(df)
+        return {'timeseries': calculate_timeseries(df, inp['assignment']['clusters'])}
+
+    def save(ctx, inp):
+        df, _ = _sample_frames(inp['sample'], assignment_out=inp['assignment'])
+        clusters = inp['summaries']['clusters']
+        ctx.rows = len(df)
+        # Mappa cluster labels dopo summarization
+        cluster_label_map = {c['id']: c['label'] for c in clusters}
+        meta = {"name": project_name, "source": source_name}
+
+        # Salva JSON principale con timeseries
+        output_path = save_project_json(project_id, df, clusters, inp['personas']['personas'], meta, output_dir,
+                                        timeseries=inp['timeseries']['timeseries'])
+
+        # Salva recensioni arricchite per API
+        reviews_path = _save_reviews_enriched(df, project_id, output_dir, source_name, cluster_label_map)
+
+        if publish:
+            _publish(project_id, output_path, reviews_path)
+        return {'output_path': str(output_path), 'reviews_path': str(reviews_path)}
+
+    def _outputs_exist(out: dict) -> bool:
+        return all(Path(out[k]).exists() for k in ('output_path', 'reviews_path'))
+
+    return [
+        Stage('sentiment', sentiment, deps=(ROOT,), kind='cpu',
+              params={'model': os.getenv("SENTIMENT_MODEL", "cardiffnlp/twitter-xlm-roberta-base-sentiment")}),
+        Stage('sample', sample, deps=('sentiment',),
+              params={'max_reviews': max_reviews, 'embed_max': int(os.getenv("EMBED_MAX", "30000"))}),
+        Stage('keywords', keywords, deps=('sample',), kind='cpu',
+              params={'lemmatize': use_lemmatization}),
+        Stage('embeddings', embeddings, deps=('sample',),
+              params={'model': os.getenv("VOYAGE_MODEL", "voyage-3.5-lite")}),
+        Stage('clustering', clustering, deps=('sample', 'keywords', 'embeddings'), kind='cpu'),
+        Stage('assignment', assignment, deps=('sample', 'clustering'), kind='cpu'),
+        Stage('quotes', quotes, deps=('sample', 'assignment'), kind='cpu'),
+        Stage('summaries', summaries, deps=('sample', 'clustering', 'quotes'),
+              params={'model': os.getenv("ANTHROPIC_MODEL", ""), 'llm': bool(os.getenv("ANTHROPIC_API_KEY"))}),
+        Stage('personas', personas, deps=('sample', 'clustering', 'summaries')),
+        Stage('timeseries', timeseries, deps=('sample', 'assignment'), kind='cpu'),
+        Stage('save', save, deps=('sample', 'assignment', 'summaries', 'personas', 'timeseries'), kind='cpu',
+              params={'output_dir': str(Path(output_dir).resolve()), 'name': project_name, 'source': source_name,
+                      'publish': publish},
+              version='2', check=_outputs_exist),
+    ]
+
+
+STAGE_NAMES = [
+    'sentiment', 'sample', 'keywords', 'embeddings', 'clustering', 'assignment',
+    'quotes', 'summaries', 'personas', 'timeseries', 'save',
+]
+
+
+def process_dataset(
+    df: pd.DataFrame,
+    project_id: str,
+    project_name: str,
+    source_name: str,
+    output_dir: str,
+    max_reviews: int = 10000,
+    use_lemmatization: bool = False,
+    from_stage: str | None = None,
+    only_stage: str | None = None,
+    on_stage=None,
+    publish: bool = True,
+) -> str:
+    """
+    Esegue la pipeline come DAG di stadi con checkpoint (vedi stages.py):
+    gli stadi con input invariati vengono saltati.
+    on_stage(nome, stato, indice, totale) riceve l'avanzamento (es. job dell'API).
+    """
+    print(f"\n=== Processing project: {project_id} ===")
+    stages = _build_stages(project_id, project_name, source_name, output_dir, max_reviews, use_lemmatization,
+                           publish=publish)
+    root_key = hash_frame(df, ['id', 'text', 'rating', 'timestamp', 'lang'])
+    runner = StageRunner(
+        project_id, stages,
+        root_inputs={'df': df}, root_key=root_key,
+        from_stage=from_stage, only_stage=only_stage, on_stage=on_stage,
+    ).run()
+
+    ran = [n for n, st in runner.status.items() if st == 'ran']
+    print(f">> {project_id}: ran {len(ran)}/{len(runner.status)} stages ({', '.join(ran) or 'none'})")
+    if only_stage and only_stage != 'save':
+        return f"{project_id}:{only_stage}"
+    return runner.outputs('save')['output_path']
 
 
 def main():
@@ -313,25 +489,48 @@ def main():
     ap.add_argument('--lemmatize', action='store_true', 
                     help='Abilita lemmatizzazione per migliorare keywords (richiede spaCy)')
     ap.add_argument('--test-apis', action='store_true')
+    stage_args = ap.add_mutually_exclusive_group()
+    stage_args.add_argument('--from-stage', choices=STAGE_NAMES,
+                            help='Riesegue questo stadio e tutti quelli a valle, ignorando i checkpoint')
+    stage_args.add_argument('--only-stage', choices=STAGE_NAMES,
+                            help='Esegue solo questo stadio usando i checkpoint degli stadi a monte')
+    ap.add_argument('--parallel', type=int, default=None,
+                    help='Progetti elaborati in parallelo (default: min(4, n. progetti); 1 = sequenziale)')
+    ap.add_argument('--cpu-workers', type=int, default=int(os.getenv("PIPELINE_CPU_WORKERS", "1")),
+                    help='Stadi CPU-bound (sentiment, clustering, ...) concorrenti fra tutti i progetti')
+    ap.add_argument('--profile-report', type=str, default=os.getenv("PIPELINE_PROFILE_REPORT"),
+                    help='Scrive un report JSON con metriche per stadio/funzione (tempi, RSS, API, cache)')
+    ap.add_argument('--cprofile', type=str, default=None, metavar='DIR',
+                    help='Salva un dump cProfile per progetto in DIR/<project_id>.prof (forza --parallel 1)')
+    ap.add_argument('--api-concurrency', type=int, default=int(os.getenv("PIPELINE_API_CONCURRENCY", "2")),
+                    help='Stadi di rete (embeddings, LLM) concorrenti fra tutti i progetti')
     args = ap.parse_args()
 
     if args.test_apis:
         print("Testing Voyage ..."); test_voyage_connection()
         print("Testing Anthropic ..."); test_anthropic_connection(); return
 
-    outputs = []
+    configure_limits(cpu_workers=args.cpu_workers, api_concurrency=args.api_concurrency)
+
+    # Ogni progetto diventa un task indipendente (caricamento incluso)
+    def _task(project_id, loader, path, project_name, source_name) -> ProjectTask:
+        def run() -> str:
+            with profiling.run_scope(project_id), profiling.cprofile_scope(args.cprofile, project_id):
+                with profiling.stage_scope("load") as m:
+                    with stage_slot("cpu"):
+                        df = loader(_resolve_input_path(path))
+                    m.rows = len(df)
+                return process_dataset(df, project_id, project_name, source_name, args.out, args.max_reviews,
+                                       args.lemmatize, from_stage=args.from_stage, only_stage=args.only_stage)
+        return ProjectTask(project_id=project_id, run=run)
+
+    tasks: list[ProjectTask] = []
     if args.airbnb:
-        p = _resolve_input_path(args.airbnb)
-        df = load_airbnb_reviews(p)
-        outputs.append(process_dataset(df, "airbnb", "Airbnb Roma", "InsideAirbnb", args.out, args.max_reviews, args.lemmatize))
+        tasks.append(_task("airbnb", load_airbnb_reviews, args.airbnb, "Airbnb Roma", "InsideAirbnb"))
     if args.mobile:
-        p = _resolve_input_path(args.mobile)
-        df = load_mendeley_mobile(p)
-        outputs.append(process_dataset(df, "mobile", "BCA Mobile (Google Play)", "Mendeley", args.out, args.max_reviews, args.lemmatize))
+        tasks.append(_task("mobile", load_mendeley_mobile, args.mobile, "BCA Mobile (Google Play)", "Mendeley"))
     if args.ecommerce:
-        p = _resolve_input_path(args.ecommerce)
-        df = load_women_ecommerce(p)
-        outputs.append(process_dataset(df, "ecommerce", "Women's E-Comm", "Kaggle", args.out, args.max_reviews, args.lemmatize))
+        tasks.append(_task("ecommerce", load_women_ecommerce, args.ecommerce, "Women's E-Comm", "Kaggle"))
 
     # --- Generic datasets ---
     if args.generic:
@@ -347,15 +546,30 @@ def main():
                 .replace(" ", "-")
                 .replace("_", "-")
             )
-            p = _resolve_input_path(path)
-            df = load_generic_reviews(p)
-            outputs.append(
-                process_dataset(df, project_id, project_name, source_name, args.out, args.max_reviews, args.lemmatize)
-            )
+            tasks.append(_task(project_id, load_generic_reviews, path, project_name, source_name))
+
+    parallel = args.parallel if args.parallel is not None else min(4, len(tasks))
+    if args.cprofile:
+        # cProfile misura un solo thread alla volta in modo affidabile
+        parallel = 1
+    results = run_projects(tasks, max_parallel=parallel)
+
+    if args.profile_report:
+        path = profiling.write_report(args.profile_report, extra={
+            "args": vars(args),
+            "results": [{"project_id": r.project_id, "ok": r.ok, "elapsed_s": round(r.elapsed_s, 3), "error": r.error}
+                        for r in results],
+        })
+        print(f"Profile report: {path}")
 
     print("\nDone. Outputs:")
-    for o in outputs:
-        print(" -", o)
+    for r in results:
+        if r.ok:
+            print(f" - {r.output} ({r.elapsed_s:.1f}s)")
+        else:
+            print(f" - FAILED {r.project_id}: {r.error}")
+    if any(not r.ok for r in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+"""
+Scheduler multi-progetto per run_demo.py.
+- Ogni progetto gira in un proprio thread: un errore fallisce solo quel progetto.
+- Limiti globali condivisi fra progetti:
+    slot "cpu" → sentiment, keyword preprocessing, clustering, assegnazione, salvataggio
+    slot "api" → embeddings Voyage, sommari e personas Claude
+  così gli stadi di rete di un progetto si sovrappongono agli stadi CPU di un altro.
+- Progetti con lo stesso project_id vengono serializzati (condividono cache e output).
+"""
+from __future__ import annotations
+
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+_LIMITS_LOCK = threading.Lock()
+_SLOTS: Dict[str, threading.BoundedSemaphore] = {
+    "cpu": threading.BoundedSemaphore(1),
+    "api": threading.BoundedSemaphore(2),
+}
+
+
+def configure_limits(cpu_workers: int = 1, api_concurrency: int = 2) -> None:
+    """Imposta i limiti globali (da chiamare prima di avviare i progetti)."""
+    with _LIMITS_LOCK:
+        _SLOTS["cpu"] = threading.BoundedSemaphore(max(1, int(cpu_workers)))
+        _SLOTS["api"] = threading.BoundedSemaphore(max(1, int(api_concurrency)))
+
+
+@contextmanager
+def stage_slot(kind: str):
+    """Occupa uno slot globale del tipo indicato ('cpu' o 'api') per la durata del blocco."""
+    sem = _SLOTS[kind]
+    sem.acquire()
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+@dataclass
+class ProjectTask:
+    project_id: str
+    run: Callable[[], str]   # ritorna il path dell'output principale
+
+
+@dataclass
+class ProjectResult:
+    project_id: str
+    ok: bool
+    output: Optional[str]
+    error: Optional[str]
+    elapsed_s: float
+
+
+def run_projects(tasks: List[ProjectTask], max_parallel: int = 1) -> List[ProjectResult]:
+    """Esegue i progetti in parallelo (max_parallel thread) e ritorna i risultati nell'ordine dei task."""
+    project_locks = {t.project_id: threading.Lock() for t in tasks}
+
+    def _run(task: ProjectTask) -> ProjectResult:
+        t0 = time.perf_counter()
+        with project_locks[task.project_id]:
+            try:
+                out = task.run()
+                return ProjectResult(task.project_id, True, out, None, time.perf_counter() - t0)
+            except Exception as e:
+                traceback.print_exc()
+                print(f"ERROR: project '{task.project_id}' failed: {e}")
+                return ProjectResult(task.project_id, False, None, f"{type(e).__name__}: {e}",
+                                     time.perf_counter() - t0)
+
+    if max_parallel <= 1 or len(tasks) <= 1:
+        return [_run(t) for t in tasks]
+
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="project") as ex:
+        return list(ex.map(_run, tasks))
@@ -0,0 +1,235 @@
+"""
+Esecuzione a stadi della pipeline con checkpoint su disco.
+- Ogni stadio dichiara dipendenze, parametri e versione: la sua chiave è un hash di
+  (nome, versione, parametri, chiavi delle dipendenze), con l'input grezzo come radice.
+- Gli output vengono salvati in ./cache/stages/<project_id>/<stage>.pkl; se la chiave
+  non è cambiata lo stadio viene saltato e gli output caricati solo se servono a valle.
+- from_stage forza lo stadio indicato e tutti i discendenti; only_stage esegue solo
+  quello stadio usando i checkpoint esistenti delle dipendenze.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import profiling
+from scheduler import stage_slot
+
+ROOT = "input"
+
+
+def hash_frame(df: pd.DataFrame, columns: Optional[List[str]] = None) -> str:
+    """Hash di contenuto (righe + nomi colonna) di un DataFrame."""
+    cols = [c for c in (columns or list(df.columns)) if c in df.columns]
+    h = hashlib.sha256(json.dumps(cols).encode("utf-8"))
+    if cols and len(df):
+        h.update(pd.util.hash_pandas_object(df[cols], index=False).values.tobytes())
+    return h.hexdigest()
+
+
+@dataclass
+class StageContext:
+    """Contesto passato alla funzione di uno stadio."""
+    project_id: str
+    stage: str
+    checkpoint: bool = True   # lo stadio può disattivarlo (es. output di fallback da non riusare)
+    rows: Optional[int] = None   # righe elaborate, per il throughput nel report di profiling
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[StageContext, Dict[str, Dict[str, Any]]], Dict[str, Any]]
+    deps: Tuple[str, ...] = ()
+    params: Dict[str, Any] = field(default_factory=dict)
+    kind: Optional[str] = None   # slot globale dello scheduler ('cpu' | 'api'), None = gestito dallo stadio
+    version: str = "1"
+    check: Optional[Callable[[Dict[str, Any]], bool]] = None   # validità di un checkpoint esistente
+
+
+class StageRunner:
+    def __init__(
+        self,
+        project_id: str,
+        stages: List[Stage],
+        root_inputs: Dict[str, Any],
+        root_key: str,
+        cache_dir: str = "./cache/stages",
+        from_stage: Optional[str] = None,
+        only_stage: Optional[str] = None,
+        on_stage: Optional[Callable[[str, str, int, int], None]] = None,
+    ):
+        """on_stage(nome, stato, indice, totale) viene chiamato a inizio/fine di ogni stadio."""
+        self.project_id = project_id
+        self.on_stage = on_stage
+        self.stages = {s.name: s for s in stages}
+        self.order = [s.name for s in stages]
+        self.dir = Path(cache_dir) / project_id
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.from_stage = from_stage
+        self.only_stage = only_stage
+        self.manifest = self._read_manifest()
+        self.status: Dict[str, str] = {}
+        self._keys: Dict[str, str] = {ROOT: root_key}
+        self._outputs: Dict[str, Dict[str, Any]] = {ROOT: root_inputs}
+
+        seen = {ROOT}
+        for s in stages:
+            missing = [d for d in s.deps if d not in seen]
+            if missing:
+                raise ValueError(f"Stage '{s.name}' depends on undefined/later stages: {missing}")
+            seen.add(s.name)
+        for name in (from_stage, only_stage):
+            if name and name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'. Available: {', '.join(self.order)}")
+
+    # ---------------- manifest / checkpoint ----------------
+    def _read_manifest(self) -> Dict[str, Any]:
+        p = self.dir / "manifest.json"
+        if p.exists():
+            try:
+                return json.loads(p.read_text(encoding="utf-8"))
+            except Exception:
+                pass
+        return {}
+
+    def _write_manifest(self) -> None:
+        p = self.dir / "manifest.json"
+        tmp = p.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, p)
+
+    def _ckpt_path(self, name: str) -> Path:
+        return self.dir / f"{name}.pkl"
+
+    def _save_checkpoint(self, name: str, key: str, outputs: Dict[str, Any], elapsed: float) -> None:
+        p = self._ckpt_path(name)
+        tmp = p.with_suffix(".pkl.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, p)
+        self.manifest[name] = {
+            "key": key,
+            "elapsed_s": round(elapsed, 3),
+            "saved_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self._write_manifest()
+
+    def _load(self, name: str) -> Dict[str, Any]:
+        if name not in self._outputs:
+            p = self._ckpt_path(name)
+            if not p.exists():
+                raise RuntimeError(
+                    f"Stage '{name}' of project '{self.project_id}' has no checkpoint; "
+                    f"run the pipeline without --only-stage first"
+                )
+            with open(p, "rb") as f:
+                self._outputs[name] = pickle.load(f)
+        return self._outputs[name]
+
+    # ---------------- chiavi ----------------
+    def _key(self, stage: Stage) -> str:
+        payload = {
+            "stage": stage.name,
+            "version": stage.version,
+            "params": stage.params,
+            "deps": {d: self._keys[d] for d in stage.deps},
+        }
+        raw = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _descendants(self, name: str) -> set:
+        out = {name}
+        for n in self.order:
+            if any(d in out for d in self.stages[n].deps):
+                out.add(n)
+        return out
+
+    def _is_fresh(self, stage: Stage, key: str) -> bool:
+        entry = self.manifest.get(stage.name)
+        if not entry or entry.get("key") != key or not self._ckpt_path(stage.name).exists():
+            return False
+        if stage.check is not None:
+            try:
+                return bool(stage.check(self._load(stage.name)))
+            except Exception:
+                return False
+        return True
+
+    # ---------------- esecuzione ----------------
+    def run(self) -> "StageRunner":
+        if self.only_stage:
+            # le dipendenze si prendono dai checkpoint esistenti, qualunque sia la loro chiave
+            for name in self.order:
+                if name == self.only_stage:
+                    break
+                entry = self.manifest.get(name)
+                if entry:
+                    self._keys[name] = entry["key"]
+            targets = [self.only_stage]
+            forced = {self.only_stage}
+        else:
+            targets = self.order
+            forced = self._descendants(self.from_stage) if self.from_stage else set()
+
+        for i, name in enumerate(targets):
+            stage = self.stages[name]
+            for d in stage.deps:
+                if d not in self._keys:
+                    raise RuntimeError(
+                        f"Stage '{name}' needs '{d}' but no checkpoint exists for project '{self.project_id}'"
+                    )
+            key = self._key(stage)
+            if name not in forced and self._is_fresh(stage, key):
+                self._keys[name] = key
+                self.status[name] = "cached"
+                self._notify(name, "cached", i, len(targets))
+                profiling.stage_cached(name)
+                profiling.incr("cache.stages.hits")
+                print(f">> Stage {name}: unchanged, using checkpoint ({key[:10]})")
+                continue
+
+            print(f">> Stage {name}: running ({key[:10]})")
+            self._notify(name, "running", i, len(targets))
+            inputs = {d: self._load(d) for d in stage.deps}
+            ctx = StageContext(project_id=self.project_id, stage=name)
+            profiling.incr("cache.stages.misses")
+            t0 = time.perf_counter()
+            with profiling.stage_scope(name) as metrics:
+                if stage.kind:
+                    with stage_slot(stage.kind):
+                        outputs = stage.fn(ctx, inputs)
+                else:
+                    outputs = stage.fn(ctx, inputs)
+                metrics.rows = ctx.rows
+            elapsed = time.perf_counter() - t0
+
+            self._outputs[name] = outputs
+            if ctx.checkpoint:
+                self._keys[name] = key
+                self._save_checkpoint(name, key, outputs, elapsed)
+            else:
+                # output non riutilizzabile: il prossimo run deve rieseguire lo stadio, e una
+                # chiave volatile impedisce ai discendenti di riusare checkpoint costruiti su questo output
+                self._keys[name] = hashlib.sha256(f"{key}:{time.time_ns()}".encode("utf-8")).hexdigest()
+                self.manifest.pop(name, None)
+                self._write_manifest()
+            self.status[name] = "ran"
+            self._notify(name, "ran", i, len(targets))
+        return self
+
+    def _notify(self, name: str, status: str, index: int, total: int) -> None:
+        if self.on_stage is not None:
+            self.on_stage(name, status, index, total)
+
+    def outputs(self, name: str) -> Dict[str, Any]:
+        return self._load(name)
@@ -2,10 +2,10 @@
 Cluster summarization using Anthropic Claude with JSON validation.
 - Accetta alias (es. 'claude-4-sonnet') e risolve l'id completo via Models API.
 - Mostra progress bar sui cluster elaborati.
+- Risposte in streaming con validazione JSON incrementale (vedi llm_stream.py).
 """
 from __future__ import annotations
 
-import json
 import os
 import time
 from typing import List, Dict, Optional
@@ -15,6 +15,9 @@ from dotenv import load_dotenv, find_dotenv
 from jsonschema import validate, ValidationError
 from tqdm.auto import tqdm
 
+from llm_stream import stream_json
+from profiling import profiled
+
 # -------- Env loader --------
 def _load_envs():
     for fname in (".env.local", ".env"):
@@ -27,6 +30,8 @@ def _load_envs():
 _load_envs()
 
 DEFAULT_ALIAS = os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku")
+# tentativi in streaming per cluster (il secondo riparte dal prefisso JSON valido)
+SUMMARY_MAX_ATTEMPTS = int(os.getenv("SUMMARY_MAX_ATTEMPTS", "2"))
 
 # -------- Model resolution --------
 def _normalize_alias(alias: str) -> str:
@@ -86,19 +91,6 @@ CLUSTER_SCHEMA = {
     "required": ["label", "summary", "strengths", "weaknesses"],
 }
 
-def _strict_json_extract(text: str):
-    try:
-        return json.loads(text)
-    except Exception:
-        pass
-    start = text.find("{"); end = text.rfind("}") + 1
-    if start >= 0 and end > start:
-        try:
-            return json.loads(text[start:end])
-        except Exception:
-            return None
-    return None
-
 def generate_placeholder_summary(cluster: Dict) -> Dict:
     label = cluster.get("label") or "Key Theme"
     keywords = ", ".join(cluster.get("keywords", [])[:5])
@@ -108,6 +100,7 @@ def generate_placeholder_summary(cluster: Dict) -> Dict:
     cluster["weaknesses"] = cluster.get("weaknesses", [])[:3]
     return cluster
 
+@profiled("_summarize_one")
 def _summarize_one(client: Anthropic, model_id: str, cluster: Dict, sample_quotes: List[str]) -> Dict:
     context = f"""
 Cluster Statistics:
@@ -129,49 +122,32 @@ Sample Reviews ({len(sample_quotes)}):
         "{\"label\":\"...\",\"summary\":\"...\",\"strengths\":[\"...\"],\"weaknesses\":[\"...\"]}"
     )
 
-    for attempt in range(2):
-        try:
-            resp = client.messages.create(
-                model=model_id,
-                max_tokens=400,
-                temperature=0.3,
-                system=sys_msg,
-                messages=[{"role": "user", "content": user_msg}],
-            )
-        except APIStatusError as e:
-            if e.status_code == 404:
-                return generate_placeholder_summary(cluster)
-            time.sleep(0.5)
-            if attempt == 0:
-                continue
-            return generate_placeholder_summary(cluster)
-        except Exception:
-            time.sleep(0.5)
-            if attempt == 0:
-                continue
-            return generate_placeholder_summary(cluster)
-
-        text = resp.content[0].text if resp and resp.content else ""
-        result = _strict_json_extract(text)
-        if not result:
-            if attempt == 0:
-                time.sleep(0.3)
-                continue
-            return generate_placeholder_summary(cluster)
-        try:
-            validate(result, CLUSTER_SCHEMA)
-            cluster["label"] = result.get("label", cluster.get("label", ""))
-            cluster["summary"] = result.get("summary", "")
-            cluster["strengths"] = list(result.get("strengths", []))[:3]
-            cluster["weaknesses"] = list(result.get("weaknesses", []))[:3]
-            return cluster
-        except ValidationError:
-            if attempt == 0:
-                time.sleep(0.3)
-                continue
-            return generate_placeholder_summary(cluster)
-
-    return generate_placeholder_summary(cluster)
+    # un solo giro: i tentativi (ripresi dal prefisso valido) li fa stream_json; gli errori
+    # di rete/5xx li ritenta già il client Anthropic (max_retries)
+    try:
+        result = stream_json(
+            client,
+            model=model_id,
+            system=sys_msg,
+            user=user_msg,
+            max_tokens=400,
+            temperature=0.3,
+            label="summary",
+            max_attempts=SUMMARY_MAX_ATTEMPTS,
+        )
+    except Exception:
+        return generate_placeholder_summary(cluster)
+    if not result:
+        return generate_placeholder_summary(cluster)
+    try:
+        validate(result, CLUSTER_SCHEMA)
+    except ValidationError:
+        return generate_placeholder_summary(cluster)
+    cluster["label"] = result.get("label", cluster.get("label", ""))
+    cluster["summary"] = result.get("summary", "")
+    cluster["strengths"] = list(result.get("strengths", []))[:3]
+    cluster["weaknesses"] = list(result.get("weaknesses", []))[:3]
+    return cluster
 
 def summarize_clusters(
     clusters: List[Dict],
@@ -0,0 +1,7 @@
+"""I moduli della pipeline si importano in modo piatto (si esegue da pipeline/)."""
+import sys
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parents[1]
+if str(PIPELINE_DIR) not in sys.path:
+    sys.path.insert(0, str(PIPELINE_DIR))
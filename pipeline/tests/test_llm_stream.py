@@ -0,0 +1,152 @@
+"""Validazione JSON incrementale e streaming con ripresa dal prefisso (llm_stream.py)."""
+from types import SimpleNamespace
+
+import llm_stream
+import pytest
+import summarize
+from llm_stream import JSONStreamValidator, stream_json
+
+
+class FakeStream:
+    def __init__(self, chunks, consumed):
+        self._chunks = chunks
+        self._consumed = consumed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        usage = SimpleNamespace(input_tokens=10)
+        yield SimpleNamespace(type="message_start", message=SimpleNamespace(usage=usage))
+        for chunk in self._chunks:
+            self._consumed.append(chunk)
+            yield SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(type="text_delta", text=chunk))
+        yield SimpleNamespace(type="message_delta", usage=SimpleNamespace(output_tokens=len(self._chunks)))
+
+
+class FakeClient:
+    """Una risposta (lista di chunk) per tentativo; registra i prefill ricevuti."""
+
+    def __init__(self, *responses):
+        self._responses = list(responses)
+        self.prefills = []
+        self.consumed = []
+        self.messages = self
+
+    def stream(self, **kwargs):
+        self.prefills.append(kwargs["messages"][-1]["content"])
+        return FakeStream(self._responses.pop(0), self.consumed)
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    llm_stream.reset_call_stats()
+    yield
+    llm_stream.reset_call_stats()
+
+
+def call(client, **kw):
+    return stream_json(client, model="m", system="s", user="u", max_tokens=50, **kw)
+
+
+@pytest.mark.parametrize("text,state", [
+    ('{"a": [1, 2, {"b": "x}"}], "c": true}', "done"),
+    ('{"a": "quote \\" inside"}', "done"),
+    ('{"a": [1, 2', "ok"),
+    ("Sure! Here is the JSON", "malformed"),
+    ('{"a": 1]}', "malformed"),
+    ('{"a": 1} trailing', "done"),
+    ('{"a": **bold**}', "malformed"),
+])
+def test_validator_states(text, state):
+    assert JSONStreamValidator().feed(text) == state
+
+
+def test_validator_chunked_and_valid_prefix():
+    v = JSONStreamValidator("{")
+    for chunk in ('"label": "Pu', 'lizia", "x": [1', ", 2]", "} ignored"):
+        v.feed(chunk)
+    assert v.state == "done"
+    assert v.valid_text == '{"label": "Pulizia", "x": [1, 2]}'
+
+    bad = JSONStreamValidator("{")
+    bad.feed('"a": 1, ')
+    bad.feed("# Heading")
+    assert bad.state == "malformed" and bad.valid_text == '{"a": 1, '
+    assert bad.feed("}") == "malformed"  # dopo l'errore non accetta altro
+
+
+def test_stream_json_first_attempt():
+    client = FakeClient(['"label": "A"', ', "n": 2}'])
+    assert call(client) == {"label": "A", "n": 2}
+    assert client.prefills == ["{"]
+    stats = llm_stream.call_stats()
+    assert [s["outcome"] for s in stats] == ["ok"]
+    assert stats[0]["input_tokens"] == 10 and stats[0]["ttft_s"] is not None
+
+
+def test_stream_json_stops_early_and_resumes_from_prefix():
+    client = FakeClient(['"label": "A", ', "Oops, prose", "never read"], ['"n": 2}'])
+    assert call(client) == {"label": "A", "n": 2}
+    assert "never read" not in client.consumed  # stream chiuso al primo carattere invalido
+    assert client.prefills == ["{", '{"label": "A",']
+    assert [s["outcome"] for s in llm_stream.call_stats()] == ["malformed", "ok"]
+
+
+def test_stream_json_truncated_and_invalid_json():
+    client = FakeClient(['"label": "A'], ['", "n": 2}'])
+    assert call(client) == {"label": "A", "n": 2}
+    assert [s["outcome"] for s in llm_stream.call_stats()] == ["incomplete", "ok"]
+
+    # struttura bilanciata ma token invalidi: il tentativo dopo riparte da "{"
+    client = FakeClient(['"n": tru}'], ['"n": 1}'])
+    assert call(client) == {"n": 1}
+    assert client.prefills == ["{", "{"]
+
+
+def test_stream_json_gives_up_after_max_attempts():
+    client = FakeClient(["nope"], ["nope"], ["nope"])
+    assert call(client, max_attempts=2) is None
+    assert len(client.prefills) == 2
+
+
+def test_stream_json_records_and_raises_api_errors():
+    class Broken:
+        messages = None
+
+        def __init__(self):
+            self.messages = self
+
+        def stream(self, **kwargs):
+            raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        call(Broken())
+    assert [s["outcome"] for s in llm_stream.call_stats()] == ["error"]
+
+
+CLUSTER = {"id": "c1", "label": "", "size": 10, "share": 0.5, "sentiment": 0.2, "keywords": ["pulizia", "letto"]}
+
+
+def test_summarize_one_single_round_on_schema_failure():
+    # JSON valido ma senza i campi richiesti: placeholder, senza altre chiamate
+    client = FakeClient(['"label": "A"}'], ['"label": "B"}'])
+    out = summarize._summarize_one(client, "m", dict(CLUSTER), ["ok"])
+    assert len(client.prefills) == 1
+    assert out["summary"].startswith("Tema caratterizzato da: pulizia")
+
+
+def test_summarize_one_at_most_max_attempts_calls(monkeypatch):
+    monkeypatch.setattr(summarize, "SUMMARY_MAX_ATTEMPTS", 2)
+    client = FakeClient(["x"], ["x"], ["x"], ["x"])
+    summarize._summarize_one(client, "m", dict(CLUSTER), ["ok"])
+    assert len(client.prefills) == 2
+
+
+def test_summarize_one_success():
+    body = '"label": "Pulizia", "summary": "ok", "strengths": ["a", "b", "c", "d"], "weaknesses": []}'
+    out = summarize._summarize_one(FakeClient([body]), "m", dict(CLUSTER), ["ok"])
+    assert out["label"] == "Pulizia" and out["strengths"] == ["a", "b", "c"]
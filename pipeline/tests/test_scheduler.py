@@ -0,0 +1,63 @@
+"""Scheduler multi-progetto: isolamento degli errori, ordine dei risultati e limiti globali."""
+import threading
+import time
+
+import scheduler
+from scheduler import ProjectTask, configure_limits, run_projects, stage_slot
+
+
+def boom() -> str:
+    raise ValueError("bad csv")
+
+
+def test_failure_is_isolated():
+    for parallel in (1, 3):
+        results = run_projects([
+            ProjectTask("a", lambda: "out/a.json"),
+            ProjectTask("b", boom),
+            ProjectTask("c", lambda: "out/c.json"),
+        ], max_parallel=parallel)
+        assert [r.project_id for r in results] == ["a", "b", "c"]
+        assert [r.ok for r in results] == [True, False, True]
+        assert results[1].error == "ValueError: bad csv" and results[1].output is None
+        assert results[2].output == "out/c.json"
+
+
+def test_same_project_id_is_serialized():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work() -> str:
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return "ok"
+
+    results = run_projects([ProjectTask("same", work) for _ in range(4)], max_parallel=4)
+    assert all(r.ok for r in results)
+    assert peak[0] == 1
+
+
+def test_stage_slots_bound_concurrency(monkeypatch):
+    monkeypatch.setattr(scheduler, "_SLOTS", dict(scheduler._SLOTS))
+    configure_limits(cpu_workers=1, api_concurrency=2)
+    active = {"cpu": 0, "api": 0}
+    peak = {"cpu": 0, "api": 0}
+    lock = threading.Lock()
+
+    def work(kind: str) -> str:
+        with stage_slot(kind):
+            with lock:
+                active[kind] += 1
+                peak[kind] = max(peak[kind], active[kind])
+            time.sleep(0.02)
+            with lock:
+                active[kind] -= 1
+        return kind
+
+    tasks = [ProjectTask(f"p{i}", lambda k=kind: work(k)) for i, kind in enumerate(["cpu", "api"] * 4)]
+    assert all(r.ok for r in run_projects(tasks, max_parallel=8))
+    assert peak == {"cpu": 1, "api": 2}
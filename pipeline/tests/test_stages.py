@@ -0,0 +1,103 @@
+"""StageRunner: skip degli stadi invariati, --from-stage, --only-stage e checkpoint."""
+import pandas as pd
+import pytest
+from stages import ROOT, Stage, StageRunner, hash_frame
+
+
+def make_stages(calls, params=None, check=None):
+    def load(ctx, inp):
+        calls.append("load")
+        return {"rows": list(inp[ROOT]["rows"])}
+
+    def double(ctx, inp):
+        calls.append("double")
+        return {"rows": [r * (params or {}).get("factor", 2) for r in inp["load"]["rows"]]}
+
+    def total(ctx, inp):
+        calls.append("total")
+        return {"total": sum(inp["double"]["rows"])}
+
+    return [
+        Stage("load", load, deps=(ROOT,)),
+        Stage("double", double, deps=("load",), params=dict(params or {}), check=check),
+        Stage("total", total, deps=("double",)),
+    ]
+
+
+def run(tmp_path, calls, rows=(1, 2, 3), **kw):
+    stage_kw = {k: kw.pop(k) for k in ("params", "check") if k in kw}
+    return StageRunner("p", make_stages(calls, **stage_kw), {"rows": rows}, root_key=str(rows),
+                       cache_dir=str(tmp_path), **kw).run()
+
+
+def test_second_run_skips_unchanged_stages(tmp_path):
+    calls = []
+    first = run(tmp_path, calls)
+    assert first.outputs("total") == {"total": 12}
+    assert first.status == {"load": "ran", "double": "ran", "total": "ran"}
+
+    calls.clear()
+    second = run(tmp_path, calls)
+    assert calls == []
+    assert set(second.status.values()) == {"cached"}
+    assert second.outputs("total") == {"total": 12}  # caricato dal checkpoint
+
+
+def test_changed_input_or_params_rerun_downstream(tmp_path):
+    calls = []
+    run(tmp_path, calls)
+    calls.clear()
+    run(tmp_path, calls, rows=(1, 2, 4))
+    assert calls == ["load", "double", "total"]
+
+    calls.clear()
+    out = run(tmp_path, calls, rows=(1, 2, 4), params={"factor": 3})
+    assert calls == ["double", "total"]
+    assert out.status["load"] == "cached" and out.outputs("total") == {"total": 21}
+
+
+def test_from_stage_forces_stage_and_descendants(tmp_path):
+    calls = []
+    run(tmp_path, calls)
+    calls.clear()
+    out = run(tmp_path, calls, from_stage="double")
+    assert calls == ["double", "total"]
+    assert out.status == {"load": "cached", "double": "ran", "total": "ran"}
+
+
+def test_only_stage_uses_existing_checkpoints(tmp_path):
+    calls = []
+    run(tmp_path, calls)
+    calls.clear()
+    # anche con input diversi si riusano i checkpoint delle dipendenze
+    out = run(tmp_path, calls, rows=(9, 9, 9), only_stage="total")
+    assert calls == ["total"]
+    assert out.status == {"total": "ran"} and out.outputs("total") == {"total": 12}
+
+
+def test_only_stage_without_checkpoints_fails(tmp_path):
+    with pytest.raises(RuntimeError, match="no checkpoint"):
+        run(tmp_path, [], only_stage="total")
+
+
+def test_failed_check_reruns_stage(tmp_path):
+    calls = []
+    run(tmp_path, calls)
+    calls.clear()
+    run(tmp_path, calls, check=lambda out: False)
+    assert calls == ["double"]  # total resta valido: stessa chiave di double
+
+
+def test_unknown_or_misordered_stage(tmp_path):
+    with pytest.raises(ValueError, match="Unknown stage"):
+        run(tmp_path, [], from_stage="nope")
+    bad = [Stage("b", lambda c, i: {}, deps=("a",)), Stage("a", lambda c, i: {}, deps=(ROOT,))]
+    with pytest.raises(ValueError, match="undefined/later"):
+        StageRunner("p", bad, {}, root_key="k", cache_dir=str(tmp_path))
+
+
+def test_hash_frame_is_content_based():
+    a = pd.DataFrame({"text": ["x", "y"], "n": [1, 2]})
+    assert hash_frame(a) == hash_frame(a.copy())
+    assert hash_frame(a) != hash_frame(a.assign(n=[1, 3]))
+    assert hash_frame(a, ["text"]) == hash_frame(a.assign(n=[1, 3]), ["text"])
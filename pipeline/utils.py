@@ -9,16 +9,18 @@ import json
 import html as _html
 import unicodedata
 import hashlib
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
 from langdetect import detect, LangDetectException
-from transformers import pipeline
 import warnings
 warnings.filterwarnings('ignore')
 
+from profiling import profiled
+
 # ---------- Anthropic model resolution (per meta) ----------
 def _resolve_anthropic_model_for_meta() -> str:
     alias = os.getenv("ANTHROPIC_MODEL", "").strip()
@@ -171,14 +173,19 @@ def preprocess_for_keywords(text: str, lang: str = 'en', use_lemmatization: bool
 # Sentiment pipeline (lazy) + cache resume
 # -----------------------------
 _SENT_PIPE = None
+_SENT_PIPE_LOCK = threading.Lock()  # più progetti in parallelo condividono lo stesso modello
 def init_sentiment_pipeline():
     global _SENT_PIPE
     if _SENT_PIPE is None:
-        model = os.getenv("SENTIMENT_MODEL", "cardiffnlp/twitter-xlm-roberta-base-sentiment")
-        _SENT_PIPE = pipeline("sentiment-analysis", model=model)
-        print("Device set to use", _SENT_PIPE.device)
+        with _SENT_PIPE_LOCK:
+            if _SENT_PIPE is None:
+                from transformers import pipeline  # import pesante: solo quando serve davvero
+                model = os.getenv("SENTIMENT_MODEL", "cardiffnlp/twitter-xlm-roberta-base-sentiment")
+                _SENT_PIPE = pipeline("sentiment-analysis", model=model)
+                print("Device set to use", _SENT_PIPE.device)
     return _SENT_PIPE
 
+@profiled("sentiment_score")
 def sentiment_score(text: str) -> float:
     try:
         if not text or not str(text).strip():